@@ -0,0 +1,61 @@
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+VERSION_KEY = 'catalog:version:{tag}'
+DATA_KEY = 'catalog:data:{tag}:v{version}:{query}'
+
+
+def get_tag_version(tag):
+    """
+    Current version of a cache tag. Cached entries embed the version in
+    their key, so bumping it invalidates all of them at once.
+    """
+    key = VERSION_KEY.format(tag=tag)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, timeout=None)
+        version = cache.get(key, 1)
+    return version
+
+
+def invalidate_tags(*tags):
+    for tag in tags:
+        key = VERSION_KEY.format(tag=tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Unknown key (never read or evicted): any new value invalidates old entries
+            cache.set(key, 2, timeout=None)
+
+
+class CachedListMixin:
+    """
+    Serve a list endpoint from the cache, keyed by a versioned tag.
+
+    Responses carry an ETag built from the tag version and query string, so
+    clients sending If-None-Match get a 304 without touching the database.
+    Call invalidate_tags(cache_tag) when the underlying data changes.
+    """
+    cache_tag = None
+
+    def list(self, request, *args, **kwargs):
+        version = get_tag_version(self.cache_tag)
+        query = hashlib.md5(request.META.get('QUERY_STRING', '').encode()).hexdigest()
+        etag = f'W/"{self.cache_tag}-{version}-{query}"'
+
+        if etag in request.headers.get('If-None-Match', ''):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        key = DATA_KEY.format(tag=self.cache_tag, version=version, query=query)
+        data = cache.get(key)
+        if data is None:
+            response = super().list(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            cache.set(key, data, timeout=settings.CATALOG_CACHE_TIMEOUT)
+
+        return Response(data, headers={'ETag': etag})
@@ -0,0 +1,31 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+class StandardCursorPagination(CursorPagination):
+    """
+    Keyset pagination over a stable (timestamp, id) ordering.
+
+    Every page is a single indexed range scan, so deep pages cost the same
+    as the first one. Views can override the ordering by setting a
+    `cursor_ordering` attribute.
+    """
+    page_size = settings.CURSOR_PAGINATION_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.CURSOR_PAGINATION_MAX_PAGE_SIZE
+    ordering = ('-created_at', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'cursor_ordering', None)
+        if ordering:
+            return (ordering,) if isinstance(ordering, str) else tuple(ordering)
+        return super().get_ordering(request, queryset, view)
+
+
+class RankedResultsPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination for relevance-ranked results (e.g. search),
+    where there is no stable column to build a cursor on.
+    """
+    default_limit = settings.CURSOR_PAGINATION_PAGE_SIZE
+    max_limit = settings.CURSOR_PAGINATION_MAX_PAGE_SIZE
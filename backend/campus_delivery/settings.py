@@ -3,6 +3,7 @@ import os
 from pathlib import Path
 from dotenv import load_dotenv
 from datetime import timedelta
+from corsheaders.defaults import default_headers
 
 
 # Load environment variables
@@ -28,6 +29,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     # Third-party apps
     'rest_framework',
@@ -157,6 +159,10 @@ REST_FRAMEWORK = {
     ),
 }
 
+# Cursor pagination for list endpoints (see campus_delivery/pagination.py)
+CURSOR_PAGINATION_PAGE_SIZE = int(os.getenv('CURSOR_PAGINATION_PAGE_SIZE', 20))
+CURSOR_PAGINATION_MAX_PAGE_SIZE = int(os.getenv('CURSOR_PAGINATION_MAX_PAGE_SIZE', 100))
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=120),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
@@ -170,10 +176,113 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
 }
 
+# =========================
+# Cache
+# =========================
+# Local memory by default; set REDIS_URL to share the cache between workers
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'campus-delivery',
+        }
+    }
+
+# Catalog reference data (categories, brands, ...) changes rarely; entries are
+# invalidated by products.signals, so this is only an upper bound
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', 60 * 60 * 24))
+
+# Coupons are cached by code and invalidated by orders.signals on every change
+COUPON_CACHE_TIMEOUT = int(os.getenv('COUPON_CACHE_TIMEOUT', 60 * 60))
+
+# =========================
+# Carts
+# =========================
+# 'database' stores carts in Cart/CartItem on every change. 'redis' keeps active
+# carts in Redis and writes them back on checkout or once idle (see orders/carts.py;
+# run `python manage.py flush_carts` periodically). Without CART_REDIS_URL the
+# redis backend uses an in-process stand-in, which is only suitable for a single worker.
+CART_BACKEND = os.getenv('CART_BACKEND', 'database')
+CART_REDIS_URL = os.getenv('CART_REDIS_URL', REDIS_URL)
+CART_IDLE_FLUSH_SECONDS = int(os.getenv('CART_IDLE_FLUSH_SECONDS', 5 * 60))
+CART_REDIS_TTL = int(os.getenv('CART_REDIS_TTL', 60 * 60 * 24 * 14))
+
+# Seconds stock held at checkout (POST /api/cart/reserve/) stays withdrawn from sale
+# before `python manage.py release_stock_reservations` returns it
+STOCK_RESERVATION_TTL = int(os.getenv('STOCK_RESERVATION_TTL', 15 * 60))
+
+# Cart quotes (GET /api/cart/) are cached per cart contents, coupon and delivery
+# point; product and coupon changes invalidate them through orders.signals
+CART_QUOTE_CACHE_TIMEOUT = int(os.getenv('CART_QUOTE_CACHE_TIMEOUT', 15 * 60))
+# Delivery fees depend only on the delivery point (routed by OpenRouteService)
+DELIVERY_FEE_CACHE_TIMEOUT = int(os.getenv('DELIVERY_FEE_CACHE_TIMEOUT', 60 * 60 * 24))
+
+# =========================
+# Idempotency keys
+# =========================
+# POST /api/orders/ with an Idempotency-Key header replays the first response for
+# IDEMPOTENCY_KEY_TTL seconds (`python manage.py purge_idempotency_keys` deletes
+# older keys). A retry arriving while the first request runs gets 409 until the
+# request finishes or IDEMPOTENCY_LOCK_SECONDS pass.
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', 60 * 60 * 24))
+IDEMPOTENCY_LOCK_SECONDS = int(os.getenv('IDEMPOTENCY_LOCK_SECONDS', 60))
+
+# =========================
+# Outbox
+# =========================
+# Deferred work such as order alerts (see notifications/outbox.py), run by
+# `python manage.py process_outbox --loop`. Failed messages are retried after
+# OUTBOX_RETRY_BASE_SECONDS, doubling up to OUTBOX_RETRY_MAX_SECONDS, and
+# marked failed after OUTBOX_MAX_ATTEMPTS attempts. A message a worker claimed
+# is offered to other workers again after OUTBOX_LEASE_SECONDS.
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8))
+OUTBOX_RETRY_BASE_SECONDS = int(os.getenv('OUTBOX_RETRY_BASE_SECONDS', 30))
+OUTBOX_RETRY_MAX_SECONDS = int(os.getenv('OUTBOX_RETRY_MAX_SECONDS', 60 * 60))
+OUTBOX_LEASE_SECONDS = int(os.getenv('OUTBOX_LEASE_SECONDS', 5 * 60))
+
+# =========================
+# Rider alerts
+# =========================
+# A new order is offered to the RIDER_BROADCAST_SIZE best online riders (least
+# busy, then nearest) within the first radius of RIDER_BROADCAST_RINGS_KM. Every
+# RIDER_BROADCAST_RING_SECONDS it stays unaccepted, the next radius is tried
+# with riders not alerted yet. Riders with RIDER_MAX_ACTIVE_ORDERS orders in
+# hand are left out. Past the last radius, or when no rider with a known
+# location is in reach, online riders anywhere (or, with none online, any
+# active delivery person) are alerted instead, until the order is accepted or
+# RIDER_BROADCAST_MAX_SECONDS after it was placed.
+RIDER_BROADCAST_SIZE = int(os.getenv('RIDER_BROADCAST_SIZE', 5))
+RIDER_BROADCAST_RINGS_KM = [float(km) for km in os.getenv('RIDER_BROADCAST_RINGS_KM', '2,5,10,25').split(',')]
+RIDER_BROADCAST_RING_SECONDS = int(os.getenv('RIDER_BROADCAST_RING_SECONDS', 2 * 60))
+RIDER_MAX_ACTIVE_ORDERS = int(os.getenv('RIDER_MAX_ACTIVE_ORDERS', 5))
+RIDER_BROADCAST_MAX_SECONDS = int(os.getenv('RIDER_BROADCAST_MAX_SECONDS', 30 * 60))
+
+# =========================
+# Order dispatch
+# =========================
+# 'broadcast': new orders are offered to riders as described above, first to
+# accept takes the order. 'assign': `manage.py dispatch_orders --loop` assigns
+# each new order to one rider (delivery/dispatch.py), up to DISPATCH_BATCH_SIZE
+# orders per round; the rider has DISPATCH_OFFER_SECONDS to accept before the
+# order is offered to someone else.
+ORDER_DISPATCH = os.getenv('ORDER_DISPATCH', 'broadcast')
+DISPATCH_BATCH_SIZE = int(os.getenv('DISPATCH_BATCH_SIZE', 100))
+DISPATCH_OFFER_SECONDS = int(os.getenv('DISPATCH_OFFER_SECONDS', 2 * 60))
+
 # =========================
 # Sessions
 # =========================
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+# Set to django.contrib.sessions.backends.cache (with REDIS_URL) to keep anonymous
+# cart sessions out of the database as well
+SESSION_ENGINE = os.getenv('SESSION_ENGINE', 'django.contrib.sessions.backends.db')
 SESSION_COOKIE_NAME = 'sessionid'
 SESSION_COOKIE_SAMESITE = 'Lax'
 SESSION_COOKIE_SECURE = False  # Set to True in production with HTTPS
@@ -196,6 +305,7 @@ CSRF_TRUSTED_ORIGINS = [
 ]
 
 CORS_ALLOW_CREDENTIALS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
     "http://127.0.0.1:5173",
@@ -229,6 +339,14 @@ TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
 TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN')
 TWILIO_PHONE_NUMBER = os.getenv('TWILIO_PHONE_NUMBER')
 TWILIO_WHATSAPP_NUMBER = os.getenv('TWILIO_WHATSAPP_NUMBER')
+# Messages sent in batches (NotificationService.send_*_batch) go out on up to
+# TWILIO_MAX_CONCURRENCY pooled connections, at most TWILIO_RATE_LIMIT per second
+# (0: unlimited). TWILIO_API_BASE_URL points the client at another host, such as
+# the fake server used by `manage.py test_twilio --load`.
+TWILIO_MAX_CONCURRENCY = int(os.getenv('TWILIO_MAX_CONCURRENCY', 8))
+TWILIO_RATE_LIMIT = float(os.getenv('TWILIO_RATE_LIMIT', 10))
+TWILIO_HTTP_TIMEOUT = float(os.getenv('TWILIO_HTTP_TIMEOUT', 10))
+TWILIO_API_BASE_URL = os.getenv('TWILIO_API_BASE_URL')
 
 # M-Pesa
 MPESA_CONSUMER_KEY = os.getenv('MPESA_CONSUMER_KEY')
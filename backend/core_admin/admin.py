@@ -3,6 +3,7 @@ from django.db.models import Count, Sum
 from users.models import User
 from products.models import Product
 from orders.models import Order, OrderItem
+from orders.transitions import bulk_transition
 from payment.models import Payment
 from delivery.models import Delivery
 from notifications.models import Notification
@@ -25,6 +26,24 @@ class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'customer', 'total_price', 'status', 'created_at')
     list_filter = ('status', 'created_at')
     search_fields = ('customer__full_name', 'customer__email')
+    actions = ['mark_accepted', 'mark_delivered', 'mark_cancelled']
+
+    def _transition(self, request, queryset, to_status):
+        # One UPDATE for the whole selection, through the order state machine
+        moved, skipped = bulk_transition(queryset, to_status, actor=request.user, note='admin action')
+        self.message_user(request, f"Moved {len(moved)} orders to {to_status}; skipped {len(skipped)} that cannot be.")
+
+    def mark_accepted(self, request, queryset):
+        self._transition(request, queryset, 'accepted')
+    mark_accepted.short_description = "Mark selected orders as accepted"
+
+    def mark_delivered(self, request, queryset):
+        self._transition(request, queryset, 'delivered')
+    mark_delivered.short_description = "Mark selected orders as delivered"
+
+    def mark_cancelled(self, request, queryset):
+        self._transition(request, queryset, 'cancelled')
+    mark_cancelled.short_description = "Cancel selected orders"
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
@@ -0,0 +1,134 @@
+"""
+Choosing which delivery persons to alert about a new order.
+
+nearby_riders() returns the best riders for a pickup point with one query:
+online riders who want new-order alerts, within both the ring radius and their
+own max_delivery_distance, and carrying fewer than RIDER_MAX_ACTIVE_ORDERS
+orders, ranked by load, then distance. unlocated_riders() is the fallback
+when nobody located is in reach. nearest() returns the k rows of any located
+queryset nearest a point.
+
+Both narrow the rows with within(): only rows whose geohash falls in one of
+the cells covering the search circle are read (indexed prefix scans, see
+delivery/geo.py), and the exact haversine distance is computed by the
+database for those rows alone.
+"""
+from functools import reduce
+from math import cos, radians
+from operator import or_
+from django.conf import settings
+from django.db.models import Count, F, FloatField, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import ASin, Cast, Coalesce, Cos, Power, Radians, Sin, Sqrt
+from orders.models import Order
+from users.models import User
+from . import geo
+from .fees import SHOP_LAT, SHOP_LNG
+from .models import DeliveryPersonProfile
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.045
+
+# Orders a rider is still working on
+ACTIVE_ORDER_STATUSES = ('assigned', 'in_progress', 'on_the_way')
+
+
+def pickup_point(order):
+    """Where riders collect `order`: the shop, the same origin delivery fees are routed from."""
+    return SHOP_LAT, SHOP_LNG
+
+
+def haversine_expression(lat, lng, lat_field='latitude', lng_field='longitude'):
+    """SQL expression for the distance in km between (lat, lng) and a row's coordinates."""
+    row_lat = Radians(Cast(lat_field, FloatField()))
+    row_lng = Radians(Cast(lng_field, FloatField()))
+    lat, lng = Value(radians(lat)), Value(radians(lng))
+    a = Power(Sin((row_lat - lat) / 2), 2) + Cos(lat) * Cos(row_lat) * Power(Sin((row_lng - lng) / 2), 2)
+    return Value(2 * EARTH_RADIUS_KM) * ASin(Sqrt(a))
+
+
+def bounding_box(lat, lng, radius_km):
+    """Latitude and longitude ranges containing every point within radius_km of (lat, lng)."""
+    dlat = radius_km / KM_PER_DEGREE
+    dlng = radius_km / (KM_PER_DEGREE * max(cos(radians(lat)), 0.01))
+    return (lat - dlat, lat + dlat), (lng - dlng, lng + dlng)
+
+
+def within(queryset, lat, lng, radius_km):
+    """
+    Rows of `queryset` (a model with latitude, longitude and geohash) within
+    radius_km of (lat, lng), annotated with distance_km.
+    """
+    lat_range, lng_range = bounding_box(lat, lng, radius_km)
+    cells = reduce(or_, (Q(geohash__startswith=cell) for cell in geo.cells_covering(lat_range, lng_range)))
+    return (
+        queryset.filter(cells, latitude__range=lat_range, longitude__range=lng_range)
+        .annotate(distance_km=haversine_expression(lat, lng))
+        .filter(distance_km__lte=radius_km)
+    )
+
+
+def nearest(queryset, lat, lng, k, max_radius_km=50, start_radius_km=1):
+    """
+    The k rows of `queryset` nearest (lat, lng), no further than max_radius_km,
+    nearest first. Searches within start_radius_km, doubling the radius while
+    fewer than k rows are found.
+    """
+    radius = start_radius_km
+    while True:
+        radius = min(radius, max_radius_km)
+        rows = list(within(queryset, lat, lng, radius).order_by('distance_km', 'pk')[:k])
+        if len(rows) >= k or radius >= max_radius_km:
+            return rows
+        radius *= 2
+
+
+def rider_load():
+    active = (
+        Order.objects.filter(delivery_person=OuterRef('user_id'), status__in=ACTIVE_ORDER_STATUSES)
+        .order_by().values('delivery_person').annotate(count=Count('pk')).values('count')
+    )
+    return Coalesce(Subquery(active, output_field=IntegerField()), 0)
+
+
+def nearby_riders(lat, lng, radius_km, limit, exclude=()):
+    """
+    Up to `limit` riders for a pickup at (lat, lng), within `radius_km`, as
+    dicts of user_id, distance_km and load, best first. Riders in `exclude`
+    (user ids) are skipped.
+    """
+    riders = DeliveryPersonProfile.objects.filter(is_online=True, notify_new_orders=True, user__is_active=True)
+    return list(
+        within(riders.exclude(user_id__in=list(exclude)), lat, lng, radius_km)
+        .annotate(load=rider_load())
+        .filter(
+            distance_km__lte=Cast(F('max_delivery_distance'), FloatField()),
+            load__lt=settings.RIDER_MAX_ACTIVE_ORDERS,
+        )
+        .order_by('load', 'distance_km', 'user_id')
+        .values('user_id', 'distance_km', 'load')[:limit]
+    )
+
+
+def unlocated_riders(limit, exclude=()):
+    """
+    Up to `limit` riders to alert when nobody located is within reach (riders
+    only have coordinates once their location is recorded), as dicts of
+    user_id: online riders who want new-order alerts, least busy first,
+    wherever they are; or, when none is left, any active delivery person.
+    """
+    online = (
+        DeliveryPersonProfile.objects.filter(is_online=True, notify_new_orders=True, user__is_active=True)
+        .exclude(user_id__in=list(exclude))
+        .annotate(load=rider_load())
+        .filter(load__lt=settings.RIDER_MAX_ACTIVE_ORDERS)
+        .order_by('load', 'user_id')
+        .values('user_id')[:limit]
+    )
+    riders = list(online)
+    if riders:
+        return riders
+    return [
+        {'user_id': pk}
+        for pk in User.objects.filter(role='delivery_person', is_active=True)
+        .exclude(pk__in=list(exclude)).order_by('pk').values_list('pk', flat=True)[:limit]
+    ]
@@ -0,0 +1,229 @@
+"""
+Batch order dispatch.
+
+Each round (`python manage.py dispatch_orders`) takes the orders waiting for
+a delivery person (oldest first, up to DISPATCH_BATCH_SIZE) and the riders
+free to take one: online, accepting new orders, within the widest
+RIDER_BROADCAST_RINGS_KM radius of a pickup point, below
+RIDER_MAX_ACTIVE_ORDERS, and not holding an offer already. It scores every
+(order, rider) pair, finds the assignment with the best total score (the
+Hungarian algorithm, one order per rider per round) and writes the
+OrderAssignment rows with one upsert (orders.transitions.offer_assignments,
+which logs re-offers). Each chosen rider is alerted
+through the outbox and has DISPATCH_OFFER_SECONDS to accept; offers left
+unaccepted expire and their orders go back into the next round, away from
+the rider who let it expire.
+
+A pair's score is a weighted sum (WEIGHTS) of terms between 0 and 1:
+closeness to the pickup relative to the rider's max_delivery_distance, spare
+capacity, rating, and vehicle speed. Pairs beyond the rider's
+max_delivery_distance are never matched. The score matrix and the solver use
+NumPy.
+"""
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+import numpy as np
+from notifications import outbox
+from orders.models import Order
+from orders.transitions import expire_assignments, offer_assignments
+from .candidates import EARTH_RADIUS_KM, pickup_point, rider_load, within
+from .models import DeliveryPersonProfile, OrderAssignment
+
+logger = logging.getLogger(__name__)
+
+# Assignments holding an order (and its rider) until accepted or expired
+LIVE_ASSIGNMENT_STATUSES = ('pending', 'assigned')
+
+WEIGHTS = {'distance': 0.5, 'load': 0.2, 'rating': 0.2, 'vehicle': 0.1}
+
+# Average speeds, for the vehicle term and delivery time estimates; riders without a vehicle walk
+VEHICLE_SPEEDS_KMH = {'motorcycle': 30, 'car': 25, 'truck': 20, 'bicycle': 15}
+WALKING_SPEED_KMH = 5
+# Rating counted for riders with no deliveries yet
+NEW_RIDER_RATING = 4.0
+# From pickup to the customer, added to the rider's trip to the pickup
+DROP_OFF_MINUTES = 15
+
+
+def open_orders(limit):
+    """Orders waiting for a delivery person that nobody holds an offer for, oldest first."""
+    return list(
+        Order.objects.filter(status='order_placed', delivery_person__isnull=True)
+        .exclude(assignment__status__in=LIVE_ASSIGNMENT_STATUSES)
+        .select_related('assignment')
+        .order_by('created_at', 'pk')[:limit]
+    )
+
+
+def available_riders(points):
+    """Riders free to take an order picked up at any of `points`, as dicts."""
+    riders = (
+        DeliveryPersonProfile.objects.filter(is_online=True, notify_new_orders=True, user__is_active=True)
+        .exclude(user__order_assignments__status__in=LIVE_ASSIGNMENT_STATUSES)
+    )
+    found = {}
+    for lat, lng in points:
+        for rider in (
+            within(riders, lat, lng, settings.RIDER_BROADCAST_RINGS_KM[-1])
+            .annotate(load=rider_load())
+            .filter(load__lt=settings.RIDER_MAX_ACTIVE_ORDERS)
+            .values(
+                'user_id', 'latitude', 'longitude', 'max_delivery_distance',
+                'average_rating', 'total_deliveries', 'vehicle_type', 'load',
+            )
+        ):
+            found[rider['user_id']] = rider
+    return sorted(found.values(), key=lambda rider: rider['user_id'])
+
+
+def rider_speed(rider):
+    return VEHICLE_SPEEDS_KMH.get(rider['vehicle_type'], WALKING_SPEED_KMH)
+
+
+def rider_terms(rider):
+    """The part of a rider's score that does not depend on the order."""
+    rating = float(rider['average_rating']) if rider['total_deliveries'] else NEW_RIDER_RATING
+    return (
+        WEIGHTS['load'] * (1 - rider['load'] / settings.RIDER_MAX_ACTIVE_ORDERS)
+        + WEIGHTS['rating'] * rating / 5
+        + WEIGHTS['vehicle'] * rider_speed(rider) / max(VEHICLE_SPEEDS_KMH.values())
+    )
+
+
+def score_matrix(pickups, riders, excluded=()):
+    """
+    Scores of every (order, rider) pair, orders being given by their pickup
+    points, with the distances in km. Pairs out of a rider's reach, and
+    (order index, rider index) pairs in `excluded`, score -inf.
+    """
+    reach = [float(rider['max_delivery_distance']) for rider in riders]
+    terms = [rider_terms(rider) for rider in riders]
+    rider_points = [(float(rider['latitude']), float(rider['longitude'])) for rider in riders]
+
+    order_lat, order_lng = np.radians(np.array(pickups, dtype=float).reshape(-1, 2)).T[:, :, None]
+    rider_lat, rider_lng = np.radians(np.array(rider_points, dtype=float).reshape(-1, 2)).T[:, None, :]
+    a = np.sin((rider_lat - order_lat) / 2) ** 2 + np.cos(order_lat) * np.cos(rider_lat) * np.sin((rider_lng - order_lng) / 2) ** 2
+    distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+    reach = np.array(reach)
+    scores = WEIGHTS['distance'] * (1 - distances / reach) + np.array(terms)
+    scores[distances > reach] = -np.inf
+    for i, j in excluded:
+        scores[i, j] = -np.inf
+    return scores, distances
+
+
+def _hungarian(cost):
+    n, m = cost.shape
+    u, v = np.zeros(n + 1), np.zeros(m + 1)
+    match = np.zeros(m + 1, dtype=int)  # match[j]: row (1-based) given column j, 0 for none
+    way = np.zeros(m + 1, dtype=int)
+    for i in range(1, n + 1):
+        match[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = match[j0]
+            free = np.flatnonzero(~used[1:]) + 1
+            reduced = cost[i0 - 1, free - 1] - u[i0] - v[free]
+            better = reduced < minv[free]
+            minv[free[better]] = reduced[better]
+            way[free[better]] = j0
+            j1 = free[np.argmin(minv[free])]
+            delta = minv[j1]
+            taken = np.flatnonzero(used)
+            u[match[taken]] += delta
+            v[taken] -= delta
+            minv[free] -= delta
+            j0 = j1
+            if match[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            match[j0] = match[j1]
+            j0 = j1
+    return [(int(match[j]) - 1, j - 1) for j in range(1, m + 1) if match[j]]
+
+
+# Cost of an infeasible pair: more than any set of feasible pairs, so as many pairs as possible are feasible
+INFEASIBLE_COST = 1e6
+
+
+def best_assignment(scores):
+    """
+    (row, column) pairs of the `scores` matrix, each row and column used at
+    most once, maximising the number of pairs and then their total score.
+    Pairs scoring -inf are never returned.
+    """
+    scores = np.asarray(scores, dtype=float)
+    if not scores.size:
+        return []
+    flipped = scores.shape[0] > scores.shape[1]
+    cost = np.where(np.isneginf(scores), INFEASIBLE_COST, -scores)
+    pairs = _hungarian(cost.T if flipped else cost)
+    if flipped:
+        pairs = [(i, j) for j, i in pairs]
+    return sorted((i, j) for i, j in pairs if scores[i, j] != -np.inf)
+
+
+def dispatch(now=None):
+    """Run one dispatch round. Returns counts of expired offers, orders, riders and assignments made."""
+    now = now or timezone.now()
+    expired = expire_assignments(now, note='dispatch: offer not accepted in time')
+    orders = open_orders(settings.DISPATCH_BATCH_SIZE)
+    pickups = [pickup_point(order) for order in orders]
+    riders = available_riders(set(pickups)) if orders else []
+    counts = {'expired': len(expired), 'orders': len(orders), 'riders': len(riders), 'assigned': 0}
+    if not orders or not riders:
+        return counts
+
+    # Do not offer an order again to the rider who last let it expire or turned it down
+    rider_index = {rider['user_id']: j for j, rider in enumerate(riders)}
+    excluded = set()
+    for i, order in enumerate(orders):
+        previous = getattr(order, 'assignment', None)
+        if previous is not None and previous.delivery_person_id in rider_index:
+            excluded.add((i, rider_index[previous.delivery_person_id]))
+
+    scores, distances = score_matrix(pickups, riders, excluded)
+    pairs = best_assignment(scores)
+    expires_at = now + timedelta(seconds=settings.DISPATCH_OFFER_SECONDS)
+
+    with transaction.atomic():
+        # Orders taken or offered by someone else since they were read are left alone
+        still_open = set(
+            Order.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(pk__in=[order.pk for order in orders], status='order_placed', delivery_person__isnull=True)
+            .exclude(assignment__status__in=LIVE_ASSIGNMENT_STATUSES)
+            .values_list('pk', flat=True)
+        )
+        assignments = []
+        for i, j in pairs:
+            if orders[i].pk not in still_open:
+                continue
+            rider, distance = riders[j], float(distances[i][j])
+            travel_minutes = distance / rider_speed(rider) * 60 + DROP_OFF_MINUTES
+            assignments.append(OrderAssignment(
+                order=orders[i],
+                delivery_person_id=rider['user_id'],
+                assignment_score=float(scores[i][j]),
+                distance_km=distance,
+                estimated_delivery_time=now + timedelta(minutes=travel_minutes),
+                expires_at=expires_at,
+                status='assigned',
+            ))
+        # An order's expired or rejected assignment is replaced, and the re-offer logged
+        assignments = offer_assignments(assignments, note='dispatch: offered')
+        outbox.enqueue_many('rider_order_alert', [
+            {'order_id': assignment.order_id, 'user_id': assignment.delivery_person_id} for assignment in assignments
+        ])
+
+    counts['assigned'] = len(assignments)
+    logger.info(
+        f"Dispatch: {len(assignments)} of {len(orders)} orders offered to {len(riders)} available delivery persons"
+    )
+    return counts
@@ -0,0 +1,73 @@
+"""
+Delivery fees.
+
+The fee is 20 KES plus 10 KES per km (rounded to the nearest km) of the road
+distance from the shop, as routed by OpenRouteService, or of the straight-line
+distance when ORS has no route. Fees are cached per delivery point, rounded to
+about 10 m, so a cart re-priced for the same address does not call ORS again.
+"""
+import logging
+from decimal import Decimal
+from math import atan2, cos, radians, sin, sqrt
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Kibabii University
+SHOP_LAT, SHOP_LNG = 0.6085, 34.5683
+
+BASE_FEE = Decimal('20.00')
+FEE_PER_KM = Decimal('10.00')
+
+ORS_DIRECTIONS_URL = 'https://api.openrouteservice.org/v2/directions/driving-car'
+FEE_KEY = 'delivery-fee:{lat:.4f}:{lng:.4f}'
+
+
+class DeliveryFeeUnavailable(Exception):
+    """Raised when the distance to the delivery point cannot be worked out."""
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    R = 6371  # Earth's radius in kilometers
+    lat1, lng1, lat2, lng2 = map(radians, [lat1, lng1, lat2, lng2])
+    dlat = lat2 - lat1
+    dlng = lng2 - lng1
+    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlng / 2) ** 2
+    return R * 2 * atan2(sqrt(a), sqrt(1 - a))
+
+
+def route_distance_km(lat, lng):
+    """Road distance in km from the shop to (lat, lng)."""
+    payload = {
+        'coordinates': [[SHOP_LNG, SHOP_LAT], [lng, lat]],  # [lon, lat]
+        'units': 'km',
+        'profile': 'driving-car',
+    }
+    headers = {'Authorization': settings.ORS_API_KEY, 'Content-Type': 'application/json'}
+    try:
+        response = requests.post(ORS_DIRECTIONS_URL, json=payload, headers=headers, timeout=30)
+        if response.status_code == 404:
+            logger.warning("ORS API returned 404, using fallback distance calculation")
+            return haversine_km(SHOP_LAT, SHOP_LNG, lat, lng)
+        response.raise_for_status()
+        # Already in km, as requested by 'units' above
+        return response.json()['routes'][0]['summary']['distance']
+    except requests.RequestException as e:
+        logger.error(f"ORS API error: {str(e)}")
+        raise DeliveryFeeUnavailable(f"Failed to calculate distance: {str(e)}")
+
+
+def fee_for_distance(distance_km):
+    return (BASE_FEE + Decimal(round(distance_km)) * FEE_PER_KM).quantize(Decimal('0.01'))
+
+
+def delivery_fee(lat, lng):
+    """Fee for delivering to (lat, lng), from the cache when that point was priced before."""
+    key = FEE_KEY.format(lat=lat, lng=lng)
+    fee = cache.get(key)
+    if fee is None:
+        fee = fee_for_distance(route_distance_km(lat, lng))
+        cache.set(key, fee, timeout=settings.DELIVERY_FEE_CACHE_TIMEOUT)
+    return fee
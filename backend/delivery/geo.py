@@ -0,0 +1,71 @@
+"""
+Geohash cells for rider locations.
+
+A geohash names a cell of a grid laid over the globe; each extra character
+splits a cell into 32, and a cell's geohash is a prefix of the geohash of
+every point inside it. DeliveryPersonProfile and DeliveryLocation store the
+geohash of their coordinates (GEOHASH_PRECISION characters, cells of about
+150 m) in an indexed column, so "riders within r km" becomes a few indexed
+prefix scans over the cells covering the circle (cells_covering()) followed
+by exact distances for the riders found, instead of a distance per rider.
+"""
+from math import floor
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 7
+
+# Cells searched for one lookup; more cells means smaller (tighter) ones
+MAX_COVERING_CELLS = 16
+
+
+def encode(lat, lng, precision=GEOHASH_PRECISION):
+    lat, lng = float(lat), float(lng)
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits = value = 0
+    even = True  # Bits alternate longitude, latitude, starting with longitude
+    while len(chars) < precision:
+        span, point = (lng_range, lng) if even else (lat_range, lat)
+        middle = (span[0] + span[1]) / 2
+        if point >= middle:
+            value = value * 2 + 1
+            span[0] = middle
+        else:
+            value *= 2
+            span[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = value = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(height, width) in degrees of the cells of `precision` characters."""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def cells_covering(lat_range, lng_range, max_cells=MAX_COVERING_CELLS):
+    """
+    The smallest cells, at most `max_cells` of them and all of one precision,
+    that together cover the box lat_range x lng_range (degrees).
+    """
+    (min_lat, max_lat), (min_lng, max_lng) = lat_range, lng_range
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = range(floor((min_lat + 90) / height), floor((max_lat + 90) / height) + 1)
+        columns = range(floor((min_lng + 180) / width), floor((max_lng + 180) / width) + 1)
+        if len(rows) * len(columns) <= max_cells or precision == 1:
+            # Encode the centre of each cell in the grid
+            return sorted({
+                encode(
+                    min(-90 + (row + 0.5) * height, 90.0),
+                    (column + 0.5) * width % 360 - 180,
+                    precision,
+                )
+                for row in rows for column in columns
+            })
@@ -0,0 +1,93 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from delivery.candidates import KM_PER_DEGREE, haversine_expression, nearest
+from delivery.fees import SHOP_LAT, SHOP_LNG
+from delivery.models import DeliveryPersonProfile
+from users.models import User
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Time nearest-rider lookups against simulated riders: geohash-pruned (delivery.candidates.nearest) '
+        'against a distance computed for every rider. The riders are created in a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--riders', type=int, default=10000, help='Simulated online riders')
+        parser.add_argument('--spread-km', type=float, default=20, help='Side of the square around the shop riders are spread over')
+        parser.add_argument('--lookups', type=int, default=200, help='Lookups timed per method')
+        parser.add_argument('-k', type=int, default=5, help='Riders returned per lookup')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        half = options['spread_km'] / 2 / KM_PER_DEGREE
+
+        def point():
+            return SHOP_LAT + rng.uniform(-half, half), SHOP_LNG + rng.uniform(-half, half)
+
+        self.stdout.write(f"Creating {options['riders']} riders over {options['spread_km']} km x {options['spread_km']} km...")
+        users = User.objects.bulk_create([
+            User(
+                email=f'benchmark-rider{i}@example.com', first_name='Benchmark', last_name=f'Rider {i}',
+                phone=f'+2549{i:08d}', role='delivery_person', password='!',
+            )
+            for i in range(options['riders'])
+        ], batch_size=1000)
+        profiles = []
+        for user in users:
+            lat, lng = point()
+            profile = DeliveryPersonProfile(user=user, is_online=True, latitude=round(lat, 8), longitude=round(lng, 8))
+            profile.update_geohash()
+            profiles.append(profile)
+        DeliveryPersonProfile.objects.bulk_create(profiles, batch_size=1000)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE {DeliveryPersonProfile._meta.db_table}')
+
+        k = options['k']
+        online = DeliveryPersonProfile.objects.filter(is_online=True)
+
+        def pruned(lat, lng):
+            return [profile.user_id for profile in nearest(online, lat, lng, k)]
+
+        def full_scan(lat, lng):
+            return list(
+                online.annotate(distance_km=haversine_expression(lat, lng))
+                .order_by('distance_km', 'pk').values_list('user_id', flat=True)[:k]
+            )
+
+        points = [point() for _ in range(options['lookups'])]
+        timings = {}
+        for name, lookup in (('geohash cells', pruned), ('full scan', full_scan)):
+            samples, results = [], []
+            for lat, lng in points:
+                started = time.perf_counter()
+                results.append(lookup(lat, lng))
+                samples.append((time.perf_counter() - started) * 1000)
+            timings[name] = (samples, results)
+            samples.sort()
+            self.stdout.write(
+                f'{name:>14}: median {statistics.median(samples):.2f} ms, '
+                f'p95 {samples[int(len(samples) * 0.95) - 1]:.2f} ms, mean {statistics.fmean(samples):.2f} ms'
+            )
+
+        if timings['geohash cells'][1] == timings['full scan'][1]:
+            self.stdout.write(self.style.SUCCESS(f'Both methods returned the same {k} riders for every lookup.'))
+        else:
+            self.stdout.write(self.style.ERROR('The methods returned different riders.'))
@@ -0,0 +1,28 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from delivery.dispatch import dispatch
+
+
+class Command(BaseCommand):
+    help = 'Offer waiting orders to the best placed delivery persons (ORDER_DISPATCH=assign)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running a round every --interval seconds')
+        parser.add_argument('--interval', type=float, default=15.0, help='Seconds between rounds with --loop')
+
+    def handle(self, *args, **options):
+        if settings.ORDER_DISPATCH != 'assign':
+            self.stdout.write(self.style.WARNING(
+                f"ORDER_DISPATCH is '{settings.ORDER_DISPATCH}': new orders are also broadcast to delivery persons."
+            ))
+        while True:
+            counts = dispatch()
+            if counts['orders'] or counts['expired'] or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Dispatch: {counts['assigned']} of {counts['orders']} orders offered to "
+                    f"{counts['riders']} available delivery persons, {counts['expired']} offers expired."
+                ))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from django.conf import settings
+from notifications.fake_twilio import add_load_arguments, load_report
 from notifications.services import notification_service
 from users.models import User
 from orders.models import Order
@@ -8,7 +9,7 @@ class Command(BaseCommand):
     help = 'Test Twilio SMS and WhatsApp integration'
 
     def add_arguments(self, parser):
-        parser.add_argument('phone', type=str, help='Phone number to test (e.g., +254712345678)')
+        parser.add_argument('phone', type=str, nargs='?', help='Phone number to test (e.g., +254712345678)')
         parser.add_argument(
             '--type',
             type=str,
@@ -16,11 +17,20 @@ class Command(BaseCommand):
             default='sms',
             help='Type of notification to test'
         )
+        add_load_arguments(parser)
 
     def handle(self, *args, **options):
         phone = options['phone']
         test_type = options['type']
 
+        if options['load']:
+            self.stdout.write(f"Sending {options['load']} {test_type} messages to a local fake Twilio server...")
+            self.stdout.write(self.style.SUCCESS(load_report(test_type, options)))
+            return
+        if not phone:
+            self.stdout.write(self.style.ERROR('A phone number is required unless --load is given.'))
+            return
+
         if not settings.TWILIO_ACCOUNT_SID or not settings.TWILIO_AUTH_TOKEN:
             self.stdout.write(
                 self.style.ERROR('Twilio credentials not configured. Please set TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN in your environment.')
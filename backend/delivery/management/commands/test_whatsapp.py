@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from orders.models import Order
 from orders.whatsapp_notifications import send_admin_whatsapp_notification
+from notifications.fake_twilio import add_load_arguments, load_report
 import logging
 
 logger = logging.getLogger(__name__)
@@ -8,7 +9,15 @@ logger = logging.getLogger(__name__)
 class Command(BaseCommand):
     help = 'Tests the WhatsApp notification functionality by sending a test message'
 
+    def add_arguments(self, parser):
+        add_load_arguments(parser)
+
     def handle(self, *args, **options):
+        if options['load']:
+            self.stdout.write(f"Sending {options['load']} WhatsApp messages to a local fake Twilio server...")
+            self.stdout.write(self.style.SUCCESS(load_report('whatsapp', options)))
+            return
+
         try:
             # Create a mock order to test the notification
             mock_order = Order.objects.first()
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0006_deliverypersonprofile_latitude_and_more'),
+        ('orders', '0011_cursor_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(fields=['delivery_person', 'status', '-delivered_at', '-id'], name='delivery_de_deliver_af98b7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='earningstransaction',
+            index=models.Index(fields=['delivery_person', '-created_at', '-id'], name='delivery_ea_deliver_6b1b42_idx'),
+        ),
+    ]
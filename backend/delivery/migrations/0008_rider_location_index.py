@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0007_cursor_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='deliverypersonprofile',
+            index=models.Index(fields=['is_online', 'latitude', 'longitude'], name='delivery_de_is_onli_82da3d_idx'),
+        ),
+    ]
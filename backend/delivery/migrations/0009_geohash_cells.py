@@ -0,0 +1,48 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:51
+
+from django.conf import settings
+from django.db import migrations, models
+from delivery.geo import encode
+
+
+def backfill_geohashes(apps, schema_editor):
+    for model_name in ('DeliveryPersonProfile', 'DeliveryLocation'):
+        model = apps.get_model('delivery', model_name)
+        rows = list(model.objects.filter(latitude__isnull=False, longitude__isnull=False).only('latitude', 'longitude'))
+        for row in rows:
+            row.geohash = encode(row.latitude, row.longitude)
+        model.objects.bulk_update(rows, ['geohash'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('delivery', '0008_rider_location_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='deliverypersonprofile',
+            name='delivery_de_is_onli_82da3d_idx',
+        ),
+        migrations.AddField(
+            model_name='deliverylocation',
+            name='geohash',
+            field=models.CharField(blank=True, editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='deliverypersonprofile',
+            name='geohash',
+            field=models.CharField(blank=True, editable=False, max_length=12),
+        ),
+        migrations.RunPython(backfill_geohashes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='deliverylocation',
+            index=models.Index(fields=['geohash'], name='delivery_location_geohash', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='deliverypersonprofile',
+            index=models.Index(condition=models.Q(('is_online', True)), fields=['geohash'], name='delivery_online_geohash', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
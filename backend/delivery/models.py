@@ -2,6 +2,34 @@ from django.db import models
 from users.models import User
 from orders.models import Order
 from django.utils import timezone
+from . import geo
+
+
+class GeohashedLocation(models.Model):
+    """
+    Coordinates plus the geohash of the cell they fall in (delivery/geo.py),
+    kept up to date on every save.
+    """
+    latitude = models.DecimalField(max_digits=10, decimal_places=8, null=True, blank=True)
+    longitude = models.DecimalField(max_digits=11, decimal_places=8, null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def update_geohash(self):
+        """Set geohash from the coordinates; call before bulk_create() or queryset update(), which skip save()."""
+        if self.latitude is None or self.longitude is None:
+            self.geohash = ''
+        else:
+            self.geohash = geo.encode(self.latitude, self.longitude)
+
+    def save(self, *args, **kwargs):
+        self.update_geohash()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+        super().save(*args, **kwargs)
 
 class Delivery(models.Model):
     STATUS_CHOICES = (
@@ -24,6 +52,11 @@ class Delivery(models.Model):
     delivery_fee = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     tip = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['delivery_person', 'status', '-delivered_at', '-id']),
+        ]
+
     def __str__(self):
         return f"Delivery {self.id} for Order {self.order.id} ({self.status})"
 
@@ -60,13 +93,17 @@ class OrderAssignment(models.Model):
         ]
 
 
-class DeliveryLocation(models.Model):
+class DeliveryLocation(GeohashedLocation):
     """Real-time location tracking for delivery persons"""
     delivery_person = models.OneToOneField(User, on_delete=models.CASCADE, related_name='current_location')
-    latitude = models.DecimalField(max_digits=10, decimal_places=8, null=True, blank=True)
-    longitude = models.DecimalField(max_digits=11, decimal_places=8, null=True, blank=True)
     accuracy = models.FloatField(null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Prefix (LIKE 'abc%') lookups by cell, delivery/candidates.py
+            models.Index(fields=['geohash'], name='delivery_location_geohash', opclasses=['varchar_pattern_ops']),
+        ]
     
     def __str__(self):
         return f"{self.delivery_person.first_name} - {self.latitude}, {self.longitude}"
@@ -97,7 +134,7 @@ class DeliverySchedule(models.Model):
         ordering = ['date', 'start_time']
 
 
-class DeliveryPersonProfile(models.Model):
+class DeliveryPersonProfile(GeohashedLocation):
     VEHICLE_CHOICES = (
         ('motorcycle', 'Motorcycle'),
         ('car', 'Car'),
@@ -119,10 +156,7 @@ class DeliveryPersonProfile(models.Model):
     average_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0.00)
     total_deliveries = models.IntegerField(default=0)
     profile_image = models.ImageField(upload_to='delivery_profiles/', blank=True, null=True)
-    
-    # Location fields for assignment
-    latitude = models.DecimalField(max_digits=10, decimal_places=8, null=True, blank=True)
-    longitude = models.DecimalField(max_digits=11, decimal_places=8, null=True, blank=True)
+    # Location for assignment: latitude, longitude and geohash (GeohashedLocation)
     
     # Notification preferences
     notify_new_orders = models.BooleanField(default=True)
@@ -136,6 +170,15 @@ class DeliveryPersonProfile(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Online riders near a point, by cell prefix (LIKE 'abc%'), delivery/candidates.py
+            models.Index(
+                fields=['geohash'], name='delivery_online_geohash', opclasses=['varchar_pattern_ops'],
+                condition=models.Q(is_online=True),
+            ),
+        ]
+
     def __str__(self):
         return f"{self.user.first_name} {self.user.last_name} - Delivery Profile"
 
@@ -181,6 +224,9 @@ class EarningsTransaction(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['delivery_person', '-created_at', '-id']),
+        ]
 
 
 class DeliveryApplication(models.Model):
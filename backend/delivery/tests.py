@@ -3,7 +3,19 @@ from rest_framework.test import APIClient
 from users.models import User
 from orders.models import Order
 from products.models import Product
-from .models import Delivery
+from django.test import override_settings
+from datetime import timedelta
+from itertools import permutations
+from random import Random
+from unittest.mock import Mock, patch
+from django.core.cache import cache
+from django.utils import timezone
+from notifications.models import OutboxMessage
+from orders.models import OrderStatusTransition
+from . import dispatch, geo
+from .candidates import nearby_riders, nearest
+from .fees import SHOP_LAT, SHOP_LNG, delivery_fee, route_distance_km
+from .models import Delivery, DeliveryLocation, DeliveryPersonProfile, OrderAssignment
 
 class DeliveryTests(TestCase):
     def setUp(self):
@@ -89,4 +101,277 @@ class DeliveryTests(TestCase):
             'order_id': self.order.id,
             'delivery_person_id': self.delivery_person.id
         })
-        self.assertEqual(response.status_code, 403)
\ No newline at end of file
+        self.assertEqual(response.status_code, 403)
+
+
+# About 1 km of latitude
+KM = 1 / 111.045
+
+
+@override_settings(RIDER_MAX_ACTIVE_ORDERS=2)
+class RiderCandidateTests(TestCase):
+    def setUp(self):
+        self.customer = User.objects.create_user(
+            email='candidate-customer@example.com',
+            password='testpass123',
+            first_name='Candidate',
+            last_name='Customer',
+            phone='0711000400',
+            role='customer'
+        )
+        self.count = 0
+
+    def rider(self, km_north, online=True, max_distance=10, load=0):
+        self.count += 1
+        user = User.objects.create_user(
+            email=f'candidate-rider{self.count}@example.com',
+            password='testpass123',
+            first_name='Candidate',
+            last_name=f'Rider {self.count}',
+            phone=f'07110004{self.count:02d}',
+            role='delivery_person'
+        )
+        DeliveryPersonProfile.objects.create(
+            user=user, is_online=online, max_delivery_distance=max_distance,
+            latitude=round(SHOP_LAT + km_north * KM, 8), longitude=SHOP_LNG,
+        )
+        for status in ['assigned', 'in_progress', 'delivered'][:load] + ['delivered']:
+            Order.objects.create(customer=self.customer, delivery_person=user, status=status)
+        return user
+
+    def candidates(self, radius_km, limit=10, exclude=()):
+        return [(rider['user_id'], round(rider['distance_km'], 1), rider['load'])
+                for rider in nearby_riders(SHOP_LAT, SHOP_LNG, radius_km, limit, exclude)]
+
+    def test_least_busy_then_nearest(self):
+        near_busy = self.rider(0.5, load=1)
+        far = self.rider(3)
+        near = self.rider(1)
+        with self.assertNumQueries(1):
+            candidates = self.candidates(5)
+        self.assertEqual(candidates, [(near.id, 1.0, 0), (far.id, 3.0, 0), (near_busy.id, 0.5, 1)])
+        self.assertEqual(self.candidates(5, limit=1), [(near.id, 1.0, 0)])
+        self.assertEqual(self.candidates(2), [(near.id, 1.0, 0), (near_busy.id, 0.5, 1)])
+
+    def test_unavailable_riders_are_left_out(self):
+        self.rider(1, online=False)
+        self.rider(4, max_distance=3)
+        self.rider(1, load=2)
+        self.rider(30)
+        excluded = self.rider(2)
+        self.assertEqual(self.candidates(50, exclude=[excluded.id]), [])
+
+    def test_nearest_widens_the_search_until_k_are_found(self):
+        riders = [self.rider(km) for km in (0.3, -0.6, 3, 8)]
+        profiles = DeliveryPersonProfile.objects.filter(is_online=True)
+        with self.assertNumQueries(1):
+            found = nearest(profiles, SHOP_LAT, SHOP_LNG, 2)
+        self.assertEqual([profile.user_id for profile in found], [riders[0].id, riders[1].id])
+        # 1, 2 then 4 km
+        with self.assertNumQueries(3):
+            found = nearest(profiles, SHOP_LAT, SHOP_LNG, 3)
+        self.assertEqual([round(profile.distance_km, 1) for profile in found], [0.3, 0.6, 3.0])
+        found = nearest(profiles, SHOP_LAT, SHOP_LNG, 10, max_radius_km=5)
+        self.assertEqual([profile.user_id for profile in found], [rider.id for rider in riders[:3]])
+
+    def test_geohash_follows_location_updates(self):
+        profile = self.rider(1, max_distance=30).delivery_profile
+        self.assertEqual(profile.geohash, geo.encode(profile.latitude, profile.longitude))
+        profile.latitude, profile.longitude = SHOP_LAT + 20 * KM, SHOP_LNG
+        profile.save(update_fields=['latitude', 'longitude'])
+        profile.refresh_from_db()
+        self.assertEqual(profile.geohash, geo.encode(SHOP_LAT + 20 * KM, SHOP_LNG))
+        self.assertEqual(self.candidates(5), [])
+        self.assertEqual([rider[0] for rider in self.candidates(25)], [profile.user_id])
+
+        location = DeliveryLocation.objects.create(delivery_person=profile.user, latitude=SHOP_LAT, longitude=SHOP_LNG)
+        self.assertEqual(location.geohash, geo.encode(SHOP_LAT, SHOP_LNG))
+        self.assertEqual(list(nearest(DeliveryLocation.objects.all(), SHOP_LAT, SHOP_LNG, 1)), [location])
+
+
+class DeliveryFeeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def ors_response(self, distance):
+        return Mock(status_code=200, json=Mock(return_value={'routes': [{'summary': {'distance': distance}}]}))
+
+    def test_route_distance_uses_the_requested_km(self):
+        with patch('delivery.fees.requests.post', return_value=self.ors_response(3.4)) as post:
+            self.assertEqual(route_distance_km(0.61, 34.57), 3.4)
+        self.assertEqual(post.call_args.kwargs['json']['units'], 'km')
+
+    def test_fee_is_charged_per_routed_km(self):
+        with patch('delivery.fees.requests.post', return_value=self.ors_response(3.4)):
+            self.assertEqual(str(delivery_fee(0.61, 34.57)), '50.00')
+
+
+class GeohashTests(TestCase):
+    def test_encode(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(geo.encode(SHOP_LAT, SHOP_LNG), geo.encode(SHOP_LAT, SHOP_LNG, 9)[:geo.GEOHASH_PRECISION])
+
+    def test_covering_cells_contain_every_point_of_the_box(self):
+        for lat_range, lng_range in [((0.5, 0.7), (34.4, 34.7)), ((-0.01, 0.01), (179.99, 180.02)), ((10, 10.001), (5, 5.001))]:
+            cells = geo.cells_covering(lat_range, lng_range)
+            self.assertLessEqual(len(cells), geo.MAX_COVERING_CELLS)
+            for i in range(11):
+                for j in range(11):
+                    lat = lat_range[0] + (lat_range[1] - lat_range[0]) * i / 10
+                    lng = lng_range[0] + (lng_range[1] - lng_range[0]) * j / 10
+                    lng = (lng + 180) % 360 - 180
+                    self.assertTrue(any(geo.encode(lat, lng).startswith(cell) for cell in cells), (lat, lng, cells))
+        # A small box is covered by small cells
+        self.assertEqual(len(geo.cells_covering((10, 10.001), (5, 5.001))[0]), geo.GEOHASH_PRECISION)
+
+
+def brute_force_assignment(scores):
+    # Most feasible pairs, then the highest total score
+    rows, columns = len(scores), len(scores[0])
+    best = (0, 0.0)
+    for chosen in permutations(range(max(rows, columns)), rows):
+        pairs = [(i, j) for i, j in enumerate(chosen) if j < columns and scores[i][j] != float('-inf')]
+        best = max(best, (len(pairs), sum(scores[i][j] for i, j in pairs)))
+    return best
+
+
+class BestAssignmentTests(TestCase):
+    def test_matches_brute_force(self):
+        random = Random(7)
+        for rows, columns in [(1, 1), (3, 5), (5, 3), (4, 4), (6, 6)]:
+            for _ in range(20):
+                scores = [
+                    [float('-inf') if random.random() < 0.3 else round(random.random(), 3) for _ in range(columns)]
+                    for _ in range(rows)
+                ]
+                pairs = dispatch.best_assignment(scores)
+                self.assertEqual(len({i for i, _ in pairs}), len(pairs))
+                self.assertEqual(len({j for _, j in pairs}), len(pairs))
+                count, total = brute_force_assignment(scores)
+                self.assertEqual(len(pairs), count, scores)
+                self.assertAlmostEqual(sum(scores[i][j] for i, j in pairs), total, msg=scores)
+
+    def test_empty(self):
+        self.assertEqual(dispatch.best_assignment([]), [])
+        self.assertEqual(dispatch.best_assignment([[float('-inf')]]), [])
+
+
+@override_settings(RIDER_MAX_ACTIVE_ORDERS=2, ORDER_DISPATCH='assign', DISPATCH_OFFER_SECONDS=60)
+class DispatchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.customer = User.objects.create_user(
+            email='dispatch-customer@example.com',
+            password='testpass123',
+            first_name='Dispatch',
+            last_name='Customer',
+            phone='0711000500',
+            role='customer'
+        )
+        self.count = 0
+
+    def rider(self, km_north, vehicle_type='motorcycle', online=True, max_distance=10, load=0):
+        self.count += 1
+        user = User.objects.create_user(
+            email=f'dispatch-rider{self.count}@example.com',
+            password='testpass123',
+            first_name='Dispatch',
+            last_name=f'Rider {self.count}',
+            phone=f'07110005{self.count:02d}',
+            role='delivery_person'
+        )
+        DeliveryPersonProfile.objects.create(
+            user=user, is_online=online, max_delivery_distance=max_distance, vehicle_type=vehicle_type,
+            latitude=round(SHOP_LAT + km_north * KM, 8), longitude=SHOP_LNG,
+        )
+        for _ in range(load):
+            Order.objects.create(customer=self.customer, delivery_person=user, status='assigned')
+        return user
+
+    def orders(self, count):
+        return [Order.objects.create(customer=self.customer, total_price=20) for _ in range(count)]
+
+    def offers(self):
+        return {
+            assignment.order_id: (assignment.delivery_person_id, assignment.status)
+            for assignment in OrderAssignment.objects.all()
+        }
+
+    def test_orders_go_to_the_best_riders(self):
+        near = self.rider(1)
+        walking = self.rider(0.5, vehicle_type='')
+        busy = self.rider(2, load=1)
+        self.rider(1, online=False)
+        # Searched, but further than it delivers
+        self.rider(12)
+        first, second = self.orders(2)
+
+        with self.assertNumQueries(13):
+            counts = dispatch.dispatch()
+        self.assertEqual(counts, {'expired': 0, 'orders': 2, 'riders': 4, 'assigned': 2})
+        self.assertEqual(self.offers(), {first.id: (near.id, 'assigned'), second.id: (walking.id, 'assigned')})
+        offer = OrderAssignment.objects.get(order=first)
+        self.assertAlmostEqual(offer.distance_km, 1.0, places=2)
+        # Closeness 0.9, free, new rider rating 4/5, fastest vehicle
+        self.assertAlmostEqual(offer.assignment_score, 0.5 * 0.9 + 0.2 + 0.2 * 0.8 + 0.1, places=3)
+        self.assertLess(offer.expires_at - offer.assigned_at, timedelta(seconds=61))
+        self.assertGreater(offer.estimated_delivery_time, offer.assigned_at + timedelta(minutes=dispatch.DROP_OFF_MINUTES))
+        self.assertEqual(
+            sorted(OutboxMessage.objects.filter(topic='rider_order_alert').values_list('payload', flat=True), key=str),
+            sorted([{'order_id': first.id, 'user_id': near.id}, {'order_id': second.id, 'user_id': walking.id}], key=str),
+        )
+        # New orders are not broadcast
+        self.assertFalse(OutboxMessage.objects.filter(topic='rider_broadcast').exists())
+
+        # Nothing left to offer; then riders holding an offer are not offered another
+        self.assertEqual(dispatch.dispatch()['orders'], 0)
+        third, = self.orders(1)
+        self.assertEqual(dispatch.dispatch(), {'expired': 0, 'orders': 1, 'riders': 2, 'assigned': 1})
+        self.assertEqual(self.offers()[third.id], (busy.id, 'assigned'))
+
+    def test_only_the_offered_rider_can_accept(self):
+        offered = self.rider(1)
+        other = self.rider(3)
+        order, = self.orders(1)
+        dispatch.dispatch()
+        self.assertEqual(self.offers(), {order.id: (offered.id, 'assigned')})
+
+        self.client.force_authenticate(user=other)
+        self.assertEqual(len(self.client.get('/api/delivery/available/').data), 0)
+        self.assertEqual(self.client.post(f'/api/delivery/accept/{order.id}/').status_code, 409)
+
+        self.client.force_authenticate(user=offered)
+        self.assertEqual(len(self.client.get('/api/delivery/available/').data), 1)
+        self.assertEqual(self.client.post(f'/api/delivery/accept/{order.id}/').status_code, 200)
+        self.assertEqual(self.offers(), {order.id: (offered.id, 'accepted')})
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.delivery_person_id), ('assigned', offered.id))
+
+    def test_unaccepted_offers_expire_and_go_to_someone_else(self):
+        first = self.rider(1)
+        second = self.rider(3)
+        order, = self.orders(1)
+        dispatch.dispatch()
+        self.assertEqual(self.offers(), {order.id: (first.id, 'assigned')})
+
+        later = timezone.now() + timedelta(seconds=61)
+        self.assertEqual(dispatch.dispatch(now=later), {'expired': 1, 'orders': 1, 'riders': 2, 'assigned': 1})
+        self.assertEqual(self.offers(), {order.id: (second.id, 'assigned')})
+        self.assertEqual(
+            list(OrderStatusTransition.objects.filter(order=order, kind='assignment')
+                 .order_by('pk').values_list('from_status', 'to_status')),
+            [('assigned', 'expired'), ('expired', 'assigned')],
+        )
+
+    def test_terminal_assignments_are_not_reoffered(self):
+        rider = self.rider(1)
+        self.rider(2)
+        order, = self.orders(1)
+        OrderAssignment.objects.create(
+            order=order, delivery_person=rider, status='accepted',
+            estimated_delivery_time=timezone.now(), expires_at=timezone.now(),
+        )
+        self.assertEqual(dispatch.dispatch()['assigned'], 0)
+        self.assertEqual(self.offers(), {order.id: (rider.id, 'accepted')})
+        self.assertFalse(OrderStatusTransition.objects.filter(order=order, kind='assignment').exists())
+        self.assertFalse(OutboxMessage.objects.filter(topic='rider_order_alert').exists())
@@ -4,7 +4,6 @@ This file contains the detailed logic for all delivery views
 """
 
 from notifications.services import notification_service
-from decimal import Decimal
 from django.core.exceptions import ObjectDoesNotExist
 from django.shortcuts import get_object_or_404
 from django.db import transaction
@@ -13,6 +12,7 @@ from django.db.models import Sum, Count, Avg, Q
 from django.utils import timezone
 from datetime import datetime, timedelta
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
@@ -37,12 +37,15 @@ from .serializers import (
     DeliveryFeeSerializer
 )
 from orders.models import Order
+from .dispatch import LIVE_ASSIGNMENT_STATUSES
+from .fees import DeliveryFeeUnavailable, delivery_fee
+from orders.transitions import InvalidTransition, can_transition, check_transition, log_transition, transition
 from users.models import User
+from campus_delivery.pagination import StandardCursorPagination
 import logging
 from rest_framework.decorators import api_view, permission_classes
 import openrouteservice
 from django.conf import settings
-import requests
 
 logger = logging.getLogger(__name__)
 
@@ -139,6 +142,14 @@ class DeliveryStatusView(UpdateAPIView):
            self.request.user.role not in ['admin', 'staff']:
             raise PermissionError("You don't have permission to update this delivery")
 
+        from_status = delivery.status
+        to_status = serializer.validated_data.get('status', from_status)
+        if to_status != from_status:
+            try:
+                check_transition(delivery, to_status)
+            except InvalidTransition as e:
+                raise ValidationError({'status': [str(e)]})
+
         # Update delivered_at when status changes to delivered
         if serializer.validated_data.get('status') == 'delivered' and not delivery.delivered_at:
             serializer.validated_data['delivered_at'] = timezone.now()
@@ -160,7 +171,10 @@ class DeliveryStatusView(UpdateAPIView):
                 profile.total_deliveries += 1
                 profile.save()
 
-        serializer.save()
+        with transaction.atomic():
+            serializer.save()
+            if to_status != from_status:
+                log_transition(delivery, from_status, actor=self.request.user)
 
 class DeliveryScheduleView(ListCreateAPIView):
     """
@@ -358,6 +372,10 @@ class AvailableDeliveriesView(ListAPIView):
         return Delivery.objects.filter(
             status='pending',
             delivery_person__isnull=True
+        ).exclude(
+            # Offered to another delivery person by dispatch_orders
+            Q(order__assignment__status__in=LIVE_ASSIGNMENT_STATUSES, order__assignment__expires_at__gt=timezone.now())
+            & ~Q(order__assignment__delivery_person=self.request.user)
         ).select_related('order', 'order__customer').prefetch_related('order__items')
 
 class DeliveryEarningsView(ListAPIView):
@@ -366,6 +384,7 @@ class DeliveryEarningsView(ListAPIView):
     """
     serializer_class = EarningsTransactionSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = StandardCursorPagination
 
     def get_queryset(self):
         user = self.request.user
@@ -382,6 +401,8 @@ class DeliveryHistoryView(ListAPIView):
     """
     serializer_class = DeliverySerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = StandardCursorPagination
+    cursor_ordering = ('-delivered_at', '-id')
 
     def get_queryset(self):
         user = self.request.user
@@ -390,7 +411,8 @@ class DeliveryHistoryView(ListAPIView):
 
         return Delivery.objects.filter(
             delivery_person=user,
-            status='delivered'
+            status='delivered',
+            delivered_at__isnull=False
         ).order_by('-delivered_at')
 
 class EarningsTransactionView(ListAPIView):
@@ -399,6 +421,7 @@ class EarningsTransactionView(ListAPIView):
     """
     serializer_class = EarningsTransactionSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = StandardCursorPagination
 
     def get_queryset(self):
         user = self.request.user
@@ -493,12 +516,22 @@ class AcceptOrderView(APIView):
                 order = Order.objects.select_for_update().get(id=order_id)
 
                 # Check if order is already assigned
-                if order.status != 'order_placed' or order.delivery_person is not None:
+                if not can_transition('order', order.status, 'assigned') or order.delivery_person is not None:
                     return Response(
                         {'message': 'Order has already been taken.'},
                         status=status.HTTP_409_CONFLICT
                     )
 
+                # An order dispatch_orders has offered to someone is theirs until the offer expires
+                offer = OrderAssignment.objects.filter(
+                    order=order, status__in=LIVE_ASSIGNMENT_STATUSES, expires_at__gt=timezone.now()
+                ).first()
+                if offer is not None and offer.delivery_person_id != delivery_person.id:
+                    return Response(
+                        {'message': 'Order has been offered to another delivery person.'},
+                        status=status.HTTP_409_CONFLICT
+                    )
+
                 # Find the corresponding delivery object created by the signal
                 delivery = get_object_or_404(Delivery, order=order)
                 if delivery.delivery_person is not None:
@@ -507,14 +540,15 @@ class AcceptOrderView(APIView):
                         status=status.HTTP_409_CONFLICT
                     )
 
-                # Assign the delivery person to the order and the delivery
+                # Assign the delivery person to the order and the delivery;
+                # the delivery stays pending until it is picked up
                 order.delivery_person = delivery_person
-                order.status = 'assigned'
-                order.save()
+                transition(order, 'assigned', actor=delivery_person)
 
                 delivery.delivery_person = delivery_person
-                delivery.status = 'assigned'
                 delivery.save()
+                if offer is not None:
+                    transition(offer, 'accepted', actor=delivery_person)
 
                 # Send confirmation to customer
                 if order.customer.phone:
@@ -561,72 +595,15 @@ class calculate_delivery_fee(APIView):
         if serializer.is_valid():
             lat = serializer.validated_data['lat']
             lng = serializer.validated_data['lng']
-            cart_id = serializer.validated_data.get('cart_id') # Should be cart_id, will be updated later.
-
-            # Shop coordinates (Kibabii University)
-            shop_coords = [34.5683, 0.6085]  # [lon, lat]
 
-            customer_coords = [lng, lat]  # [lon, lat]
-
-            # Log request details
-            logger.debug(f"Sending ORS request with coords: shop={shop_coords}, customer={customer_coords}")
-
-            # Call OpenRouteService Directions API
+            # The delivery object will be associated with the order upon order creation.
             try:
-                # Use the correct OpenRouteService endpoint with proper authentication
-                ors_url = "https://api.openrouteservice.org/v2/directions/driving-car"
-                headers = {
-                    "Authorization": settings.ORS_API_KEY,
-                    "Content-Type": "application/json",
-                }
-                payload = {
-                    "coordinates": [shop_coords, customer_coords],
-                    "units": "km",
-                    "profile": "driving-car"
-                }
-
-                logger.info(f"Making ORS request to: {ors_url}")
-                logger.debug(f"ORS request payload: {payload}")
-
-                response = requests.post(ors_url, json=payload, headers=headers, timeout=30)
-
-                if response.status_code == 404:
-                    # Fallback to manual distance calculation if API fails
-                    logger.warning("ORS API returned 404, using fallback distance calculation")
-                    from math import radians, sin, cos, sqrt, atan2
-
-                    def haversine_distance(lat1, lon1, lat2, lon2):
-                        R = 6371  # Earth's radius in kilometers
-                        lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-                        dlat = lat2 - lat1
-                        dlon = lon2 - lon1
-                        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-                        c = 2 * atan2(sqrt(a), sqrt(1-a))
-                        return R * c
-
-                    distance = haversine_distance(0.6085, 34.5683, lat, lng)
-                    logger.info(f"Fallback distance calculated: {distance} km")
-                else:
-                    response.raise_for_status()
-                    data = response.json()
-                    # ORS returns distance in meters, convert to km
-                    distance = data['routes'][0]['summary']['distance'] / 1000.0
-                    logger.debug(f"ORS response distance: {distance} km")
-
-                # Calculate delivery fee: 20 KES base + 10 KES per km (rounded to nearest km)
-                delivery_fee = Decimal('20.00') + (Decimal(str(round(distance))) * Decimal('10.00'))
-
-                # The delivery fee is calculated and returned.
-                # The delivery object will be associated with the order upon order creation.
-                return Response({
-                    "delivery_fee": delivery_fee.quantize(Decimal('0.01'))
-                }, status=status.HTTP_200_OK)
-
-            except requests.RequestException as e:
-                logger.error(f"ORS API error: {str(e)}")
+                fee = delivery_fee(lat, lng)
+            except DeliveryFeeUnavailable as e:
                 return Response({
-                    "error": f"Failed to calculate distance: {str(e)}"
+                    "error": str(e)
                 }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return Response({"delivery_fee": fee}, status=status.HTTP_200_OK)
         else:
             logger.error(f"Serializer errors: {serializer.errors}")
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
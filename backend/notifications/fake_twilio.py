@@ -0,0 +1,133 @@
+"""
+A local stand-in for the Twilio Messages API, for load-testing the
+dispatcher (`manage.py test_twilio --load N`, `manage.py test_whatsapp --load N`)
+without sending real messages.
+"""
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+from django.conf import settings
+from .services import NotificationService
+
+
+class FakeTwilioServer:
+    """
+    Answers POST /2010-04-01/Accounts/<sid>/Messages.json like Twilio does,
+    after `latency` seconds. Every `fail_every`-th message gets a 400 error.
+    Use as a context manager; `url` is the base URL to give the client.
+    """
+
+    def __init__(self, latency=0.05, fail_every=0):
+        self.latency = latency
+        self.fail_every = fail_every
+        self.received = []
+        self.connections = set()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, like the real API
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                form = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+                time.sleep(server.latency)
+                with server._lock:
+                    server.received.append(form)
+                    server.connections.add(self.client_address)
+                    count = len(server.received)
+
+                if server.fail_every and count % server.fail_every == 0:
+                    status, body = 400, {'code': 21211, 'message': f"The 'To' number {form.get('To')} is not valid.", 'status': 400}
+                else:
+                    status, body = 201, {
+                        'sid': f'SM{uuid.uuid4().hex}',
+                        'status': 'queued',
+                        'to': form.get('To'),
+                        'from': form.get('From'),
+                        'body': form.get('Body'),
+                    }
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+
+def run_load(channel, count, workers, rate_limit, latency=0.05, fail_every=0):
+    """
+    Send `count` messages on `channel` ('sms' or 'whatsapp') through a
+    NotificationService pointed at a FakeTwilioServer. Returns the results and timings.
+    """
+    with FakeTwilioServer(latency=latency, fail_every=fail_every) as server:
+        service = NotificationService(
+            account_sid='AC' + '0' * 32, auth_token='fake-token', api_base_url=server.url,
+            max_workers=workers, rate_limit=rate_limit,
+        )
+        messages = [(f'+2547{i:08d}', f'CampusConnect load test message {i}') for i in range(count)]
+        send = service.send_whatsapp_batch if channel == 'whatsapp' else service.send_sms_batch
+        started = time.perf_counter()
+        results = send(messages)
+        elapsed = time.perf_counter() - started
+        connections = len(server.connections)
+
+    sent = sum(1 for result in results if result['sid'])
+    return {
+        'sent': sent,
+        'failed': len(results) - sent,
+        'seconds': elapsed,
+        'per_second': len(results) / elapsed if elapsed else 0,
+        'connections': connections,
+        'sequential_seconds': count * latency,
+        'results': results,
+    }
+
+
+def add_load_arguments(parser):
+    parser.add_argument('--load', type=int, metavar='N', help='Send N messages to a local fake Twilio server instead')
+    parser.add_argument('--workers', type=int, default=None, help='Concurrent sends (default TWILIO_MAX_CONCURRENCY)')
+    parser.add_argument('--rate', type=float, default=None, help='Messages per second, 0 for no limit (default TWILIO_RATE_LIMIT)')
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds the fake server takes per message')
+    parser.add_argument('--fail-every', type=int, default=0, help='Make every Nth message fail')
+
+
+def load_report(channel, options):
+    stats = run_load(
+        channel, options['load'],
+        workers=options['workers'] or settings.TWILIO_MAX_CONCURRENCY,
+        rate_limit=settings.TWILIO_RATE_LIMIT if options['rate'] is None else options['rate'],
+        latency=options['latency'], fail_every=options['fail_every'],
+    )
+    return (
+        f"{stats['sent']} sent, {stats['failed']} failed in {stats['seconds']:.2f}s "
+        f"({stats['per_second']:.1f} messages/s over {stats['connections']} connections; "
+        f"one at a time would take {stats['sequential_seconds']:.2f}s)"
+    )
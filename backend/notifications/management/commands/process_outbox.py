@@ -0,0 +1,24 @@
+import time
+from django.core.management.base import BaseCommand
+from notifications.outbox import process_outbox
+
+
+class Command(BaseCommand):
+    help = 'Run due outbox messages (order alerts and other deferred work)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Messages claimed at a time')
+        parser.add_argument('--workers', type=int, default=8, help='Threads running messages in parallel')
+        parser.add_argument('--loop', action='store_true', help='Keep running, polling for new messages')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between polls with --loop')
+
+    def handle(self, *args, **options):
+        while True:
+            counts = process_outbox(batch_size=options['batch_size'], workers=options['workers'])
+            if any(counts.values()) or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Outbox: {counts['done']} done, {counts['pending']} to retry, {counts['failed']} failed."
+                ))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
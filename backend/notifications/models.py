@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from users.models import User
 
 class Notification(models.Model):
@@ -21,5 +22,41 @@ class Notification(models.Model):
     status = models.CharField(max_length=20, default='sent')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['recipient', '-created_at', '-id']),
+            models.Index(fields=['-created_at', '-id']),
+        ]
+
+    def __str__(self):
+        return f"{self.type} notification ({self.channel}) to {self.recipient.full_name} at {self.created_at}"
+
+
+class OutboxMessage(models.Model):
+    """
+    Work to do after a transaction commits, written in that transaction and
+    carried out by `python manage.py process_outbox` (see notifications/outbox.py).
+    """
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+
+    topic = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    # Not picked up before this time: retry backoff, or the lease of the worker running it
+    available_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_at', 'id']),
+        ]
+
     def __str__(self):
-        return f"{self.type} notification ({self.channel}) to {self.recipient.full_name} at {self.created_at}"
\ No newline at end of file
+        return f"{self.topic} message {self.id} ({self.status})"
@@ -0,0 +1,135 @@
+"""
+Transactional outbox.
+
+Slow side effects of a request (WhatsApp and SMS alerts, fan-out to many
+recipients) are not run by the request. It calls enqueue() instead, which
+writes an OutboxMessage in the request's transaction: the message exists if
+and only if the transaction commits. `python manage.py process_outbox` drains
+the table in batches and runs the handler registered for each message's topic.
+
+A worker claims a batch by pushing its available_at forward by
+OUTBOX_LEASE_SECONDS (rows are locked with SKIP LOCKED, so concurrent workers
+take different batches); a worker that dies leaves its messages to be picked
+up again once the lease runs out. Each handler runs in a transaction that also
+marks the message done, so its database writes (including messages it
+enqueues) happen exactly once. A handler that raises is retried with
+exponential backoff, up to OUTBOX_MAX_ATTEMPTS attempts, after which the
+message is marked failed. External calls may therefore be repeated: handlers
+should do one external call each.
+"""
+import logging
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+
+def handler(topic):
+    """Register the decorated function(payload) as the handler of `topic`."""
+    def register(func):
+        HANDLERS[topic] = func
+        return func
+    return register
+
+
+def enqueue(topic, **payload):
+    return OutboxMessage.objects.create(topic=topic, payload=payload)
+
+
+def schedule(topic, seconds, **payload):
+    """enqueue(), but not run before `seconds` from now."""
+    return OutboxMessage.objects.create(
+        topic=topic, payload=payload, available_at=timezone.now() + timedelta(seconds=seconds)
+    )
+
+
+def enqueue_many(topic, payloads):
+    return OutboxMessage.objects.bulk_create([OutboxMessage(topic=topic, payload=payload) for payload in payloads])
+
+
+def retry_delay(attempts):
+    """Seconds before attempt `attempts` + 1: doubling from OUTBOX_RETRY_BASE_SECONDS, with jitter."""
+    delay = min(settings.OUTBOX_RETRY_MAX_SECONDS, settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    # Spread retries of messages that failed together (e.g. during an outage)
+    return delay * random.uniform(0.8, 1.0)
+
+
+def claim_batch(batch_size):
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(status='pending', available_at__lte=now)
+            .order_by('available_at', 'id')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+        OutboxMessage.objects.filter(pk__in=ids).update(
+            available_at=now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+        )
+    return list(OutboxMessage.objects.filter(pk__in=ids).order_by('available_at', 'id'))
+
+
+def run_message(message):
+    """Run one claimed message. Returns its new status, 'pending' meaning it will be retried."""
+    attempts = message.attempts + 1
+    try:
+        func = HANDLERS.get(message.topic)
+        if func is None:
+            raise LookupError(f"No outbox handler for topic '{message.topic}'")
+        with transaction.atomic():
+            func(message.payload)
+            OutboxMessage.objects.filter(pk=message.pk).update(
+                status='done', attempts=attempts, processed_at=timezone.now(), last_error=''
+            )
+        return 'done'
+    except Exception as e:
+        logger.warning(f"Outbox message {message.pk} ({message.topic}) failed on attempt {attempts}: {e}")
+        if attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            status, available_at = 'failed', timezone.now()
+            logger.error(f"Outbox message {message.pk} ({message.topic}) gave up after {attempts} attempts")
+        else:
+            status, available_at = 'pending', timezone.now() + timedelta(seconds=retry_delay(attempts))
+        OutboxMessage.objects.filter(pk=message.pk).update(
+            status=status, attempts=attempts, available_at=available_at, last_error=str(e)[:2000]
+        )
+        return status
+
+
+def _run_in_thread(message):
+    try:
+        return run_message(message)
+    finally:
+        # Each worker thread opens its own connection; a reconnect is cheap next to the calls handlers make
+        connections.close_all()
+
+
+def process_outbox(batch_size=100, workers=1, max_batches=None):
+    """
+    Run due messages, `batch_size` at a time, on `workers` threads, until none
+    are due (or `max_batches` batches ran). Returns {status: count}.
+    """
+    counts = {'done': 0, 'pending': 0, 'failed': 0}
+    batches = 0
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        while max_batches is None or batches < max_batches:
+            batch = claim_batch(batch_size)
+            if not batch:
+                break
+            statuses = executor.map(_run_in_thread, batch) if executor else map(run_message, batch)
+            for status in statuses:
+                counts[status] += 1
+            batches += 1
+    finally:
+        if executor:
+            executor.shutdown()
+    return counts
@@ -1,22 +1,77 @@
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
+from requests.adapters import HTTPAdapter
 from twilio.rest import Client
 from twilio.base.exceptions import TwilioRestException
+from twilio.http.http_client import TwilioHttpClient
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+class PooledHttpClient(TwilioHttpClient):
+    """
+    Twilio HTTP client whose keep-alive connections are shared by every thread
+    sending through it, up to `pool_size` at once. `api_base_url` sends the
+    requests to another host instead of api.twilio.com (a local fake in load tests).
+    """
+
+    def __init__(self, pool_size, timeout=None, api_base_url=None):
+        super().__init__(pool_connections=True, timeout=timeout)
+        # pool_block: threads beyond pool_size wait for a connection instead of opening throwaway ones
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.api_base_url = api_base_url.rstrip('/') if api_base_url else None
+
+    def request(self, method, url, *args, **kwargs):
+        if self.api_base_url:
+            url = re.sub(r'^https://[^/]+', self.api_base_url, url)
+        return super().request(method, url, *args, **kwargs)
+
+
+class RateLimiter:
+    """Spaces calls to acquire() at least 1/rate seconds apart, across threads. rate <= 0: no limit."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
 class NotificationService:
-    def __init__(self):
+    def __init__(self, account_sid=None, auth_token=None, api_base_url=None, max_workers=None, rate_limit=None):
         self.client = None
         self.whatsapp_from = None
         self.sms_from = None
+        self.account_sid = account_sid or settings.TWILIO_ACCOUNT_SID
+        self.auth_token = auth_token or settings.TWILIO_AUTH_TOKEN
+        self.api_base_url = api_base_url or settings.TWILIO_API_BASE_URL
+        self.max_workers = max_workers or settings.TWILIO_MAX_CONCURRENCY
+        self.rate_limiter = RateLimiter(settings.TWILIO_RATE_LIMIT if rate_limit is None else rate_limit)
         self._initialize_twilio()
-    
+
     def _initialize_twilio(self):
         """Initialize Twilio client with credentials from settings"""
         try:
-            if settings.TWILIO_ACCOUNT_SID and settings.TWILIO_AUTH_TOKEN:
-                self.client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+            if self.account_sid and self.auth_token:
+                http_client = PooledHttpClient(
+                    pool_size=self.max_workers, timeout=settings.TWILIO_HTTP_TIMEOUT, api_base_url=self.api_base_url
+                )
+                self.client = Client(self.account_sid, self.auth_token, http_client=http_client)
                 self.whatsapp_from = f'whatsapp:{settings.TWILIO_WHATSAPP_NUMBER}'
                 self.sms_from = settings.TWILIO_PHONE_NUMBER
                 logger.info("Twilio client initialized successfully")
@@ -25,46 +80,75 @@ class NotificationService:
         except Exception as e:
             logger.error(f"Failed to initialize Twilio client: {e}")
             self.client = None
-    
+
+    def _create(self, from_, to_number, message_body):
+        self.rate_limiter.acquire()
+        return self.client.messages.create(from_=from_, body=message_body, to=to_number).sid
+
+    def _whatsapp_number(self, to_number):
+        # Ensure the to_number is in the correct format for WhatsApp
+        return to_number if to_number.startswith('whatsapp:') else f'whatsapp:{to_number}'
+
     def send_whatsapp(self, to_number, message_body):
         """Send WhatsApp message using Twilio"""
         if not self.client:
             logger.error("Twilio client not initialized")
             return None
-            
+
         try:
-            # Ensure the to_number is in the correct format for WhatsApp
-            if not to_number.startswith('whatsapp:'):
-                to_number = f'whatsapp:{to_number}'
-            
-            message = self.client.messages.create(
-                from_=self.whatsapp_from,
-                body=message_body,
-                to=to_number
-            )
+            to_number = self._whatsapp_number(to_number)
+            sid = self._create(self.whatsapp_from, to_number, message_body)
             logger.info(f"WhatsApp message sent successfully to {to_number}")
-            return message.sid
+            return sid
         except TwilioRestException as e:
             logger.error(f"Failed to send WhatsApp message to {to_number}: {e}")
             return None
-    
+
     def send_sms(self, to_number, message_body):
         """Send SMS message using Twilio"""
         if not self.client:
             logger.error("Twilio client not initialized")
             return None
-            
+
         try:
-            message = self.client.messages.create(
-                from_=self.sms_from,
-                body=message_body,
-                to=to_number
-            )
+            sid = self._create(self.sms_from, to_number, message_body)
             logger.info(f"SMS sent successfully to {to_number}")
-            return message.sid
+            return sid
         except TwilioRestException as e:
             logger.error(f"Failed to send SMS to {to_number}: {e}")
             return None
 
+    def dispatch(self, from_, messages):
+        """
+        Send (to_number, message_body) pairs on up to max_workers threads
+        sharing the client's connections, at most TWILIO_RATE_LIMIT per second.
+        Returns one {'to', 'sid', 'error'} per message, in order.
+        """
+        messages = list(messages)
+        if not self.client:
+            logger.error("Twilio client not initialized")
+            return [{'to': to, 'sid': None, 'error': 'Twilio client not initialized'} for to, _ in messages]
+
+        def send(message):
+            to_number, body = message
+            try:
+                return {'to': to_number, 'sid': self._create(from_, to_number, body), 'error': None}
+            except Exception as e:
+                logger.error(f"Failed to send message to {to_number}: {e}")
+                return {'to': to_number, 'sid': None, 'error': str(e)}
+
+        if len(messages) <= 1:
+            return [send(message) for message in messages]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(messages))) as executor:
+            return list(executor.map(send, messages))
+
+    def send_whatsapp_batch(self, messages):
+        """send_whatsapp for many (to_number, message_body) pairs at once; see dispatch()."""
+        return self.dispatch(self.whatsapp_from, [(self._whatsapp_number(to), body) for to, body in messages])
+
+    def send_sms_batch(self, messages):
+        """send_sms for many (to_number, message_body) pairs at once; see dispatch()."""
+        return self.dispatch(self.sms_from, messages)
+
 # Create a global instance of the notification service
 notification_service = NotificationService()
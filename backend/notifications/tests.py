@@ -5,7 +5,14 @@ from orders.models import Order
 from products.models import Product
 from payment.models import Payment
 from delivery.models import Delivery
-from .models import Notification
+import time
+from datetime import timedelta
+from django.test import override_settings
+from django.utils import timezone
+from . import outbox
+from .fake_twilio import FakeTwilioServer
+from .services import NotificationService, RateLimiter
+from .models import Notification, OutboxMessage
 from unittest.mock import patch
 from channels.testing import WebsocketCommunicator
 from channels.db import database_sync_to_async
@@ -104,4 +111,93 @@ class NotificationTests(TestCase):
         self.client.force_authenticate(user=self.customer)
         response = self.client.get('/api/notifications/')
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data), 1)
\ No newline at end of file
+        self.assertEqual(len(response.data['results']), 1)
+
+
+@override_settings(OUTBOX_MAX_ATTEMPTS=3, OUTBOX_RETRY_BASE_SECONDS=10, OUTBOX_RETRY_MAX_SECONDS=25)
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.calls = []
+        handlers = patch.dict(outbox.HANDLERS, {'test.ok': self.ok, 'test.broken': self.broken})
+        handlers.start()
+        self.addCleanup(handlers.stop)
+
+    def ok(self, payload):
+        self.calls.append(payload)
+
+    def broken(self, payload):
+        outbox.enqueue('test.follow_up', parent=payload['n'])
+        raise RuntimeError('service unavailable')
+
+    def make_due(self):
+        OutboxMessage.objects.filter(status='pending').update(available_at=timezone.now())
+
+    def test_messages_run_in_order_and_are_marked_done(self):
+        for n in range(5):
+            outbox.enqueue('test.ok', n=n)
+        counts = outbox.process_outbox(batch_size=2, max_batches=3)
+        self.assertEqual(counts, {'done': 5, 'pending': 0, 'failed': 0})
+        self.assertEqual([payload['n'] for payload in self.calls], list(range(5)))
+        self.assertEqual(OutboxMessage.objects.filter(status='done').count(), 5)
+
+    def test_failures_back_off_then_give_up(self):
+        message = outbox.enqueue('test.broken', n=1)
+        self.assertEqual(outbox.process_outbox(), {'done': 0, 'pending': 1, 'failed': 0})
+        message.refresh_from_db()
+        self.assertEqual((message.attempts, message.last_error), (1, 'service unavailable'))
+        self.assertGreater(message.available_at, timezone.now() + timedelta(seconds=7))
+        # Not due yet
+        self.assertEqual(outbox.process_outbox(), {'done': 0, 'pending': 0, 'failed': 0})
+
+        self.assertTrue(16 <= outbox.retry_delay(2) <= 20)
+        self.assertLessEqual(outbox.retry_delay(10), 25)
+        for status in ('pending', 'failed'):
+            self.make_due()
+            self.assertEqual(outbox.process_outbox()[status], 1)
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), ('failed', 3))
+        # The failed handler's writes were rolled back every time
+        self.assertFalse(OutboxMessage.objects.filter(topic='test.follow_up').exists())
+
+    def test_claimed_messages_are_leased(self):
+        outbox.enqueue('test.ok', n=1)
+        self.assertEqual(len(outbox.claim_batch(10)), 1)
+        # Claimed by a worker that has not finished (or died): not offered again until the lease ends
+        self.assertEqual(outbox.claim_batch(10), [])
+        OutboxMessage.objects.update(available_at=timezone.now())
+        self.assertEqual(len(outbox.claim_batch(10)), 1)
+
+
+class DispatcherTests(TestCase):
+    def service(self, server, **kwargs):
+        return NotificationService(account_sid='AC' + '0' * 32, auth_token='token', api_base_url=server.url, **kwargs)
+
+    def test_batch_results_in_order(self):
+        with FakeTwilioServer(latency=0.01, fail_every=4) as server:
+            results = self.service(server, max_workers=4, rate_limit=0).send_whatsapp_batch(
+                [(f'+25470000{i:04d}', f'Message {i}') for i in range(8)]
+            )
+        self.assertEqual([result['to'] for result in results], [f'whatsapp:+25470000{i:04d}' for i in range(8)])
+        self.assertEqual(sum(1 for result in results if result['sid']), 6)
+        self.assertTrue(all(result['error'] for result in results if not result['sid']))
+        self.assertEqual(sorted(form['Body'] for form in server.received), sorted(f'Message {i}' for i in range(8)))
+
+    def test_connections_are_reused(self):
+        with FakeTwilioServer(latency=0.01) as server:
+            results = self.service(server, max_workers=3, rate_limit=0).send_sms_batch(
+                [(f'+25471000{i:04d}', 'Hello') for i in range(30)]
+            )
+        self.assertTrue(all(result['sid'] for result in results))
+        self.assertLessEqual(len(server.connections), 3)
+
+    def test_rate_limit(self):
+        limiter = RateLimiter(50)
+        started = time.monotonic()
+        for _ in range(11):
+            limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.19)
+
+    def test_without_credentials(self):
+        with override_settings(TWILIO_ACCOUNT_SID=None, TWILIO_AUTH_TOKEN=None):
+            results = NotificationService().send_sms_batch([('+254700000000', 'Hello')])
+        self.assertEqual(results, [{'to': '+254700000000', 'sid': None, 'error': 'Twilio client not initialized'}])
@@ -3,10 +3,12 @@ from rest_framework.permissions import IsAuthenticated
 from .models import Notification
 from .serializers import NotificationSerializer
 from .permissions import IsAdminOrRecipient
+from campus_delivery.pagination import StandardCursorPagination
 
 class NotificationListView(generics.ListAPIView):
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated, IsAdminOrRecipient]
+    pagination_class = StandardCursorPagination
 
     def get_queryset(self):
         if self.request.user.role == 'admin':
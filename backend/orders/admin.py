@@ -4,8 +4,9 @@ from .models import Cart, CartItem, Coupon
 
 @admin.register(Coupon)
 class CouponAdmin(admin.ModelAdmin):
-    list_display = ('code', 'amount', 'discount_percent', 'active', 'created_at')
+    list_display = ('code', 'amount', 'discount_percent', 'active', 'used_count', 'max_uses', 'valid_until', 'created_at')
     list_filter = ('active',)
+    readonly_fields = ('used_count',)
     search_fields = ('code',)
     ordering = ('-created_at',)
 
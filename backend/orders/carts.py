@@ -0,0 +1,404 @@
+"""
+Cart storage backends used by CartView.
+
+`database` (default) reads and writes Cart/CartItem rows on every request.
+`redis` keeps active carts in Redis hashes and writes them back to Cart/CartItem
+later (write-behind): on checkout, and for carts idle longer than
+CART_IDLE_FLUSH_SECONDS through the flush_carts command. Both return the same
+payload as CartSerializer.
+"""
+import threading
+import time
+from uuid import uuid4
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch, Q, prefetch_related_objects
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import serializers
+from products.models import Product
+from products.serializers import get_product_serializer
+from .models import Cart, CartItem
+from .serializers import CartSerializer
+
+
+class CartError(Exception):
+    """Raised for a missing cart or cart line, or a bad quantity; the message is returned to the client."""
+
+
+def check_quantity(quantity):
+    # CartItem.quantity is a PositiveIntegerField; adding zero or less is never meant
+    if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity < 1:
+        raise CartError('Quantity must be a whole number of at least 1')
+
+
+def cart_owner(request):
+    """Identify the cart of a request: ('user', id) or ('session', session_key)."""
+    if request.user.is_authenticated:
+        return 'user', str(request.user.pk)
+    return 'session', request.session.session_key
+
+
+# -----------------------------
+# Database backend
+# -----------------------------
+class DatabaseCartBackend:
+    def serialize(self, cart, request):
+        # Load the items with their products in one query instead of one per line
+        prefetch_related_objects([cart], Prefetch('items', queryset=CartItem.objects.select_related('product')))
+        return CartSerializer(cart, context={'request': request}).data
+
+    def load(self, request):
+        session_key = request.session.session_key
+        if request.user.is_authenticated:
+            # User and anonymous session carts in one query
+            carts = list(
+                Cart.objects.filter(Q(user=request.user) | Q(session_key=session_key, user=None)).order_by('id')
+            )
+            user_cart = next((c for c in carts if c.user_id == request.user.id), None)
+            session_cart = next((c for c in carts if c.user_id is None), None)
+
+            if user_cart is None and session_cart is not None:
+                # First cart for this user: adopt the anonymous one instead of copying its items
+                user_cart, session_cart = session_cart, None
+                user_cart.user = request.user
+                user_cart.save(update_fields=['user', 'updated_at'])
+            elif user_cart is None:
+                user_cart = Cart.objects.create(user=request.user)
+
+            # Merge anonymous cart into user cart
+            if session_cart:
+                user_cart.merge(session_cart)
+
+            cart = user_cart
+            if cart.session_key:
+                cart.session_key = None
+                cart.save(update_fields=['session_key', 'updated_at'])
+        else:
+            # Anonymous user — use session-based cart
+            cart, created = Cart.objects.get_or_create(session_key=session_key, user=None)
+
+        return self.serialize(cart, request)
+
+    def add(self, request, product, quantity):
+        check_quantity(quantity)
+        if request.user.is_authenticated:
+            cart, created = Cart.objects.get_or_create(user=request.user)
+            if cart.session_key:
+                cart.session_key = None
+                cart.save()
+        else:
+            cart, created = Cart.objects.get_or_create(session_key=request.session.session_key, user=None)
+
+        cart_item, item_created = CartItem.objects.get_or_create(cart=cart, product=product)
+        if item_created:
+            cart_item.quantity = quantity
+        else:
+            cart_item.quantity += quantity
+        cart_item.save()
+        return self.serialize(cart, request), cart_item.quantity
+
+    def remove(self, request, product):
+        if request.user.is_authenticated:
+            cart = Cart.objects.filter(user=request.user).first()
+        else:
+            cart = Cart.objects.filter(session_key=request.session.session_key, user=None).first()
+        if not cart:
+            raise CartError('Cart not found')
+
+        cart_item = CartItem.objects.filter(cart=cart, product=product).first()
+        if not cart_item:
+            raise CartError('Cart item not found')
+        cart_item.delete()
+        return self.serialize(cart, request)
+
+    def clear(self, request):
+        cart = Cart.objects.filter(user=request.user).first()
+        if cart:
+            CartItem.objects.filter(cart=cart).delete()
+
+    def contents(self, request):
+        """{product_id: quantity} of the request's cart."""
+        if request.user.is_authenticated:
+            cart = Cart.objects.filter(user=request.user).first()
+        else:
+            cart = Cart.objects.filter(session_key=request.session.session_key, user=None).first()
+        if not cart:
+            return {}
+        return dict(cart.items.values_list('product_id', 'quantity'))
+
+    def checkout(self, request):
+        # Already persisted
+        pass
+
+
+# -----------------------------
+# Redis backend
+# -----------------------------
+class LocalRedis:
+    """
+    In-process stand-in for the few Redis commands RedisCartBackend uses.
+    Used when no CART_REDIS_URL is configured (tests, local development);
+    it is not shared between processes.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def flushall(self):
+        with self._lock:
+            self._data.clear()
+
+    def exists(self, name):
+        return int(name in self._data)
+
+    def renamenx(self, src, dst):
+        with self._lock:
+            if dst in self._data:
+                return False
+            self._data[dst] = self._data.pop(src)
+            return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(self._data.pop(name, None) is not None for name in names)
+
+    def expire(self, name, seconds):
+        # Keys never expire in the stand-in
+        return name in self._data
+
+    def hgetall(self, name):
+        return dict(self._data.get(name, {}))
+
+    def hset(self, name, key=None, value=None, mapping=None):
+        with self._lock:
+            values = self._data.setdefault(name, {})
+            if key is not None:
+                values[key] = str(value)
+            for k, v in (mapping or {}).items():
+                values[k] = str(v)
+
+    def hincrby(self, name, key, amount=1):
+        with self._lock:
+            values = self._data.setdefault(name, {})
+            values[key] = str(int(values.get(key, 0)) + amount)
+            return int(values[key])
+
+    def hdel(self, name, *keys):
+        with self._lock:
+            values = self._data.get(name, {})
+            removed = sum(values.pop(key, None) is not None for key in keys)
+            if not values:
+                self._data.pop(name, None)
+            return removed
+
+    def zadd(self, name, mapping):
+        with self._lock:
+            self._data.setdefault(name, {}).update({k: float(v) for k, v in mapping.items()})
+
+    def zscore(self, name, member):
+        return self._data.get(name, {}).get(member)
+
+    def zrem(self, name, *members):
+        return self.hdel(name, *members)
+
+    def zrangebyscore(self, name, min, max):
+        members = self._data.get(name, {})
+        return [member for member, score in sorted(members.items(), key=lambda item: item[1]) if min <= score <= max]
+
+
+class RedisCartBackend:
+    """
+    Carts live in a Redis hash per owner: product id -> quantity, plus "_"-prefixed
+    metadata. Owners changed since their last flush sit in a sorted set scored by
+    last change, which drives the idle flush. Carts not in Redis (new, expired or
+    after a restart) are loaded from the database on first use.
+    """
+    DIRTY_KEY = 'carts:dirty'
+
+    def __init__(self, client):
+        self.client = client
+        self.ttl = settings.CART_REDIS_TTL
+
+    def key(self, owner):
+        return f'cart:{owner[0]}:{owner[1]}'
+
+    def owner_lookup(self, owner):
+        kind, value = owner
+        return {'user_id': int(value)} if kind == 'user' else {'session_key': value, 'user': None}
+
+    def touch(self, owner):
+        now = timezone.now()
+        key = self.key(owner)
+        self.client.hset(key, '_updated_at', now.isoformat())
+        self.client.expire(key, self.ttl)
+        self.client.zadd(self.DIRTY_KEY, {self.key(owner): now.timestamp()})
+
+    def ensure_loaded(self, owner):
+        key = self.key(owner)
+        if self.client.exists(key):
+            return
+        cart = Cart.objects.filter(**self.owner_lookup(owner)).order_by('id').first()
+        created_at = cart.created_at if cart else timezone.now()
+        mapping = {'_created_at': created_at.isoformat(), '_updated_at': created_at.isoformat()}
+        if cart:
+            mapping['_cart_id'] = cart.pk
+            mapping.update({
+                str(product_id): quantity
+                for product_id, quantity in cart.items.values_list('product_id', 'quantity')
+            })
+        # Build the snapshot under a key of its own and move it in with RENAMENX, so the
+        # cart appears whole or not at all: a concurrent load (and the writes after it)
+        # that got there first is kept, and this snapshot dropped
+        staging = f'{key}:loading:{uuid4().hex}'
+        self.client.hset(staging, mapping=mapping)
+        self.client.expire(staging, self.ttl)
+        if not self.client.renamenx(staging, key):
+            self.client.delete(staging)
+
+    def quantities(self, owner):
+        return {
+            int(field): int(value)
+            for field, value in self.client.hgetall(self.key(owner)).items()
+            if not field.startswith('_')
+        }
+
+    def serialize(self, owner, request):
+        data = self.client.hgetall(self.key(owner))
+        quantities = {int(k): int(v) for k, v in data.items() if not k.startswith('_')}
+        products = Product.objects.filter(pk__in=quantities).order_by('pk')
+        product_data = get_product_serializer({'request': request}, products, many=True).data
+        cart_id = int(data['_cart_id']) if '_cart_id' in data else None
+        timestamp = serializers.DateTimeField()
+        created_at = parse_datetime(data.get('_created_at') or data.get('_updated_at') or '')
+        updated_at = parse_datetime(data.get('_updated_at') or '')
+        return {
+            'id': cart_id,
+            'user': int(owner[1]) if owner[0] == 'user' else None,
+            # Lines get database ids only once flushed
+            'items': [
+                {'id': None, 'cart': cart_id, 'product': product, 'quantity': quantities[product['id']]}
+                for product in product_data
+            ],
+            'created_at': timestamp.to_representation(created_at),
+            'updated_at': timestamp.to_representation(updated_at),
+        }
+
+    def load(self, request):
+        owner = cart_owner(request)
+        self.ensure_loaded(owner)
+        if owner[0] == 'user' and request.session.session_key:
+            session_owner = ('session', request.session.session_key)
+            self.ensure_loaded(session_owner)
+            moved = self.quantities(session_owner)
+            if moved:
+                # Merge anonymous cart into user cart
+                for product_id, quantity in moved.items():
+                    self.client.hincrby(self.key(owner), str(product_id), quantity)
+                # Drop the guest cart everywhere so it is not loaded (and merged) again; later
+                # guest adds under this session start a new cart that is flushed as usual
+                session_key = self.key(session_owner)
+                Cart.objects.filter(**self.owner_lookup(session_owner)).delete()
+                self.client.delete(session_key)
+                self.client.zrem(self.DIRTY_KEY, session_key)
+                self.touch(owner)
+        return self.serialize(owner, request)
+
+    def add(self, request, product, quantity):
+        check_quantity(quantity)
+        owner = cart_owner(request)
+        self.ensure_loaded(owner)
+        total = self.client.hincrby(self.key(owner), str(product.pk), quantity)
+        self.touch(owner)
+        return self.serialize(owner, request), total
+
+    def remove(self, request, product):
+        owner = cart_owner(request)
+        self.ensure_loaded(owner)
+        if not self.client.hdel(self.key(owner), str(product.pk)):
+            raise CartError('Cart item not found')
+        self.touch(owner)
+        return self.serialize(owner, request)
+
+    def clear(self, request):
+        owner = cart_owner(request)
+        self.ensure_loaded(owner)
+        key = self.key(owner)
+        products = [field for field in self.client.hgetall(key) if not field.startswith('_')]
+        if products:
+            self.client.hdel(key, *products)
+        self.touch(owner)
+
+    def contents(self, request):
+        owner = cart_owner(request)
+        self.ensure_loaded(owner)
+        return self.quantities(owner)
+
+    def checkout(self, request):
+        # Persist the cart once the order has committed, outside its transaction
+        owner = cart_owner(request)
+        transaction.on_commit(lambda: self.flush(self.key(owner)))
+
+    # -----------------------------
+    # Write-behind
+    # -----------------------------
+    def parse_key(self, key):
+        _, kind, value = key.split(':', 2)
+        return kind, value
+
+    def flush(self, key):
+        """Write one cart from Redis to Cart/CartItem."""
+        owner = self.parse_key(key)
+        changed_at = self.client.zscore(self.DIRTY_KEY, key)
+        data = self.client.hgetall(key)
+
+        if not data:
+            # Expired: drop the database copy
+            Cart.objects.filter(**self.owner_lookup(owner)).delete()
+        else:
+            quantities = {int(k): int(v) for k, v in data.items() if not k.startswith('_') and int(v) > 0}
+            # Products deleted since they were added would violate the foreign key
+            existing = set(Product.objects.filter(pk__in=quantities).values_list('pk', flat=True))
+            with transaction.atomic():
+                cart = Cart.objects.filter(**self.owner_lookup(owner)).order_by('id').first()
+                if cart is None:
+                    cart = Cart.objects.create(**self.owner_lookup(owner))
+                CartItem.objects.filter(cart=cart).exclude(product_id__in=existing).delete()
+                CartItem.objects.bulk_create(
+                    [CartItem(cart=cart, product_id=pid, quantity=quantities[pid]) for pid in existing],
+                    update_conflicts=True,
+                    unique_fields=['cart', 'product'],
+                    update_fields=['quantity'],
+                )
+                Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now())
+            self.client.hset(key, '_cart_id', cart.pk)
+
+        # Leave the cart queued if it changed while being written
+        if self.client.zscore(self.DIRTY_KEY, key) == changed_at:
+            self.client.zrem(self.DIRTY_KEY, key)
+
+    def flush_idle(self, idle_seconds=None):
+        """Flush every cart unchanged for `idle_seconds` (all queued carts when 0)."""
+        if idle_seconds is None:
+            idle_seconds = settings.CART_IDLE_FLUSH_SECONDS
+        keys = self.client.zrangebyscore(self.DIRTY_KEY, 0, time.time() - idle_seconds)
+        for key in keys:
+            self.flush(key)
+        return len(keys)
+
+
+_redis_clients = {}
+
+
+def get_cart_backend():
+    if settings.CART_BACKEND != 'redis':
+        return DatabaseCartBackend()
+    url = settings.CART_REDIS_URL
+    if url not in _redis_clients:
+        if url:
+            import redis
+            _redis_clients[url] = redis.Redis.from_url(url, decode_responses=True)
+        else:
+            _redis_clients[url] = LocalRedis()
+    return RedisCartBackend(_redis_clients[url])
@@ -0,0 +1,108 @@
+"""
+Coupon lookup, validation and redemption.
+
+Coupons are read through the cache under the 'coupons' tag, which
+orders.signals invalidates whenever a coupon is saved or deleted, so applying
+a code does not touch the database. Unknown codes are answered from the
+cached set of existing codes rather than cached one by one, so made-up codes
+cannot fill the cache. The
+cached used_count may lag behind, so limits checked here are advisory: they
+are enforced when an order redeems the coupon, by conditional UPDATEs of the
+coupon's used_count and the user's CouponUsage row. That keeps limits exact
+under concurrency without locking the coupon table.
+"""
+from decimal import ROUND_HALF_UP, Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from campus_delivery.cache import get_tag_version
+from .models import Coupon, CouponUsage
+
+COUPON_CACHE_TAG = 'coupons'
+COUPON_KEY = 'coupon:v{version}:{code}'
+COUPON_CODES_KEY = 'coupon-codes:v{version}'
+
+CENT = Decimal('0.01')
+
+
+class CouponError(Exception):
+    """Raised when a coupon cannot be used; the message is returned to the client."""
+
+
+def get_coupon(code):
+    version = get_tag_version(COUPON_CACHE_TAG)
+    codes = cache.get(COUPON_CODES_KEY.format(version=version))
+    if codes is None:
+        codes = frozenset(Coupon.objects.values_list('code', flat=True))
+        cache.set(COUPON_CODES_KEY.format(version=version), codes, timeout=settings.COUPON_CACHE_TIMEOUT)
+    if code not in codes:
+        return None
+    key = COUPON_KEY.format(version=version, code=code)
+    coupon = cache.get(key)
+    if coupon is None:
+        coupon = Coupon.objects.filter(code=code).first()
+        if coupon is not None:
+            cache.set(key, coupon, timeout=settings.COUPON_CACHE_TIMEOUT)
+    return coupon
+
+
+def validate_coupon(code, now=None):
+    """The usable coupon for `code`, or CouponError."""
+    coupon = get_coupon(code.strip())
+    if coupon is None or not coupon.active:
+        raise CouponError('Invalid or inactive coupon code')
+    now = now or timezone.now()
+    if coupon.valid_from and now < coupon.valid_from:
+        raise CouponError('This coupon is not valid yet')
+    if coupon.valid_until and now >= coupon.valid_until:
+        raise CouponError('This coupon has expired')
+    if coupon.max_uses is not None and coupon.used_count >= coupon.max_uses:
+        raise CouponError('This coupon has been used up')
+    return coupon
+
+
+def coupon_discount(coupon, subtotal):
+    """Discount of `coupon` on `subtotal`: its fixed amount if set, else its percentage; never more than the subtotal."""
+    if coupon.amount:
+        discount = coupon.amount
+    elif coupon.discount_percent:
+        discount = subtotal * coupon.discount_percent / 100
+    else:
+        discount = Decimal('0')
+    return min(discount, subtotal).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def redeem(coupon, user):
+    """
+    Count one use of `coupon` by `user`, raising CouponError when a limit is
+    reached. Call it inside the transaction that creates the order, so a
+    failed checkout gives the use back.
+    """
+    with transaction.atomic():
+        now = timezone.now()
+        counted = Coupon.objects.filter(
+            Q(max_uses__isnull=True) | Q(used_count__lt=F('max_uses')),
+            Q(valid_from__isnull=True) | Q(valid_from__lte=now),
+            Q(valid_until__isnull=True) | Q(valid_until__gt=now),
+            pk=coupon.pk, active=True,
+        ).update(used_count=F('used_count') + 1)
+        if not counted:
+            raise CouponError('This coupon is no longer available')
+
+        cap = coupon.max_uses_per_user
+        if cap is not None and cap < 1:
+            raise CouponError('You have already used this coupon')
+        usage = CouponUsage.objects.filter(coupon=coupon, user=user)
+        if cap is not None:
+            usage = usage.filter(count__lt=cap)
+        if usage.update(count=F('count') + 1):
+            return
+        try:
+            with transaction.atomic():
+                CouponUsage.objects.create(coupon=coupon, user=user, count=1)
+        except IntegrityError:
+            # Either at the cap, or a concurrent first use created the row
+            if not usage.update(count=F('count') + 1):
+                raise CouponError('You have already used this coupon')
@@ -0,0 +1,99 @@
+"""
+Idempotency-Key support for POST endpoints.
+
+Clients on flaky connections send the same Idempotency-Key header with every
+retry of one request. The first request claims the key (a unique row) and runs;
+its response is stored in the same transaction as its writes, so they commit
+together and a retry costs one lookup that replays it. A retry arriving while
+the first request is still running gets 409; if that request died, its lock
+expires after IDEMPOTENCY_LOCK_SECONDS and the next retry takes over.
+Requests that fail write nothing and release the key, so they can be retried.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def request_hash(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def claim_key(user, key, fingerprint):
+    """
+    Claim `key` for the current request. Returns (record, None) when the
+    request should run, or (record, response) with the response to send instead.
+    """
+    now = timezone.now()
+    locked_until = now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)
+    record = IdempotencyKey.objects.filter(user=user, key=key).first()
+    if record is None:
+        try:
+            with transaction.atomic():
+                record = IdempotencyKey.objects.create(
+                    user=user, key=key, request_hash=fingerprint, locked_until=locked_until
+                )
+            return record, None
+        except IntegrityError:
+            # A concurrent request with the same key claimed it first
+            record = IdempotencyKey.objects.get(user=user, key=key)
+
+    if record.request_hash != fingerprint:
+        return record, Response(
+            {'error': 'This Idempotency-Key was already used for a different request.'},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    if record.response_status is not None:
+        return record, Response(record.response_body, status=record.response_status, headers={'Idempotent-Replayed': 'true'})
+
+    taken_over = IdempotencyKey.objects.filter(
+        pk=record.pk, response_status__isnull=True, locked_until__lte=now
+    ).update(locked_until=locked_until)
+    if not taken_over:
+        retry_after = max(1, int((record.locked_until - now).total_seconds())) if record.locked_until else 1
+        return record, Response(
+            {'error': 'A request with this Idempotency-Key is still in progress.'},
+            status=status.HTTP_409_CONFLICT,
+            headers={'Retry-After': str(retry_after)},
+        )
+    return record, None
+
+
+class IdempotentCreateMixin:
+    """
+    Make `create` idempotent for requests carrying an Idempotency-Key header.
+    Requests without the header are handled as before.
+    """
+
+    def create(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return super().create(request, *args, **kwargs)
+        if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+            return Response({'error': 'Idempotency-Key is too long.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        record, response = claim_key(request.user, key, request_hash(request))
+        if response is not None:
+            return response
+
+        try:
+            with transaction.atomic():
+                response = super().create(request, *args, **kwargs)
+                IdempotencyKey.objects.filter(pk=record.pk).update(
+                    response_status=response.status_code,
+                    response_body=response.data,
+                    locked_until=None,
+                )
+        except Exception:
+            # Nothing was written: let a retry run the request again
+            record.delete()
+            raise
+        return response
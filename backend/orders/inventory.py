@@ -0,0 +1,178 @@
+"""
+Stock reservations.
+
+Product.quantity is the stock still available for sale. Checkout and order
+placement withdraw from it through take_stock(), which locks the product rows
+in id order (so concurrent checkouts queue behind each other instead of
+deadlocking) and then applies a single conditional
+UPDATE ... SET quantity = quantity - n WHERE quantity >= n.
+
+A checkout step can hold the cart's stock for STOCK_RESERVATION_TTL seconds
+(hold_stock). Placing the order commits the holds and settles any difference
+with the ordered quantities (commit_stock); holds that are never used are
+returned by release_expired_reservations, run by the release_stock_reservations
+command, and cancelled orders give theirs back (release_order_stock). Products
+without a quantity (services) are not stock-tracked.
+"""
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When
+from django.utils import timezone
+from products.models import Product
+from .models import OrderItem, StockReservation
+
+
+class InsufficientStock(Exception):
+    def __init__(self, shortages):
+        # {product_id: quantity still available}
+        self.shortages = shortages
+        super().__init__(f"Insufficient stock for products: {', '.join(str(pk) for pk in sorted(shortages))}")
+
+    @property
+    def messages(self):
+        return [
+            f"Only {available} left of product {product_id}."
+            for product_id, available in sorted(self.shortages.items())
+        ]
+
+
+def take_stock(changes):
+    """
+    Withdraw {product_id: quantity} from stock; negative quantities put stock back.
+
+    Either every change is applied or, when a product does not have enough
+    left, none are and InsufficientStock is raised. Costs two queries however
+    many products are involved.
+    """
+    changes = {product_id: quantity for product_id, quantity in changes.items() if quantity}
+    if not changes:
+        return
+
+    with transaction.atomic():
+        # Lock the rows in id order so overlapping checkouts cannot deadlock
+        stock = dict(
+            Product.objects.select_for_update()
+            .filter(pk__in=changes, quantity__isnull=False)
+            .order_by('pk')
+            .values_list('pk', 'quantity')
+        )
+        shortages = {
+            product_id: available for product_id, available in stock.items()
+            if changes[product_id] > available
+        }
+        if shortages:
+            raise InsufficientStock(shortages)
+        if not stock:
+            return
+
+        updated = Product.objects.filter(
+            reduce(or_, [Q(pk=product_id, quantity__gte=changes[product_id]) for product_id in stock])
+        ).update(
+            quantity=F('quantity') - Case(
+                *[When(pk=product_id, then=Value(changes[product_id])) for product_id in stock],
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+        )
+        if updated != len(stock):
+            # Unreachable while the rows are locked, but never oversell
+            raise InsufficientStock({
+                product_id: available
+                for product_id, available in Product.objects.filter(pk__in=stock).values_list('pk', 'quantity')
+                if available is not None and changes[product_id] > available
+            })
+
+
+def return_stock(quantities):
+    """Put {product_id: quantity} back into stock."""
+    take_stock({product_id: -quantity for product_id, quantity in quantities.items()})
+
+
+def _held(user):
+    """Lock the user's current holds; returns them with their total per product."""
+    holds = list(StockReservation.objects.select_for_update().filter(user=user, status='held').order_by('pk'))
+    quantities = {}
+    for hold in holds:
+        quantities[hold.product_id] = quantities.get(hold.product_id, 0) + hold.quantity
+    return holds, quantities
+
+
+def _difference(wanted, held):
+    return {
+        product_id: wanted.get(product_id, 0) - held.get(product_id, 0)
+        for product_id in wanted.keys() | held.keys()
+    }
+
+
+def hold_stock(user, quantities, ttl=None):
+    """
+    Hold {product_id: quantity} for `user` for `ttl` seconds, replacing the
+    user's previous holds. Only the difference is taken from stock.
+    """
+    ttl = settings.STOCK_RESERVATION_TTL if ttl is None else ttl
+    expires_at = timezone.now() + timedelta(seconds=ttl)
+    with transaction.atomic():
+        holds, held = _held(user)
+        take_stock(_difference(quantities, held))
+        StockReservation.objects.filter(pk__in=[hold.pk for hold in holds]).update(status='released')
+        return StockReservation.objects.bulk_create([
+            StockReservation(user=user, product_id=product_id, quantity=quantity, expires_at=expires_at)
+            for product_id, quantity in sorted(quantities.items()) if quantity > 0
+        ])
+
+
+def commit_stock(order, quantities):
+    """
+    Withdraw {product_id: quantity} for `order`, using the customer's holds
+    first (expired ones too, as long as they have not been swept yet) and
+    returning whatever they held beyond the order.
+    """
+    with transaction.atomic():
+        holds, held = _held(order.customer)
+        take_stock(_difference(quantities, held))
+        StockReservation.objects.filter(pk__in=[hold.pk for hold in holds]).update(status='committed', order=order)
+
+
+def release_holds(user):
+    """Give up all of the user's holds."""
+    with transaction.atomic():
+        holds, held = _held(user)
+        return_stock(held)
+        return StockReservation.objects.filter(pk__in=[hold.pk for hold in holds]).update(status='released')
+
+
+def release_order_stock(order_ids):
+    """Put the items of cancelled orders back into stock. Returns {product_id: quantity} of those items."""
+    quantities = dict(
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .values('product_id').annotate(total=Sum('quantity'))
+        .values_list('product_id', 'total')
+    )
+    return_stock(quantities)
+    return quantities
+
+
+def release_expired_reservations(batch_size=1000):
+    """Return the stock of expired holds to sale. Returns the number of holds released."""
+    released = 0
+    now = timezone.now()
+    while True:
+        with transaction.atomic():
+            # Holds being committed or replaced right now are locked: leave them to that transaction
+            expired = list(
+                StockReservation.objects.select_for_update(skip_locked=True)
+                .filter(status='held', expires_at__lte=now)
+                .order_by('pk')
+                .values_list('pk', 'product_id', 'quantity')[:batch_size]
+            )
+            if not expired:
+                return released
+            quantities = {}
+            for _, product_id, quantity in expired:
+                quantities[product_id] = quantities.get(product_id, 0) + quantity
+            return_stock(quantities)
+            StockReservation.objects.filter(pk__in=[pk for pk, _, _ in expired]).update(status='released')
+        released += len(expired)
@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from orders.carts import RedisCartBackend, get_cart_backend
+
+
+class Command(BaseCommand):
+    help = 'Write idle carts from the Redis cart backend back to the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Flush every changed cart, idle or not')
+
+    def handle(self, *args, **options):
+        backend = get_cart_backend()
+        if not isinstance(backend, RedisCartBackend):
+            self.stdout.write(f"CART_BACKEND is '{settings.CART_BACKEND}'; carts are already stored in the database.")
+            return
+
+        flushed = backend.flush_idle(0 if options['all'] else None)
+        self.stdout.write(self.style.SUCCESS(f'Flushed {flushed} carts.'))
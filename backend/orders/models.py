@@ -1,8 +1,46 @@
 from decimal import Decimal
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, models, transaction
+from campus_delivery.ulid import new_ulid
 from users.models import User
 from products.models import Product
 
+def new_order_reference():
+    """
+    Unique, time-ordered order reference (e.g. ORD-01J9Z3K6W8R5T2V4X6Y8Z0A2B4),
+    generated without a database round trip.
+    """
+    return f'ORD-{new_ulid()}'
+
+class OrderQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """Customers see their own orders, vendors orders containing their products, admins all."""
+        if user.role == 'admin':
+            return self
+        if user.role == 'vendor':
+            return self.filter(models.Exists(
+                OrderItem.objects.filter(order=models.OuterRef('pk'), product__vendor=user)
+            ))
+        return self.filter(customer=user)
+
+    def with_items(self, full_products=False):
+        """
+        Prefetch the items and their products for every order at once: two
+        queries for a page of orders however many there are, plus one per
+        product M2M relation when full products are rendered.
+        """
+        if full_products:
+            items = OrderItem.objects.select_related('product__category', 'product__subcategory', 'product__brand')
+            return self.prefetch_related(
+                models.Prefetch('items', queryset=items),
+                'items__product__colors', 'items__product__sizes', 'items__product__detail_images',
+            )
+        # Product summaries do not read the large text columns
+        items = OrderItem.objects.select_related('product').defer(
+            'product__description', 'product__additional_information', 'product__search_vector'
+        )
+        return self.prefetch_related(models.Prefetch('items', queryset=items))
+
 class Order(models.Model):
     STATUS_CHOICES = (
         ('order_placed', 'Order Placed'),
@@ -18,11 +56,23 @@ class Order(models.Model):
     customer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
     delivery_person = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='assigned_orders')
     total_price = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    coupon = models.ForeignKey('Coupon', on_delete=models.SET_NULL, null=True, blank=True, related_name='orders')
+    discount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    delivery_fee = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
 
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='order_placed')
     reference = models.CharField(max_length=100, unique=True, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id']),
+            # A customer's order history, newest first (cursor pagination)
+            models.Index(fields=['customer', '-created_at', '-id']),
+        ]
+
     def __str__(self):
         if self.customer:
             return f"Order {self.pk} by {self.customer.first_name} {self.customer.last_name}"
@@ -33,10 +83,99 @@ class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField()
+    # Unit price when the order was placed, so later price changes do not alter the order
+    price = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
 
     def __str__(self):
         return f"{self.quantity} x {self.product.name} in Order {self.order.pk}"
 
+class OrderStatusTransition(models.Model):
+    """
+    Append-only log of the status changes of an order, its delivery and its
+    assignment, written by orders/transitions.py.
+    """
+    KIND_CHOICES = (
+        ('order', 'Order'),
+        ('delivery', 'Delivery'),
+        ('assignment', 'Assignment'),
+    )
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='status_transitions')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='order')
+    from_status = models.CharField(max_length=20)
+    to_status = models.CharField(max_length=20)
+    actor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    note = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['order', 'created_at']),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError("Status transitions are append-only.")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.kind} of order {self.order_id}: {self.from_status} -> {self.to_status}"
+
+class StockReservation(models.Model):
+    """
+    Stock withdrawn from Product.quantity for a customer, either held for a cart
+    at checkout until `expires_at` or committed to an order (see orders/inventory.py).
+    """
+    STATUS_CHOICES = (
+        ('held', 'Held'),
+        ('committed', 'Committed'),
+        ('released', 'Released'),
+    )
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stock_reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    order = models.ForeignKey(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='held')
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # The user's current holds, and the sweeper's scan for expired ones
+            models.Index(fields=['user', 'status']),
+            models.Index(fields=['status', 'expires_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} {self.status} for {self.user_id}"
+
+class IdempotencyKey(models.Model):
+    """
+    An Idempotency-Key sent with a POST, and the response it produced.
+    Retries with the same key get that response back (see orders/idempotency.py).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    # Hash of method, path and body: a key may not be reused for a different request
+    request_hash = models.CharField(max_length=64)
+    # Set while the first request is in flight; taken over by a retry once it passes
+    locked_until = models.DateTimeField(null=True, blank=True)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key_per_user'),
+        ]
+        indexes = [
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.response_status or 'in progress'})"
+
 class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='carts', null=True, blank=True)
     session_key = models.CharField(max_length=40, null=True, blank=True, unique=True)
@@ -49,11 +188,41 @@ class Cart(models.Model):
             return f"Cart of {self.user.full_name}"
         return f"Anonymous Cart {self.session_key or self.pk}"
 
+    def merge(self, other):
+        """
+        Move every item of `other` into this cart and delete `other`.
+
+        A single INSERT ... SELECT ... ON CONFLICT copies all lines at once,
+        adding quantities for products already in this cart, so the cost does
+        not depend on how many items the carts hold.
+        """
+        items = connection.ops.quote_name(CartItem._meta.db_table)
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    INSERT INTO {items} (cart_id, product_id, quantity)
+                    SELECT %s, product_id, quantity FROM {items} WHERE cart_id = %s
+                    ON CONFLICT (cart_id, product_id)
+                    DO UPDATE SET quantity = {items}.quantity + EXCLUDED.quantity
+                    """,
+                    [self.pk, other.pk],
+                )
+            CartItem.objects.filter(cart=other).delete()
+            Cart.objects.filter(pk=other.pk).delete()
+            self.save(update_fields=['updated_at'])
+
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=0)
 
+    class Meta:
+        constraints = [
+            # One line per product; Cart.merge relies on it for ON CONFLICT
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_item_product'),
+        ]
+
     def __str__(self):
         return f"{self.quantity} x {self.product.name} in Cart {self.cart.pk}"
 
@@ -62,8 +231,28 @@ class Coupon(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     discount_percent = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
     active = models.BooleanField(default=True)
+    # Optional validity window and usage limits (enforced by orders/coupons.py)
+    valid_from = models.DateTimeField(null=True, blank=True)
+    valid_until = models.DateTimeField(null=True, blank=True)
+    max_uses = models.PositiveIntegerField(null=True, blank=True)
+    max_uses_per_user = models.PositiveIntegerField(null=True, blank=True)
+    used_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.code
+
+class CouponUsage(models.Model):
+    """How many times a user has redeemed a coupon."""
+    coupon = models.ForeignKey(Coupon, on_delete=models.CASCADE, related_name='usages')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='coupon_usages')
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['coupon', 'user'], name='unique_coupon_usage_per_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.coupon.code} used {self.count} times by {self.user_id}"
@@ -24,3 +24,17 @@ class IsOrderOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         # Allow access if the user is the customer who placed the order
         return obj.customer == request.user
+
+class IsOrderParticipant(permissions.BasePermission):
+    """
+    The customer, a vendor with products in the order, its delivery person or an admin.
+    """
+    def has_object_permission(self, request, view, obj):
+        user = request.user
+        if user.role == 'admin' or user.pk in (obj.customer_id, obj.delivery_person_id):
+            return True
+        return user.role == 'vendor' and obj.items.filter(product__vendor=user).exists()
+
+class IsAdmin(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and request.user.role == 'admin'
@@ -0,0 +1,117 @@
+"""
+Cart and order pricing.
+
+price_lines() computes the line totals, the subtotal of each vendor, the
+coupon discount, the delivery fee and the total in one pass over the lines,
+with Decimal arithmetic throughout.
+
+quote_cart() prices a cart's contents and caches the quote under a key made
+from the contents, the coupon and the delivery point, so a cart that has not
+changed is priced once however often it is fetched, and checkout reuses the
+quote the customer was shown. Quotes embed the 'cart-quotes' and 'coupons'
+tag versions, which orders.signals bumps when a product or coupon changes.
+"""
+import hashlib
+import json
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from campus_delivery.cache import get_tag_version
+from delivery import fees
+from products.models import Product
+from .coupons import COUPON_CACHE_TAG, coupon_discount
+
+ZERO = Decimal('0.00')
+
+CART_QUOTE_TAG = 'cart-quotes'
+QUOTE_KEY = 'cart-quote:v{version}:{coupons}:{digest}'
+
+
+def price_lines(lines, coupon=None, delivery_fee=ZERO):
+    """
+    Price `lines`, a sequence of (product, quantity) pairs, at current product
+    prices, applying `coupon` to the subtotal and adding `delivery_fee`.
+    """
+    priced = []
+    vendors = {}
+    subtotal = ZERO
+    for product, quantity in lines:
+        line_total = product.price * quantity
+        subtotal += line_total
+        vendors[product.vendor_id] = vendors.get(product.vendor_id, ZERO) + line_total
+        priced.append({
+            'product_id': product.pk,
+            'vendor_id': product.vendor_id,
+            'quantity': quantity,
+            'unit_price': product.price,
+            'line_total': line_total,
+        })
+    discount = coupon_discount(coupon, subtotal) if coupon else ZERO
+    return {
+        'lines': priced,
+        'vendors': vendors,
+        'subtotal': subtotal,
+        'coupon': coupon.code if coupon else None,
+        'discount': discount,
+        'delivery_fee': delivery_fee,
+        'total': subtotal - discount + delivery_fee,
+    }
+
+
+def quote_key(quantities, coupon=None, destination=None):
+    contents = json.dumps({
+        'items': sorted(quantities.items()),
+        'coupon': coupon.code if coupon else None,
+        # The same precision delivery fees are cached at
+        'destination': [round(value, 4) for value in destination] if destination else None,
+    })
+    return QUOTE_KEY.format(
+        version=get_tag_version(CART_QUOTE_TAG),
+        coupons=get_tag_version(COUPON_CACHE_TAG),
+        digest=hashlib.sha256(contents.encode()).hexdigest(),
+    )
+
+
+def quote_cart(quantities, coupon=None, destination=None, products=None):
+    """
+    Price {product_id: quantity} with `coupon` and delivery to `destination`
+    ((lat, lng), or None for no delivery fee). `products` may supply the
+    products already loaded by the caller. Products no longer for sale are
+    listed under 'unavailable' and left out of the totals.
+
+    Raises delivery.fees.DeliveryFeeUnavailable when the fee cannot be computed.
+    """
+    key = quote_key(quantities, coupon, destination)
+    quote = cache.get(key)
+    # Re-price when the caller has loaded a product the cached quote left out as unavailable
+    if quote is not None and (products is None or not products.keys() & set(quote['unavailable'])):
+        return quote
+
+    if products is None:
+        products = Product.objects.filter(is_active=True).only('id', 'price', 'vendor_id').in_bulk(quantities)
+    fee = fees.delivery_fee(*destination) if destination else ZERO
+    quote = price_lines(
+        [(products[pk], quantity) for pk, quantity in sorted(quantities.items()) if pk in products], coupon, fee
+    )
+    quote['unavailable'] = sorted(pk for pk in quantities if pk not in products)
+    cache.set(key, quote, timeout=settings.CART_QUOTE_CACHE_TIMEOUT)
+    return quote
+
+
+def quote_data(quote):
+    """A quote as returned by the API, with amounts as strings."""
+    return {
+        'lines': [
+            {**line, 'unit_price': str(line['unit_price']), 'line_total': str(line['line_total'])}
+            for line in quote['lines']
+        ],
+        'vendors': [
+            {'vendor_id': vendor_id, 'subtotal': str(subtotal)} for vendor_id, subtotal in quote['vendors'].items()
+        ],
+        'unavailable': quote['unavailable'],
+        'subtotal': str(quote['subtotal']),
+        'coupon': quote['coupon'],
+        'discount': str(quote['discount']),
+        'delivery_fee': str(quote['delivery_fee']),
+        'total': str(quote['total']),
+    }
@@ -1,34 +1,151 @@
+import math
+from collections import defaultdict
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework import serializers
+from .coupons import CouponError, redeem, validate_coupon
+from .inventory import InsufficientStock, commit_stock
+from .pricing import quote_cart
 from .models import CartItem, Cart, Coupon, Order, OrderItem
-from products.serializers import ProductSerializer
+from products.models import Product
+from products.serializers import ProductRepresentationField
+from delivery.fees import DeliveryFeeUnavailable
+
+
+class CoordinateField(serializers.FloatField):
+    """A latitude or longitude: a finite number between min_value and max_value."""
+
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        if not math.isfinite(value):
+            self.fail('invalid')
+        return value
+
+
+class DeliveryPointSerializer(serializers.Serializer):
+    """The ?lat=..&lng=.. delivery point a cart is quoted for."""
+    lat = CoordinateField(min_value=-90, max_value=90)
+    lng = CoordinateField(min_value=-180, max_value=180)
+
+
+class CouponApplySerializer(serializers.Serializer):
+    """The code posted to coupon/apply/."""
+    code = serializers.CharField(max_length=50, error_messages={
+        'required': 'Coupon code is required',
+        'null': 'Coupon code is required',
+        'blank': 'Coupon code is required',
+        'invalid': 'Coupon code must be text',
+    })
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
-    product = ProductSerializer(read_only=True)
-    product_id = serializers.PrimaryKeyRelatedField(
-        queryset=ProductSerializer.Meta.model.objects.all(),
-        source='product',
-        write_only=True
-    )
+    product = ProductRepresentationField()
+    # Resolved for all items at once by OrderSerializer.validate_items
+    product_id = serializers.IntegerField(write_only=True)
+    quantity = serializers.IntegerField(min_value=1)
 
     class Meta:
         model = OrderItem
-        fields = ['id', 'product', 'product_id', 'quantity']
+        fields = ['id', 'product', 'product_id', 'quantity', 'price']
+        read_only_fields = ['id', 'price']
 
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True)  # Removed write_only=True to make readable
-    total_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    # Computed from current product prices; any client-supplied value is ignored
+    total_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    coupon_code = serializers.CharField(max_length=50, write_only=True, required=False, allow_blank=True)
+    # Delivery point the fee is charged for; orders without one pay no delivery fee
+    delivery_lat = CoordinateField(write_only=True, required=False, min_value=-90, max_value=90)
+    delivery_lng = CoordinateField(write_only=True, required=False, min_value=-180, max_value=180)
 
     class Meta:
         model = Order
-        fields = ['id', 'customer', 'total_price', 'status', 'created_at', 'items']
-        read_only_fields = ['id', 'customer', 'status', 'created_at']
+        fields = [
+            'id', 'reference', 'customer', 'total_price', 'discount', 'delivery_fee', 'coupon_code',
+            'delivery_lat', 'delivery_lng', 'status', 'created_at', 'items',
+        ]
+        read_only_fields = ['id', 'reference', 'customer', 'discount', 'delivery_fee', 'status', 'created_at']
+
+    def validate_coupon_code(self, code):
+        if not code.strip():
+            return None
+        try:
+            return validate_coupon(code)
+        except CouponError as e:
+            raise serializers.ValidationError(str(e))
+
+    def validate_items(self, items):
+        if not items:
+            raise serializers.ValidationError("An order needs at least one item.")
+        # One query for every product and price in the order
+        product_ids = {item['product_id'] for item in items}
+        products = Product.objects.filter(is_active=True).in_bulk(product_ids)
+        missing = product_ids - products.keys()
+        if missing:
+            raise serializers.ValidationError(
+                f"Unknown or unavailable products: {', '.join(str(pk) for pk in sorted(missing))}."
+            )
+        for item in items:
+            item['product'] = products[item.pop('product_id')]
+        return items
+
+    def validate(self, data):
+        if ('delivery_lat' in data) != ('delivery_lng' in data):
+            raise serializers.ValidationError("delivery_lat and delivery_lng must be given together.")
+        return data
 
     def create(self, validated_data):
         items_data = validated_data.pop('items')
-        order = Order.objects.create(**validated_data)
-        for item_data in items_data:
-            OrderItem.objects.create(order=order, **item_data)
+        coupon = validated_data.pop('coupon_code', None)
+        destination = None
+        if 'delivery_lat' in validated_data:
+            destination = (validated_data.pop('delivery_lat'), validated_data.pop('delivery_lng'))
+
+        # The quote shown with the cart (GET /api/cart/) when it is still current
+        quantities = defaultdict(int)
+        for item in items_data:
+            quantities[item['product'].pk] += item['quantity']
+        try:
+            quote = quote_cart(quantities, coupon, destination, {item['product'].pk: item['product'] for item in items_data})
+        except DeliveryFeeUnavailable as e:
+            raise serializers.ValidationError({'delivery_fee': [str(e)]})
+        unit_prices = {line['product_id']: line['unit_price'] for line in quote['lines']}
+        lines = [
+            OrderItem(product=item['product'], quantity=item['quantity'], price=unit_prices[item['product'].pk])
+            for item in items_data
+        ]
+        validated_data.update(
+            total_price=quote['total'], discount=quote['discount'], delivery_fee=quote['delivery_fee'], coupon=coupon
+        )
+
+        # Order and items commit together; orders.signals defers its side effects until then
+        with transaction.atomic():
+            if coupon:
+                try:
+                    redeem(coupon, validated_data['customer'])
+                except CouponError as e:
+                    raise serializers.ValidationError({'coupon_code': [str(e)]})
+            order = Order.objects.create(**validated_data)
+            for line in lines:
+                line.order = order
+            OrderItem.objects.bulk_create(lines)
+
+            sold = defaultdict(int)
+            for line in lines:
+                sold[line.product_id] += line.quantity
+
+            # Raising here rolls the order back with the stock. Stock is taken first: it locks
+            # the product rows in id order before anything else in this transaction writes them
+            try:
+                commit_stock(order, sold)
+            except InsufficientStock as e:
+                raise serializers.ValidationError({'items': e.messages})
+
+            # bulk_create skips the OrderItem post_save handler that maintains sales_count
+            Product.objects.record_sales(sold)
+
+        # The response lists the items with their products: load them in one query
+        prefetch_related_objects([order], Prefetch('items', queryset=OrderItem.objects.select_related('product')))
         return order
 
 class OrderStatusSerializer(serializers.ModelSerializer):
@@ -36,8 +153,19 @@ class OrderStatusSerializer(serializers.ModelSerializer):
         model = Order
         fields = ['status']
 
+    def validate(self, attrs):
+        # PATCH makes every field optional, but there is nothing to update without a status
+        if 'status' not in attrs:
+            raise serializers.ValidationError({'status': ['This field is required.']})
+        return attrs
+
+class OrderBulkStatusSerializer(serializers.Serializer):
+    order_ids = serializers.ListField(child=serializers.IntegerField(), allow_empty=False, max_length=1000)
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES)
+    note = serializers.CharField(max_length=255, required=False, default='')
+
 class CartItemSerializer(serializers.ModelSerializer):
-    product = ProductSerializer(read_only=True)
+    product = ProductRepresentationField()
 
     class Meta:
         model = CartItem
@@ -54,8 +182,11 @@ class CartSerializer(serializers.ModelSerializer):
 class CouponSerializer(serializers.ModelSerializer):
     class Meta:
         model = Coupon
-        fields = ['id', 'code', 'amount', 'discount_percent', 'active', 'created_at', 'updated_at']
-        read_only_fields = ['id', 'created_at', 'updated_at']
+        fields = [
+            'id', 'code', 'amount', 'discount_percent', 'active', 'valid_from', 'valid_until',
+            'max_uses', 'max_uses_per_user', 'used_count', 'created_at', 'updated_at',
+        ]
+        read_only_fields = ['id', 'used_count', 'created_at', 'updated_at']
 
 
 
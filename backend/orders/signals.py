@@ -1,10 +1,20 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from .models import Order, OrderItem
+from campus_delivery.cache import invalidate_tags
+from .coupons import COUPON_CACHE_TAG
+from .pricing import CART_QUOTE_TAG
+from .models import Coupon, Order, OrderItem
+from products.models import Product
 from notifications.models import Notification
 from delivery.models import Delivery, DeliveryPersonProfile
 from users.models import User
+from django.conf import settings
+from datetime import timedelta
+from django.utils import timezone
+from delivery.candidates import nearby_riders, pickup_point, unlocated_riders
 from delivery.services import send_new_order_whatsapp_alert
+from notifications import outbox
+from notifications.services import notification_service
 
 from .whatsapp_notifications import send_admin_whatsapp_notification
 import logging
@@ -30,6 +40,20 @@ def order_created_handler(sender, instance, created, **kwargs):
     else:
         logger.warning(f"Order {instance.id} status is '{instance.status}', not 'order_placed'. Skipping delivery creation.")
 
+    # Notifications are sent by the outbox worker, once the order and its items are
+    # committed: checkout neither waits for them nor fails with them
+    outbox.enqueue('order_placed', order_id=instance.pk)
+
+
+@outbox.handler('order_placed')
+def order_placed_message(payload):
+    order = Order.objects.select_related('customer').filter(pk=payload['order_id']).first()
+    if order is not None:
+        notify_order_placed(order)
+
+
+def notify_order_placed(instance):
+    """Vendor and customer notifications for a new order; the admin and delivery persons get outbox messages of their own."""
     # Check if order has items, log if not but continue with admin notifications
     if not instance.items.exists():
         logger.warning(f"Order {instance.id} created without items - will proceed with admin notifications but skip vendor/customer notifications")
@@ -37,25 +61,15 @@ def order_created_handler(sender, instance, created, **kwargs):
         pass
 
     # Send WhatsApp notification to admin for all relevant order statuses
-    # This is sent regardless of whether items exist to ensure admin is notified of order placement
+    # This is sent regardless of whether items exist to ensure admin is notified of order placement.
+    # It is an outbox message of its own, so a failed send is retried without repeating the rest
     if instance.status in ['paid', 'order_placed', 'pending']:
-        logger.info(f"Sending WhatsApp notification to admin for order {instance.id} with status {instance.status}")
-        
-        try:
-            # Use the centralized WhatsApp notification service
-            message_sid = send_admin_whatsapp_notification(instance, "new_order")
-            if message_sid:
-                logger.info(f"WhatsApp notification sent successfully for order {instance.id}: {message_sid}")
-            else:
-                logger.warning(f"WhatsApp notification failed for order {instance.id}")
-        except Exception as e:
-            logger.error(f"Failed to send WhatsApp notification for order {instance.id}: {e}")
+        outbox.enqueue('admin_order_whatsapp', order_id=instance.pk)
 
-    # Send WhatsApp notification to all delivery persons
-    if instance.status == 'order_placed':
-        delivery_persons = User.objects.filter(role='delivery_person', is_active=True)
-        for person in delivery_persons:
-            send_new_order_whatsapp_alert(person, instance)
+    # Alert the best placed delivery persons, widening the search until one accepts
+    # (with ORDER_DISPATCH 'assign', dispatch_orders offers the order to one of them instead)
+    if instance.status == 'order_placed' and settings.ORDER_DISPATCH == 'broadcast':
+        outbox.enqueue('rider_broadcast', order_id=instance.pk, ring=0, notified=[])
 
     # Continue with vendor and customer notifications only if items exist
     if not instance.items.exists():
@@ -68,10 +82,10 @@ def order_created_handler(sender, instance, created, **kwargs):
         return
 
     vendor = first_item.product.vendor
-    if vendor and vendor.user:
+    if vendor:
         try:
             Notification.objects.create(
-                recipient=vendor.user,
+                recipient=vendor,
                 type='order_placed',
                 message=f"New order received: #{instance.id}",
                 channel='in_app',
@@ -97,3 +111,95 @@ def order_created_handler(sender, instance, created, **kwargs):
             logger.error(f"Error notifying customer for order {instance.id}: {e}")
     else:
         logger.warning(f"Order {instance.id} has no associated customer")
+
+
+@outbox.handler('admin_order_whatsapp')
+def admin_order_whatsapp_message(payload):
+    order = Order.objects.select_related('customer').filter(pk=payload['order_id']).first()
+    if order is None:
+        return
+    if notification_service.client is None:
+        logger.warning(f"Twilio is not configured; skipping admin WhatsApp notification for order {order.pk}")
+        return
+    logger.info(f"Sending WhatsApp notification to admin for order {order.pk} with status {order.status}")
+    if send_admin_whatsapp_notification(order, "new_order") is None:
+        # Raising retries the message later
+        raise RuntimeError(f"Admin WhatsApp notification for order {order.pk} was not sent")
+
+
+@outbox.handler('rider_broadcast')
+def rider_broadcast_message(payload):
+    """
+    Alert the top riders within ring `ring` of RIDER_BROADCAST_RINGS_KM (the next
+    ring when that one has nobody left to alert), then check again a ring wider
+    after RIDER_BROADCAST_RING_SECONDS unless the order has been taken by then.
+    Past the last ring, or when no located rider is in reach, riders are
+    alerted regardless of location (see unlocated_riders). Checks continue
+    until the order is taken or RIDER_BROADCAST_MAX_SECONDS have passed.
+    """
+    order = Order.objects.filter(pk=payload['order_id'], status='order_placed').first()
+    if order is None:
+        # Accepted or cancelled
+        return
+    rings = settings.RIDER_BROADCAST_RINGS_KM
+    notified = payload['notified']
+    lat, lng = pickup_point(order)
+    riders = []
+    ring = payload['ring']
+    while ring < len(rings):
+        riders = nearby_riders(lat, lng, rings[ring], settings.RIDER_BROADCAST_SIZE, exclude=notified)
+        if riders:
+            logger.info(f"Order {order.pk} offered to {len(riders)} delivery persons within {rings[ring]} km")
+            break
+        ring += 1
+    else:
+        riders = unlocated_riders(settings.RIDER_BROADCAST_SIZE, exclude=notified)
+        if riders:
+            logger.info(f"Order {order.pk} offered to {len(riders)} delivery persons without a location in reach")
+
+    if riders:
+        outbox.enqueue_many('rider_order_alert', [{'order_id': order.pk, 'user_id': rider['user_id']} for rider in riders])
+        notified = notified + [rider['user_id'] for rider in riders]
+    if timezone.now() - order.created_at >= timedelta(seconds=settings.RIDER_BROADCAST_MAX_SECONDS):
+        logger.warning(f"Order {order.pk} is still not accepted; no more delivery persons will be alerted about it")
+        return
+    # Riders who come online later are alerted by the next check
+    outbox.schedule(
+        'rider_broadcast', settings.RIDER_BROADCAST_RING_SECONDS,
+        order_id=order.pk, ring=min(ring + 1, len(rings)), notified=notified,
+    )
+
+
+@outbox.handler('rider_order_alert')
+def rider_order_alert_message(payload):
+    order = Order.objects.filter(pk=payload['order_id'], status='order_placed').first()
+    person = User.objects.filter(pk=payload['user_id'], is_active=True).first()
+    if order is None or person is None:
+        # Taken or cancelled since, or the delivery person left
+        return
+    if notification_service.client is None:
+        logger.warning(f"Twilio is not configured; skipping new order alert for order {order.pk} to user {person.pk}")
+        return
+    if person.phone and send_new_order_whatsapp_alert(person, order) is None:
+        # Raising retries the message later
+        raise RuntimeError(f"New order alert for order {order.pk} to user {person.pk} was not sent")
+
+
+@receiver(post_save, sender=OrderItem)
+def order_item_created_handler(sender, instance, created, **kwargs):
+    # Keep Product.sales_count current for the best_sellers sort
+    if created:
+        Product.objects.record_sales({instance.product_id: instance.quantity})
+
+
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+def invalidate_coupon_cache(sender, **kwargs):
+    invalidate_tags(COUPON_CACHE_TAG)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_cart_quotes(sender, **kwargs):
+    # Quotes hold product prices and availability
+    invalidate_tags(CART_QUOTE_TAG)
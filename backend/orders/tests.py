@@ -1,9 +1,30 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from django.db import IntegrityError, connection, transaction
+from io import StringIO
+from decimal import Decimal
+from unittest.mock import patch
+from types import SimpleNamespace
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 from users.models import User
-from products.models import Product
+from products.models import Category, Product
 from rest_framework import serializers
-from .models import Order, OrderItem
+from .carts import get_cart_backend
+from . import coupons, pricing
+from campus_delivery.cache import get_tag_version
+from campus_delivery.ulid import ULIDGenerator, new_ulid, ulid_datetime
+from delivery.fees import SHOP_LAT, SHOP_LNG, DeliveryFeeUnavailable
+from delivery.models import Delivery, DeliveryPersonProfile, OrderAssignment
+from notifications.models import OutboxMessage
+from notifications.outbox import process_outbox
+from notifications.services import notification_service
+from .models import Cart, CartItem, Coupon, CouponUsage, IdempotencyKey, Order, OrderItem, OrderStatusTransition, StockReservation
 
 class OrderTests(TestCase):
     def setUp(self):
@@ -58,13 +79,1189 @@ class OrderTests(TestCase):
         order = Order.objects.create(customer=self.customer, total_price=20.00)
         OrderItem.objects.create(order=order, product=self.product, quantity=2)
         self.client.force_authenticate(user=self.vendor)
-        response = self.client.put(f'/api/orders/{order.id}/status/', {'status': 'delivered'})
+        response = self.client.put(f'/api/orders/{order.id}/status/', {'status': 'accepted'})
         self.assertEqual(response.status_code, 200)
         order.refresh_from_db()
-        self.assertEqual(order.status, 'delivered')
+        self.assertEqual(order.status, 'accepted')
 
     def test_unauthorized_status_update(self):
         order = Order.objects.create(customer=self.customer, total_price=20.00)
         self.client.force_authenticate(user=self.customer)
         response = self.client.put(f'/api/orders/{order.id}/status/', {'status': 'delivered'})
         self.assertEqual(response.status_code, 403)
+
+
+class OrderItemProductRepresentationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.customer = User.objects.create_user(
+            email='summary-customer@example.com',
+            password='testpass123',
+            first_name='Summary',
+            last_name='Customer',
+            phone='0711000101',
+            role='customer'
+        )
+        self.vendor = User.objects.create_user(
+            email='summary-vendor@example.com',
+            password='testpass123',
+            first_name='Summary',
+            last_name='Vendor',
+            phone='0711000102',
+            role='vendor',
+            is_approved=True
+        )
+        category = Category.objects.create(name='Summary Category', category_type='product')
+        self.product = Product.objects.create(
+            vendor=self.vendor, name='Summary Product', price=15, quantity=7,
+            category=category, description='A long description'
+        )
+        self.order = Order.objects.create(customer=self.customer, total_price=30)
+        OrderItem.objects.create(order=self.order, product=self.product, quantity=2)
+        self.client.force_authenticate(user=self.customer)
+
+    def test_order_items_embed_product_summary(self):
+        response = self.client.get(f'/api/orders/{self.order.id}/')
+        self.assertEqual(response.status_code, 200)
+        product = response.data['items'][0]['product']
+        self.assertEqual(set(product), {'id', 'name', 'price', 'thumbnail', 'rating', 'stock', 'vendor_id'})
+        self.assertEqual(product['vendor_id'], self.vendor.id)
+
+    def test_full_product_on_request(self):
+        response = self.client.get(f'/api/orders/{self.order.id}/', {'fields': 'full'})
+        product = response.data['items'][0]['product']
+        self.assertEqual(product['description'], 'A long description')
+        self.assertEqual(product['category']['name'], 'Summary Category')
+
+    def test_cart_items_embed_product_summary(self):
+        self.client.post('/api/cart/', {'product_id': self.product.id, 'quantity': 1})
+        item = self.client.get('/api/cart/').data['cart']['items'][0]
+        self.assertEqual(item['product']['stock'], 7)
+        self.assertNotIn('description', item['product'])
+
+
+class CartMergeTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.customer = User.objects.create_user(
+            email='merge-customer@example.com',
+            password='testpass123',
+            first_name='Merge',
+            last_name='Customer',
+            phone='0711000111',
+            role='customer'
+        )
+        vendor = User.objects.create_user(
+            email='merge-vendor@example.com',
+            password='testpass123',
+            first_name='Merge',
+            last_name='Vendor',
+            phone='0711000112',
+            role='vendor',
+            is_approved=True
+        )
+        category = Category.objects.create(name='Merge Category', category_type='product')
+        self.products = [
+            Product.objects.create(vendor=vendor, name=f'Merge Product {i}', price=10, quantity=50, category=category)
+            for i in range(25)
+        ]
+
+    def guest_cart(self, products, quantity=1):
+        # Build an anonymous cart through the API so it is tied to the client's session
+        for product in products:
+            self.client.post('/api/cart/', {'product_id': product.id, 'quantity': quantity})
+        return Cart.objects.get(user=None)
+
+    def test_merge_adds_quantities_and_deletes_session_cart(self):
+        user_cart = Cart.objects.create(user=self.customer)
+        CartItem.objects.create(cart=user_cart, product=self.products[0], quantity=2)
+        session_cart = self.guest_cart(self.products[:3], quantity=3)
+
+        self.client.force_authenticate(user=self.customer)
+        response = self.client.get('/api/cart/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['cart']['id'], user_cart.id)
+        quantities = {item['product']['id']: item['quantity'] for item in response.data['cart']['items']}
+        self.assertEqual(quantities, {self.products[0].id: 5, self.products[1].id: 3, self.products[2].id: 3})
+        self.assertFalse(Cart.objects.filter(pk=session_cart.pk).exists())
+
+    def test_first_login_adopts_session_cart(self):
+        session_cart = self.guest_cart(self.products[:2])
+        self.client.force_authenticate(user=self.customer)
+        response = self.client.get('/api/cart/')
+        self.assertEqual(response.data['cart']['id'], session_cart.id)
+        session_cart.refresh_from_db()
+        self.assertEqual((session_cart.user, session_cart.session_key), (self.customer, None))
+        self.assertEqual(len(response.data['cart']['items']), 2)
+
+    def test_merge_query_count_does_not_grow_with_cart_size(self):
+        def merge_queries(products):
+            Cart.objects.all().delete()
+            user_cart = Cart.objects.create(user=self.customer)
+            CartItem.objects.create(cart=user_cart, product=products[0], quantity=1)
+            self.client.force_authenticate(user=None)
+            self.guest_cart(products)
+            self.client.force_authenticate(user=self.customer)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/api/cart/')
+            self.assertEqual(len(response.data['cart']['items']), len(products))
+            return len(queries)
+
+        self.assertEqual(merge_queries(self.products[:2]), merge_queries(self.products))
+
+    def test_duplicate_lines_are_rejected(self):
+        cart = Cart.objects.create(user=self.customer)
+        CartItem.objects.create(cart=cart, product=self.products[0], quantity=1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CartItem.objects.create(cart=cart, product=self.products[0], quantity=1)
+
+
+@override_settings(CART_BACKEND='redis', CART_REDIS_URL=None)
+class RedisCartBackendTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.redis = get_cart_backend().client
+        self.redis.flushall()
+        self.customer = User.objects.create_user(
+            email='redis-customer@example.com',
+            password='testpass123',
+            first_name='Redis',
+            last_name='Customer',
+            phone='0711000121',
+            role='customer'
+        )
+        vendor = User.objects.create_user(
+            email='redis-vendor@example.com',
+            password='testpass123',
+            first_name='Redis',
+            last_name='Vendor',
+            phone='0711000122',
+            role='vendor',
+            is_approved=True
+        )
+        category = Category.objects.create(name='Redis Category', category_type='product')
+        self.apple, self.pear = [
+            Product.objects.create(vendor=vendor, name=name, price=10, quantity=50, category=category)
+            for name in ('Apple', 'Pear')
+        ]
+
+    def quantities(self, response):
+        return {item['product']['id']: item['quantity'] for item in response.data['cart']['items']}
+
+    def flush_all(self):
+        call_command('flush_carts', all=True, stdout=StringIO())
+
+    def test_adds_stay_in_redis_until_flushed(self):
+        self.client.post('/api/cart/', {'product_id': self.apple.id, 'quantity': 2})
+        response = self.client.post('/api/cart/', {'product_id': self.apple.id, 'quantity': 1})
+        self.assertEqual(response.data['added_product']['quantity'], 3)
+        self.assertEqual(self.quantities(response), {self.apple.id: 3})
+        self.assertEqual(set(response.data['cart']), {'id', 'user', 'items', 'created_at', 'updated_at'})
+        self.assertFalse(CartItem.objects.exists())
+
+        self.flush_all()
+        item = CartItem.objects.get()
+        self.assertEqual((item.product, item.quantity), (self.apple, 3))
+        self.assertIsNone(item.cart.user)
+
+        self.client.delete('/api/cart/', {'product_id': self.apple.id}, format='json')
+        self.flush_all()
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_idle_flush_skips_recent_carts(self):
+        self.client.post('/api/cart/', {'product_id': self.apple.id, 'quantity': 1})
+        self.assertEqual(get_cart_backend().flush_idle(), 0)
+        self.assertEqual(get_cart_backend().flush_idle(0), 1)
+        self.assertTrue(CartItem.objects.exists())
+
+    def test_login_merges_session_cart(self):
+        self.client.post('/api/cart/', {'product_id': self.apple.id, 'quantity': 2})
+        self.flush_all()  # the guest cart also exists in the database now
+
+        user_cart = Cart.objects.create(user=self.customer)
+        CartItem.objects.create(cart=user_cart, product=self.apple, quantity=1)
+        CartItem.objects.create(cart=user_cart, product=self.pear, quantity=4)
+
+        self.client.force_authenticate(user=self.customer)
+        response = self.client.get('/api/cart/')
+        self.assertEqual(self.quantities(response), {self.apple.id: 3, self.pear.id: 4})
+        self.assertEqual(response.data['cart']['id'], user_cart.id)
+        # Loading again must not merge the guest cart twice
+        self.assertEqual(self.quantities(self.client.get('/api/cart/')), {self.apple.id: 3, self.pear.id: 4})
+
+        self.flush_all()
+        self.assertEqual(list(Cart.objects.all()), [user_cart])
+        self.assertEqual(user_cart.items.get(product=self.apple).quantity, 3)
+
+    def test_concurrent_first_load_keeps_the_other_requests_add(self):
+        cart = Cart.objects.create(user=self.customer)
+        CartItem.objects.create(cart=cart, product=self.pear, quantity=2)
+        backend = get_cart_backend()
+        request = SimpleNamespace(user=self.customer, session=SimpleNamespace(session_key=None), query_params={})
+        renamenx = self.redis.renamenx
+        raced = []
+
+        def racing_renamenx(src, dst):
+            if not raced:
+                # Another request loads the cart and adds to it first
+                raced.append(True)
+                backend.add(request, self.pear, 1)
+            return renamenx(src, dst)
+
+        with patch.object(self.redis, 'renamenx', side_effect=racing_renamenx):
+            self.assertEqual(backend.contents(request), {self.pear.id: 3})
+        self.assertEqual([key for key in self.redis._data if ':loading:' in key], [])
+
+    def test_quantity_must_be_positive(self):
+        for quantity in (0, -2, 'many'):
+            response = self.client.post('/api/cart/', {'product_id': self.apple.id, 'quantity': quantity})
+            self.assertEqual(response.status_code, 400, quantity)
+        self.assertEqual(self.quantities(self.client.get('/api/cart/')), {})
+
+    def test_guest_cart_after_a_merge_is_persisted(self):
+        backend = get_cart_backend()
+        session = SimpleNamespace(session_key='guest-session')
+        guest = SimpleNamespace(user=AnonymousUser(), session=session, query_params={})
+        backend.add(guest, self.apple, 2)
+        backend.load(SimpleNamespace(user=self.customer, session=session, query_params={}))
+
+        # The same session adds to a new guest cart after the merge
+        backend.add(guest, self.pear, 1)
+        self.flush_all()
+        guest_cart = Cart.objects.get(session_key='guest-session')
+        self.assertEqual(list(guest_cart.items.values_list('product_id', 'quantity')), [(self.pear.id, 1)])
+        self.assertEqual(Cart.objects.get(user=self.customer).items.get().quantity, 2)
+
+    def test_cold_cart_is_loaded_from_database(self):
+        cart = Cart.objects.create(user=self.customer)
+        CartItem.objects.create(cart=cart, product=self.pear, quantity=2)
+        self.client.force_authenticate(user=self.customer)
+        response = self.client.post('/api/cart/', {'product_id': self.pear.id, 'quantity': 1})
+        self.assertEqual(self.quantities(response), {self.pear.id: 3})
+
+    def test_checkout_flushes_cart(self):
+        self.client.force_authenticate(user=self.customer)
+        self.client.post('/api/cart/', {'product_id': self.pear.id, 'quantity': 2})
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/orders/', {
+                'total_price': '20.00',
+                'items': [{'product_id': self.pear.id, 'quantity': 2}],
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(CartItem.objects.get(cart__user=self.customer).quantity, 2)
+
+    def test_remove_missing_item(self):
+        response = self.client.delete('/api/cart/', {'product_id': self.pear.id}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+
+class OrderCreationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.customer = User.objects.create_user(
+            email='bulk-order-customer@example.com',
+            password='testpass123',
+            first_name='Bulk',
+            last_name='Customer',
+            phone='0711000131',
+            role='customer'
+        )
+        self.vendor = User.objects.create_user(
+            email='bulk-order-vendor@example.com',
+            password='testpass123',
+            first_name='Bulk',
+            last_name='Vendor',
+            phone='0711000132',
+            role='vendor',
+            is_approved=True
+        )
+        category = Category.objects.create(name='Order Category', category_type='product')
+        self.products = [
+            Product.objects.create(vendor=self.vendor, name=f'Order Product {i}', price=10 + i, quantity=100, category=category)
+            for i in range(30)
+        ]
+        self.client.force_authenticate(user=self.customer)
+        # SMS notifications (notifications/signals.py) go out through the outbox too
+        sms = patch.object(notification_service, 'send_sms', return_value='SM-sms')
+        self.send_sms = sms.start()
+        self.addCleanup(sms.stop)
+
+    def place_order(self, lines, **extra):
+        return self.client.post('/api/orders/', {
+            'items': [{'product_id': product.id, 'quantity': quantity} for product, quantity in lines],
+            **extra,
+        }, format='json')
+
+    def test_total_is_computed_on_the_server(self):
+        response = self.place_order([(self.products[0], 2), (self.products[5], 1)], total_price='1.00')
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(pk=response.data['id'])
+        self.assertEqual(order.total_price, Decimal('35.00'))
+        self.assertEqual(
+            sorted(order.items.values_list('price', 'quantity')),
+            [(Decimal('10.00'), 2), (Decimal('15.00'), 1)],
+        )
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].sales_count, 2)
+        self.assertEqual(response.data['reference'], order.reference)
+        self.assertTrue(order.reference.startswith('ORD-'))
+
+    def test_query_count_does_not_grow_with_lines(self):
+        def order_queries(lines):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.place_order(lines)
+            self.assertEqual(response.status_code, 201)
+            return len(queries)
+
+        self.assertEqual(
+            order_queries([(self.products[0], 1)]),
+            order_queries([(product, 2) for product in self.products]),
+        )
+
+    def test_unknown_product_creates_nothing(self):
+        response = self.place_order([(self.products[0], 1)])
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('/api/orders/', {
+            'items': [{'product_id': self.products[1].id, 'quantity': 1}, {'product_id': 999999, 'quantity': 1}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('999999', str(response.data['items']))
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_notifications_are_sent_by_the_outbox_worker(self):
+        seen = []
+        with patch.object(notification_service, 'client', object()), \
+                patch('orders.signals.send_admin_whatsapp_notification',
+                      side_effect=lambda order, kind: seen.append(order.items.count()) or 'SM1'):
+            order = self.place_order([(product, 1) for product in self.products[:3]]).data
+            self.assertEqual(seen, [])
+            self.send_sms.assert_not_called()
+            self.assertEqual(
+                sorted(OutboxMessage.objects.values_list('topic', flat=True)),
+                ['in_app_notification', 'in_app_notification', 'order_placed', 'sms_notification', 'sms_notification'],
+            )
+            process_outbox()
+        self.assertEqual(seen, [3])
+        self.assertTrue(self.vendor.notifications.filter(type='order_placed').exists())
+        # Order placed and delivery assigned SMS to the customer
+        self.assertEqual(
+            {call.args for call in self.send_sms.call_args_list},
+            {
+                (self.customer.phone, f"Dear Bulk Customer, your order #{order['id']} has been placed successfully."),
+                (self.customer.phone, f"Dear Bulk Customer, your Order #{order['id']} has been assigned for delivery."),
+            },
+        )
+        self.assertEqual(self.customer.notifications.filter(channel='sms', status='sent').count(), 2)
+
+    def test_failed_sms_is_retried_on_its_own(self):
+        self.send_sms.return_value = None
+        self.place_order([(self.products[0], 1)])
+        with patch.object(notification_service, 'client', object()), \
+                patch('orders.signals.send_admin_whatsapp_notification', return_value='SM0'):
+            process_outbox()
+        self.assertEqual(
+            list(OutboxMessage.objects.filter(attempts=1, status='pending').values_list('topic', flat=True)),
+            ['sms_notification', 'sms_notification'],
+        )
+        self.assertFalse(self.customer.notifications.filter(channel='sms').exists())
+        self.send_sms.return_value = 'SM-sms'
+        OutboxMessage.objects.filter(topic='sms_notification').update(available_at=timezone.now())
+        with patch.object(notification_service, 'client', object()):
+            process_outbox()
+        self.assertEqual(self.customer.notifications.filter(channel='sms', status='sent').count(), 2)
+
+    def test_failed_admin_whatsapp_is_retried_on_its_own(self):
+        self.place_order([(self.products[0], 1)])
+        with patch.object(notification_service, 'client', object()), \
+                patch('orders.signals.send_admin_whatsapp_notification', return_value=None):
+            counts = process_outbox()
+        # order_placed, rider_broadcast and the customer's notifications went through
+        self.assertEqual(counts, {'done': 6, 'pending': 1, 'failed': 0})
+        self.assertEqual(OutboxMessage.objects.get(topic='admin_order_whatsapp').attempts, 1)
+        # The order_placed message committed its notifications
+        self.assertEqual(self.vendor.notifications.filter(type='order_placed').count(), 1)
+
+    def create_riders(self, count, start, km_north=1):
+        riders = [
+            User.objects.create_user(
+                email=f'outbox-rider{start + i}@example.com',
+                password='testpass123',
+                first_name='Outbox',
+                last_name=f'Rider {i}',
+                phone=f'07110003{start + i:02d}',
+                role='delivery_person'
+            )
+            for i in range(count)
+        ]
+        # Online, km_north km from the shop orders are picked up from
+        profiles = [
+            DeliveryPersonProfile(
+                user=rider, is_online=True, latitude=round(SHOP_LAT + km_north / 111.045, 8), longitude=SHOP_LNG
+            )
+            for rider in riders
+        ]
+        for profile in profiles:
+            profile.update_geohash()
+        DeliveryPersonProfile.objects.bulk_create(profiles)
+        return riders
+
+    def test_checkout_cost_does_not_grow_with_riders(self):
+        def checkout_queries():
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.place_order([(self.products[0], 1)]).status_code, 201)
+            return len(queries)
+
+        self.create_riders(2, start=0)
+        few = checkout_queries()
+        self.create_riders(20, start=2)
+        self.assertEqual(checkout_queries(), few)
+
+    @patch('orders.signals.send_admin_whatsapp_notification', return_value='SM0')
+    def test_each_rider_alert_is_retried_on_its_own(self, admin_alert):
+        riders = self.create_riders(3, start=30)
+        order = self.place_order([(self.products[0], 1)]).data
+        failing = riders[1]
+
+        def send(person, order):
+            return None if person == failing else f'SM{person.pk}'
+
+        with patch.object(notification_service, 'client', object()), \
+                patch('orders.signals.send_new_order_whatsapp_alert', side_effect=send) as alert:
+            counts = process_outbox(batch_size=2)
+        # order_placed, admin_order_whatsapp, rider_broadcast, the customer's two SMS and in-app
+        # notifications, and two of the three alerts
+        self.assertEqual(counts, {'done': 9, 'pending': 1, 'failed': 0})
+        self.assertEqual({call.args[0] for call in alert.call_args_list}, set(riders))
+        retry = OutboxMessage.objects.get(topic='rider_order_alert', status='pending')
+        self.assertEqual((retry.payload, retry.attempts), ({'order_id': order['id'], 'user_id': failing.pk}, 1))
+        self.assertGreater(retry.available_at, timezone.now())
+
+
+    @override_settings(RIDER_BROADCAST_SIZE=2, RIDER_BROADCAST_RINGS_KM=[2, 5])
+    @patch('orders.signals.send_admin_whatsapp_notification', return_value='SM0')
+    def test_rider_broadcast_widens_until_accepted(self, admin_alert):
+        near = self.create_riders(3, start=40, km_north=1)
+        far = self.create_riders(1, start=43, km_north=4)
+        farthest = self.create_riders(1, start=44, km_north=8)
+        self.place_order([(self.products[0], 1)])
+
+        def alerted():
+            with patch.object(notification_service, 'client', object()), \
+                    patch('orders.signals.send_new_order_whatsapp_alert', return_value='SM1') as alert:
+                process_outbox()
+            return {call.args[0] for call in alert.call_args_list}
+
+        first = alerted()
+        self.assertEqual(len(first), 2)
+        self.assertTrue(first < set(near))
+        # Nobody accepted: the next ring offers it to the rest, nearest first
+        self.assertEqual(alerted(), set())
+        OutboxMessage.objects.filter(status='pending').update(available_at=timezone.now())
+        self.assertEqual(alerted(), (set(near) - first) | {far[0]})
+        # Past the last ring, online riders are alerted wherever they are
+        OutboxMessage.objects.filter(status='pending').update(available_at=timezone.now())
+        self.assertEqual(alerted(), {farthest[0]})
+
+    @override_settings(RIDER_BROADCAST_MAX_SECONDS=60)
+    @patch('orders.signals.send_admin_whatsapp_notification', return_value='SM0')
+    def test_riders_without_a_location_are_alerted(self, admin_alert):
+        riders = [
+            User.objects.create_user(
+                email=f'unlocated-rider{i}@example.com',
+                password='testpass123',
+                first_name='Unlocated',
+                last_name=f'Rider {i}',
+                phone=f'07110006{i:02d}',
+                role='delivery_person'
+            )
+            for i in range(3)
+        ]
+        # Two online riders who never recorded a location, one who never went online
+        for rider in riders[:2]:
+            DeliveryPersonProfile.objects.create(user=rider, is_online=True)
+        order = self.place_order([(self.products[0], 1)]).data
+
+        def alerted():
+            OutboxMessage.objects.filter(status='pending').update(available_at=timezone.now())
+            with patch.object(notification_service, 'client', object()), \
+                    patch('orders.signals.send_new_order_whatsapp_alert', return_value='SM1') as alert:
+                process_outbox()
+            return {call.args[0] for call in alert.call_args_list}
+
+        self.assertEqual(alerted(), set(riders[:2]))
+        # Nobody online is left, so any active delivery person is alerted, as before
+        self.assertEqual(alerted(), {riders[2]})
+        # Checks go on while the order waits, then stop
+        self.assertTrue(OutboxMessage.objects.filter(topic='rider_broadcast', status='pending').exists())
+        Order.objects.filter(pk=order['id']).update(created_at=timezone.now() - timedelta(minutes=2))
+        self.assertEqual(alerted(), set())
+        self.assertFalse(OutboxMessage.objects.filter(status='pending').exists())
+
+    @override_settings(RIDER_BROADCAST_SIZE=1)
+    @patch('orders.signals.send_admin_whatsapp_notification', return_value='SM0')
+    def test_accepted_order_stops_the_broadcast(self, admin_alert):
+        self.create_riders(2, start=50)
+        order = self.place_order([(self.products[0], 1)]).data
+        with patch.object(notification_service, 'client', object()), \
+                patch('orders.signals.send_new_order_whatsapp_alert', return_value='SM1') as alert:
+            process_outbox()
+            self.assertEqual(alert.call_count, 1)
+            Order.objects.filter(pk=order['id']).update(status='assigned')
+            OutboxMessage.objects.filter(status='pending').update(available_at=timezone.now())
+            process_outbox()
+        self.assertEqual(alert.call_count, 1)
+
+
+class StockReservationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.customer = User.objects.create_user(
+            email='stock-customer@example.com',
+            password='testpass123',
+            first_name='Stock',
+            last_name='Customer',
+            phone='0711000141',
+            role='customer'
+        )
+        self.vendor = User.objects.create_user(
+            email='stock-vendor@example.com',
+            password='testpass123',
+            first_name='Stock',
+            last_name='Vendor',
+            phone='0711000142',
+            role='vendor',
+            is_approved=True
+        )
+        category = Category.objects.create(name='Stock Category', category_type='product')
+        self.product = Product.objects.create(vendor=self.vendor, name='Stock Product', price=20, quantity=5, category=category)
+        self.client.force_authenticate(user=self.customer)
+
+    def add_to_cart(self, quantity):
+        self.client.post('/api/cart/', {'product_id': self.product.id, 'quantity': quantity}, format='json')
+
+    def place_order(self, quantity):
+        return self.client.post('/api/orders/', {
+            'items': [{'product_id': self.product.id, 'quantity': quantity}],
+        }, format='json')
+
+    def test_order_decrements_stock_and_rejects_overselling(self):
+        self.assertEqual(self.place_order(3).status_code, 201)
+        response = self.place_order(3)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('items', response.data)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 2)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_checkout_hold_is_committed_by_the_order(self):
+        self.add_to_cart(4)
+        response = self.client.post('/api/cart/reserve/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['reservations'], [{'product_id': self.product.id, 'quantity': 4}])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 1)
+
+        # Ordering less than was held returns the rest
+        self.assertEqual(self.place_order(3).status_code, 201)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 2)
+        reservation = StockReservation.objects.get()
+        self.assertEqual(reservation.status, 'committed')
+        self.assertIsNotNone(reservation.order_id)
+
+    def test_hold_fails_when_stock_is_short(self):
+        self.add_to_cart(6)
+        response = self.client.post('/api/cart/reserve/')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['shortages'], [{'product_id': self.product.id, 'available': 5}])
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_expired_holds_are_released(self):
+        self.add_to_cart(5)
+        self.client.post('/api/cart/reserve/')
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        out = StringIO()
+        call_command('release_stock_reservations', stdout=out)
+        self.assertIn('Released 1', out.getvalue())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 5)
+        self.assertEqual(StockReservation.objects.get().status, 'released')
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Parallel checkouts on real connections: stock must never go below zero."""
+
+    def setUp(self):
+        vendor = User.objects.create_user(
+            email='rush-vendor@example.com',
+            password='testpass123',
+            first_name='Rush',
+            last_name='Vendor',
+            phone='0711000150',
+            role='vendor',
+            is_approved=True
+        )
+        category = Category.objects.create(name='Rush Category', category_type='product')
+        self.products = [
+            Product.objects.create(vendor=vendor, name=f'Rush Product {i}', price=5, quantity=10, category=category)
+            for i in range(2)
+        ]
+        self.customers = [
+            User.objects.create_user(
+                email=f'rush-customer-{i}@example.com',
+                password='testpass123',
+                first_name='Rush',
+                last_name='Customer',
+                phone=f'07110002{i:02d}',
+                role='customer'
+            )
+            for i in range(24)
+        ]
+
+    def test_parallel_checkouts_do_not_oversell(self):
+        barrier = threading.Barrier(len(self.customers))
+        results = []
+
+        def checkout(customer, products):
+            client = APIClient()
+            client.force_authenticate(user=customer)
+            try:
+                barrier.wait()
+                response = client.post('/api/orders/', {
+                    'items': [{'product_id': product.id, 'quantity': 1} for product in products],
+                }, format='json')
+                results.append(response.status_code)
+            except Exception as e:
+                results.append(e)
+            finally:
+                connection.close()
+
+        threads = [
+            # Half list the products in reverse to mix the order rows would be locked in
+            threading.Thread(target=checkout, args=(customer, self.products[::1 if i % 2 else -1]))
+            for i, customer in enumerate(self.customers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(results, key=str), [201] * 10 + [400] * 14)
+        for product in self.products:
+            product.refresh_from_db()
+            self.assertEqual(product.quantity, 0)
+        self.assertEqual(Order.objects.count(), 10)
+        self.assertEqual(OrderItem.objects.count(), 20)
+
+
+class OrderReferenceTests(TestCase):
+    def test_ids_are_unique_and_increasing(self):
+        generator = ULIDGenerator()
+        ids = [generator.new() for _ in range(10000)]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertTrue(all(len(value) == 26 for value in ids))
+
+    def test_ids_are_unique_across_threads(self):
+        ids = []
+
+        def generate():
+            ids.extend(new_ulid() for _ in range(2000))
+
+        threads = [threading.Thread(target=generate) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(ids)), 16000)
+
+    def test_timestamp_is_recoverable(self):
+        before = timezone.now()
+        value = new_ulid()
+        self.assertLess(abs((ulid_datetime(value) - before).total_seconds()), 1)
+
+
+class IdempotentCheckoutTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.customer = User.objects.create_user(
+            email='retry-customer@example.com',
+            password='testpass123',
+            first_name='Retry',
+            last_name='Customer',
+            phone='0711000143',
+            role='customer'
+        )
+        vendor = User.objects.create_user(
+            email='retry-vendor@example.com',
+            password='testpass123',
+            first_name='Retry',
+            last_name='Vendor',
+            phone='0711000144',
+            role='vendor',
+            is_approved=True
+        )
+        category = Category.objects.create(name='Retry Category', category_type='product')
+        self.product = Product.objects.create(vendor=vendor, name='Retry Product', price=12, quantity=10, category=category)
+        self.client.force_authenticate(user=self.customer)
+
+    def place_order(self, key, quantity=1, product_id=None):
+        return self.client.post('/api/orders/', {
+            'items': [{'product_id': product_id or self.product.id, 'quantity': quantity}],
+        }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_first_order(self):
+        first = self.place_order('checkout-1')
+        self.assertEqual(first.status_code, 201)
+
+        with self.assertNumQueries(1):
+            retry = self.place_order('checkout-1')
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.data['id'], first.data['id'])
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Delivery.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 9)
+
+    def test_key_cannot_be_reused_for_another_request(self):
+        self.place_order('checkout-2')
+        response = self.place_order('checkout-2', quantity=2)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_retry_while_in_flight_is_rejected(self):
+        self.place_order('checkout-3')
+        IdempotencyKey.objects.update(response_status=None, response_body=None, locked_until=timezone.now() + timedelta(seconds=30))
+        response = self.place_order('checkout-3')
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('Retry-After', response)
+
+    def test_failed_request_releases_the_key(self):
+        response = self.place_order('checkout-4', product_id=999999)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.place_order('checkout-4').status_code, 201)
+
+    def test_requests_without_a_key_are_not_deduplicated(self):
+        self.client.post('/api/orders/', {'items': [{'product_id': self.product.id, 'quantity': 1}]}, format='json')
+        self.client.post('/api/orders/', {'items': [{'product_id': self.product.id, 'quantity': 1}]}, format='json')
+        self.assertEqual(Order.objects.count(), 2)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class OrderHistoryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.customer = User.objects.create_user(
+            email='history-customer@example.com',
+            password='testpass123',
+            first_name='History',
+            last_name='Customer',
+            phone='0711000145',
+            role='customer'
+        )
+        self.other_customer = User.objects.create_user(
+            email='history-other@example.com',
+            password='testpass123',
+            first_name='Other',
+            last_name='Customer',
+            phone='0711000146',
+            role='customer'
+        )
+        self.vendor = User.objects.create_user(
+            email='history-vendor@example.com',
+            password='testpass123',
+            first_name='History',
+            last_name='Vendor',
+            phone='0711000147',
+            role='vendor',
+            is_approved=True
+        )
+        category = Category.objects.create(name='History Category', category_type='product')
+        self.products = [
+            Product.objects.create(vendor=self.vendor, name=f'History Product {i}', price=8, quantity=50, category=category)
+            for i in range(2)
+        ]
+        self.other_order = self.create_order(self.other_customer)
+
+    def create_order(self, customer):
+        order = Order.objects.create(customer=customer, total_price=16)
+        OrderItem.objects.bulk_create([OrderItem(order=order, product=product, quantity=1, price=8) for product in self.products])
+        return order
+
+    def test_customers_only_see_their_own_orders(self):
+        own = self.create_order(self.customer)
+        self.client.force_authenticate(user=self.customer)
+        response = self.client.get('/api/orders/')
+        self.assertEqual([order['id'] for order in response.data['results']], [own.id])
+        self.assertEqual(self.client.get(f'/api/orders/{self.other_order.id}/').status_code, 404)
+
+    def test_vendors_see_orders_for_their_products(self):
+        self.client.force_authenticate(user=self.vendor)
+        response = self.client.get('/api/orders/')
+        self.assertEqual([order['id'] for order in response.data['results']], [self.other_order.id])
+
+    def test_history_query_count_does_not_grow_with_orders(self):
+        self.client.force_authenticate(user=self.customer)
+
+        def history_queries(params):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/api/orders/', params)
+            self.assertEqual(response.status_code, 200)
+            return len(queries), len(response.data['results'])
+
+        self.create_order(self.customer)
+        few = history_queries({}), history_queries({'fields': 'full'})
+        for _ in range(19):
+            self.create_order(self.customer)
+        many = history_queries({}), history_queries({'fields': 'full'})
+        self.assertEqual([count for count, _ in few], [count for count, _ in many])
+        self.assertEqual([rows for _, rows in many], [20, 20])
+
+
+class OrderTransitionTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.customer = User.objects.create_user(
+            email='transition-customer@example.com',
+            password='testpass123',
+            first_name='Transition',
+            last_name='Customer',
+            phone='0711000148',
+            role='customer'
+        )
+        self.admin = User.objects.create_user(
+            email='transition-admin@example.com',
+            password='testpass123',
+            first_name='Transition',
+            last_name='Admin',
+            phone='0711000149',
+            role='admin'
+        )
+        vendor = User.objects.create_user(
+            email='transition-vendor@example.com',
+            password='testpass123',
+            first_name='Transition',
+            last_name='Vendor',
+            phone='0711000151',
+            role='vendor',
+            is_approved=True
+        )
+        category = Category.objects.create(name='Transition Category', category_type='product')
+        self.product = Product.objects.create(vendor=vendor, name='Transition Product', price=10, quantity=100, category=category)
+
+    def place_order(self, quantity=1):
+        self.client.force_authenticate(user=self.customer)
+        response = self.client.post('/api/orders/', {
+            'items': [{'product_id': self.product.id, 'quantity': quantity}],
+        }, format='json')
+        return Order.objects.get(pk=response.data['id'])
+
+    def test_customer_cancellation_returns_stock_and_is_logged(self):
+        order = self.place_order(quantity=4)
+        response = self.client.patch(f'/api/orders/{order.id}/status/', {'status': 'cancelled'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 100)
+        log = OrderStatusTransition.objects.get(order=order, kind='order')
+        self.assertEqual((log.from_status, log.to_status, log.actor), ('order_placed', 'cancelled', self.customer))
+
+    def test_cancellation_cancels_the_delivery_and_expires_the_assignment(self):
+        order = self.place_order()
+        rider = User.objects.create_user(
+            email='transition-rider@example.com',
+            password='testpass123',
+            first_name='Transition',
+            last_name='Rider',
+            phone='0711000601',
+            role='delivery_person'
+        )
+        assignment = OrderAssignment.objects.create(
+            order=order, delivery_person=rider, status='assigned',
+            estimated_delivery_time=timezone.now(), expires_at=timezone.now() + timedelta(minutes=5),
+        )
+        response = self.client.patch(f'/api/orders/{order.id}/status/', {'status': 'cancelled'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(order.deliveries.get().status, 'cancelled')
+        assignment.refresh_from_db()
+        self.assertEqual(assignment.status, 'expired')
+        logs = OrderStatusTransition.objects.filter(order=order).exclude(kind='order')
+        self.assertEqual(
+            sorted(logs.values_list('kind', 'from_status', 'to_status', 'actor')),
+            [('assignment', 'assigned', 'expired', self.customer.pk), ('delivery', 'pending', 'cancelled', self.customer.pk)],
+        )
+
+    def test_cancellation_takes_back_sales(self):
+        orders = [self.place_order(quantity=2) for _ in range(3)]
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.sales_count, 6)
+        self.client.patch(f'/api/orders/{orders[0].id}/status/', {'status': 'cancelled'}, format='json')
+        self.client.force_authenticate(user=self.admin)
+        self.client.post('/api/orders/status/bulk/', {
+            'order_ids': [order.id for order in orders[1:]], 'status': 'cancelled',
+        }, format='json')
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.sales_count, self.product.quantity), (0, 100))
+        self.assertFalse(Delivery.objects.filter(order__in=orders).exclude(status='cancelled').exists())
+
+    def test_roles_and_transition_table_are_enforced(self):
+        order = self.place_order()
+        response = self.client.patch(f'/api/orders/{order.id}/status/', {'status': 'delivered'}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.patch(f'/api/orders/{order.id}/status/', {'status': 'on_the_way'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'order_placed')
+
+    def test_status_is_required_on_patch(self):
+        order = self.place_order()
+        for method in (self.client.patch, self.client.put):
+            response = method(f'/api/orders/{order.id}/status/', {}, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('status', response.data)
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'order_placed')
+
+    def test_bulk_transition_uses_constant_queries(self):
+        def bulk_queries(count):
+            orders = [self.place_order() for _ in range(count)]
+            self.client.force_authenticate(user=self.admin)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post('/api/orders/status/bulk/', {
+                    'order_ids': [order.id for order in orders], 'status': 'accepted',
+                }, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['updated'], [order.id for order in orders])
+            return len(queries)
+
+        self.assertEqual(bulk_queries(1), bulk_queries(40))
+        self.assertEqual(Order.objects.filter(status='accepted').count(), 41)
+        self.assertEqual(OrderStatusTransition.objects.count(), 41)
+
+    def test_bulk_transition_skips_orders_that_cannot_move(self):
+        delivered, placed = self.place_order(), self.place_order()
+        Order.objects.filter(pk=delivered.pk).update(status='delivered')
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.post('/api/orders/status/bulk/', {
+            'order_ids': [delivered.id, placed.id, 999999], 'status': 'cancelled',
+        }, format='json')
+        self.assertEqual(response.data, {'updated': [placed.id], 'skipped': [delivered.id, 999999]})
+
+    def test_bulk_transition_is_admin_only(self):
+        order = self.place_order()
+        response = self.client.post('/api/orders/status/bulk/', {'order_ids': [order.id], 'status': 'cancelled'}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class CouponTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.customer = User.objects.create_user(
+            email='coupon-customer@example.com',
+            password='testpass123',
+            first_name='Coupon',
+            last_name='Customer',
+            phone='0711000152',
+            role='customer'
+        )
+        vendor = User.objects.create_user(
+            email='coupon-vendor@example.com',
+            password='testpass123',
+            first_name='Coupon',
+            last_name='Vendor',
+            phone='0711000153',
+            role='vendor',
+            is_approved=True
+        )
+        category = Category.objects.create(name='Coupon Category', category_type='product')
+        self.product = Product.objects.create(vendor=vendor, name='Coupon Product', price=40, quantity=100, category=category)
+
+    def apply(self, code):
+        return self.client.post('/api/coupon/apply/', {'code': code}, format='json')
+
+    def place_order(self, code, quantity=1):
+        self.client.force_authenticate(user=self.customer)
+        return self.client.post('/api/orders/', {
+            'items': [{'product_id': self.product.id, 'quantity': quantity}],
+            'coupon_code': code,
+        }, format='json')
+
+    def test_repeated_apply_is_served_from_cache(self):
+        Coupon.objects.create(code='CACHED10', discount_percent=10)
+        self.assertEqual(self.apply('CACHED10').status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.apply('CACHED10')
+        self.assertEqual(response.data['discount'], {'discount_percent': 10.0})
+        # Unknown codes are answered from the cached set of codes, without a cache entry each
+        with self.assertNumQueries(0):
+            self.assertEqual(self.apply('NOSUCHCODE').status_code, 404)
+        version = get_tag_version(coupons.COUPON_CACHE_TAG)
+        self.assertIsNone(cache.get(coupons.COUPON_KEY.format(version=version, code='NOSUCHCODE')))
+
+    def test_new_coupon_is_found_after_a_miss(self):
+        self.assertEqual(self.apply('LATER').status_code, 404)
+        Coupon.objects.create(code='LATER', amount=5)
+        self.assertEqual(self.apply('LATER').status_code, 200)
+
+    def test_cache_is_invalidated_on_change(self):
+        coupon = Coupon.objects.create(code='TOGGLE', amount=5)
+        self.assertEqual(self.apply('TOGGLE').status_code, 200)
+        coupon.active = False
+        coupon.save()
+        self.assertEqual(self.apply('TOGGLE').status_code, 404)
+
+    def test_code_must_be_a_string(self):
+        for code in (None, '', ['CODE'], {'code': 'CODE'}):
+            response = self.apply(code)
+            self.assertEqual(response.status_code, 400, code)
+            self.assertIn('error', response.data)
+        self.assertEqual(self.client.post('/api/coupon/apply/', {}, format='json').data['error'], 'Coupon code is required')
+
+    def test_validity_window(self):
+        Coupon.objects.create(code='OLD', amount=5, valid_until=timezone.now() - timedelta(days=1))
+        response = self.apply('OLD')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.data['error'], 'This coupon has expired')
+
+    def test_apply_prices_the_cart(self):
+        Coupon.objects.create(code='CART25', discount_percent=25)
+        self.client.post('/api/cart/', {'product_id': self.product.id, 'quantity': 2}, format='json')
+        response = self.apply('CART25')
+        self.assertEqual(
+            (response.data['subtotal'], response.data['discount_total'], response.data['total']),
+            ('80.00', '20.00', '60.00'),
+        )
+
+    def test_order_redeems_coupon(self):
+        coupon = Coupon.objects.create(code='TEN', amount=10)
+        response = self.place_order('TEN', quantity=2)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['discount'], '10.00')
+        self.assertEqual(response.data['total_price'], '70.00')
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.used_count, 1)
+        self.assertEqual(CouponUsage.objects.get(coupon=coupon, user=self.customer).count, 1)
+
+    def test_per_user_cap(self):
+        Coupon.objects.create(code='ONCE', amount=5, max_uses_per_user=1)
+        self.assertEqual(self.place_order('ONCE').status_code, 201)
+        response = self.place_order('ONCE')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('coupon_code', response.data)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_global_limit(self):
+        coupon = Coupon.objects.create(code='FIRST2', amount=5, max_uses=2)
+        self.assertEqual(self.place_order('FIRST2').status_code, 201)
+        self.assertEqual(self.place_order('FIRST2').status_code, 201)
+        self.assertEqual(self.place_order('FIRST2').status_code, 400)
+        coupon.refresh_from_db()
+        self.assertEqual(coupon.used_count, 2)
+
+
+class CartQuoteTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.customer = User.objects.create_user(
+            email='quote-customer@example.com',
+            password='testpass123',
+            first_name='Quote',
+            last_name='Customer',
+            phone='0711000154',
+            role='customer'
+        )
+        vendors = [
+            User.objects.create_user(
+                email=f'quote-vendor{i}@example.com',
+                password='testpass123',
+                first_name='Quote',
+                last_name=f'Vendor {i}',
+                phone=f'071100015{5 + i}',
+                role='vendor',
+                is_approved=True
+            )
+            for i in range(2)
+        ]
+        category = Category.objects.create(name='Quote Category', category_type='product')
+        self.bread = Product.objects.create(vendor=vendors[0], name='Bread', price='12.50', quantity=50, category=category)
+        self.milk = Product.objects.create(vendor=vendors[0], name='Milk', price='7.25', quantity=50, category=category)
+        self.pen = Product.objects.create(vendor=vendors[1], name='Pen', price='3.10', quantity=50, category=category)
+        self.client.force_authenticate(user=self.customer)
+        for product, quantity in [(self.bread, 2), (self.milk, 1), (self.pen, 3)]:
+            self.client.post('/api/cart/', {'product_id': product.id, 'quantity': quantity}, format='json')
+
+    def test_quote_totals(self):
+        Coupon.objects.create(code='QUOTE5', amount=5)
+        with patch('delivery.fees.route_distance_km', return_value=2.6):
+            quote = self.client.get('/api/cart/', {'coupon': 'QUOTE5', 'lat': 0.61, 'lng': 34.57}).data['quote']
+        self.assertEqual(
+            {line['product_id']: line['line_total'] for line in quote['lines']},
+            {self.bread.id: '25.00', self.milk.id: '7.25', self.pen.id: '9.30'},
+        )
+        self.assertEqual(
+            {vendor['vendor_id']: vendor['subtotal'] for vendor in quote['vendors']},
+            {self.bread.vendor_id: '32.25', self.pen.vendor_id: '9.30'},
+        )
+        self.assertEqual(
+            (quote['subtotal'], quote['discount'], quote['delivery_fee'], quote['total']),
+            ('41.55', '5.00', '50.00', '86.55'),
+        )
+
+    def test_unchanged_cart_is_priced_once(self):
+        with patch('orders.pricing.price_lines', wraps=pricing.price_lines) as price_lines:
+            first = self.client.get('/api/cart/').data['quote']
+            self.assertEqual(self.client.get('/api/cart/').data['quote'], first)
+            self.assertEqual(price_lines.call_count, 1)
+
+            self.client.post('/api/cart/', {'product_id': self.pen.id, 'quantity': 1}, format='json')
+            self.assertEqual(self.client.get('/api/cart/').data['quote']['subtotal'], '44.65')
+            self.assertEqual(price_lines.call_count, 2)
+
+    def test_price_change_invalidates_quote(self):
+        self.client.get('/api/cart/')
+        self.pen.price = Decimal('4.00')
+        self.pen.save()
+        self.assertEqual(self.client.get('/api/cart/').data['quote']['subtotal'], '44.25')
+
+    def test_checkout_charges_the_quote(self):
+        with patch('delivery.fees.route_distance_km', return_value=4.2) as route:
+            quote = self.client.get('/api/cart/', {'lat': 0.62, 'lng': 34.58}).data['quote']
+            response = self.client.post('/api/orders/', {
+                'items': [
+                    {'product_id': self.bread.id, 'quantity': 2},
+                    {'product_id': self.milk.id, 'quantity': 1},
+                    {'product_id': self.pen.id, 'quantity': 3},
+                ],
+                'delivery_lat': 0.62,
+                'delivery_lng': 34.58,
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(route.call_count, 1)
+        self.assertEqual((response.data['delivery_fee'], response.data['total_price']), ('60.00', quote['total']))
+        self.assertEqual(quote['total'], '101.55')
+
+    def test_delivery_point_is_validated(self):
+        for params in ({'lat': 'nan', 'lng': 34.57}, {'lat': 0.61, 'lng': 'inf'}, {'lat': 91, 'lng': 34.57}, {'lat': 0.61}):
+            response = self.client.get('/api/cart/', params)
+            self.assertEqual(response.status_code, 400, params)
+        response = self.client.post('/api/orders/', {
+            'items': [{'product_id': self.pen.id, 'quantity': 1}], 'delivery_lat': 'nan', 'delivery_lng': 34.57,
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('delivery_lat', response.data)
+
+    def test_delivery_fee_failure(self):
+        with patch('delivery.fees.route_distance_km', side_effect=DeliveryFeeUnavailable('ORS is down')):
+            response = self.client.get('/api/cart/', {'lat': 1.5, 'lng': 35.5})
+            self.assertEqual((response.data['quote'], response.data['quote_error']), (None, 'ORS is down'))
+            self.assertEqual(len(response.data['cart']['items']), 3)
+
+            response = self.client.post('/api/orders/', {
+                'items': [{'product_id': self.pen.id, 'quantity': 1}], 'delivery_lat': 1.5, 'delivery_lng': 35.5,
+            }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('delivery_fee', response.data)
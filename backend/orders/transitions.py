@@ -0,0 +1,230 @@
+"""
+Status transitions for orders, their deliveries and their assignments.
+
+Status fields are changed through this module only, never by assigning
+`status` directly. transition() moves one object and saves it (so post_save
+handlers run). bulk_transition() moves many orders with a single UPDATE and
+one INSERT for the log, without per-row saves or signals,
+expire_assignments() does the same for assignments past their expires_at,
+and offer_assignments() writes dispatch offers, re-offering orders whose
+assignment expired or was rejected.
+All check the TRANSITIONS tables and append an OrderStatusTransition row for
+every change. Cancelling orders also returns their stock, takes back their
+sales and moves their delivery to 'cancelled' and live assignment to
+'expired' (logged too).
+"""
+from django.db import transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+from delivery.models import Delivery, OrderAssignment
+from products.models import Product
+from .inventory import release_order_stock
+from .models import Order, OrderStatusTransition
+
+# kind -> current status -> statuses it may move to
+TRANSITIONS = {
+    'order': {
+        'order_placed': {'accepted', 'assigned', 'cancelled'},
+        'accepted': {'assigned', 'in_progress', 'cancelled'},
+        'assigned': {'in_progress', 'on_the_way', 'cancelled'},
+        'in_progress': {'on_the_way', 'delivered', 'cancelled'},
+        'on_the_way': {'delivered'},
+        'delivered': set(),
+        'cancelled': set(),
+    },
+    'delivery': {
+        'pending': {'picked_up', 'in_transit', 'cancelled'},
+        'picked_up': {'in_transit', 'delivered', 'cancelled'},
+        'in_transit': {'delivered', 'cancelled'},
+        'delivered': set(),
+        'cancelled': set(),
+    },
+    'assignment': {
+        'pending': {'assigned', 'accepted', 'rejected', 'expired'},
+        'assigned': {'accepted', 'rejected', 'expired'},
+        'accepted': set(),
+        # Re-offered (to another rider) by delivery.dispatch
+        'rejected': {'assigned'},
+        'expired': {'assigned'},
+    },
+}
+
+# Order statuses each role may set (admins: any allowed transition)
+ROLE_ORDER_STATUSES = {
+    'customer': {'cancelled'},
+    'vendor': {'accepted', 'in_progress', 'cancelled'},
+    'delivery_person': {'in_progress', 'on_the_way', 'delivered'},
+}
+
+KINDS = {
+    Order: 'order',
+    Delivery: 'delivery',
+    OrderAssignment: 'assignment',
+}
+
+
+class InvalidTransition(Exception):
+    pass
+
+
+def can_transition(kind, from_status, to_status):
+    return to_status in TRANSITIONS[kind].get(from_status, ())
+
+
+def role_can_set(user, to_status):
+    if user.role == 'admin':
+        return True
+    return to_status in ROLE_ORDER_STATUSES.get(user.role, ())
+
+
+def _entered(kind, to_status, order_ids, actor=None, note=''):
+    # Side effects of reaching a status, run once per transition however many orders moved
+    if kind == 'order' and to_status == 'cancelled':
+        quantities = release_order_stock(order_ids)
+        Product.objects.record_sales({product_id: -quantity for product_id, quantity in quantities.items()})
+        _bulk_move(Delivery, order_ids, 'cancelled', actor=actor, note=note, updated_at=timezone.now())
+        _bulk_move(OrderAssignment, order_ids, 'expired', actor=actor, note=note)
+
+
+def _bulk_move(model, order_ids, to_status, actor=None, note='', **changes):
+    """
+    Move the Deliveries or OrderAssignments of `order_ids` that may reach
+    `to_status` with one UPDATE (plus `changes`) and log each. Returns
+    (pk, order_id) of the rows moved.
+    """
+    kind = KINDS[model]
+    moved = list(
+        model.objects.select_for_update()
+        .filter(order_id__in=order_ids)
+        .filter(status__in=[status for status, moves in TRANSITIONS[kind].items() if to_status in moves])
+        .order_by('pk').values_list('pk', 'order_id', 'status')
+    )
+    if moved:
+        model.objects.filter(pk__in=[pk for pk, _, _ in moved]).update(status=to_status, **changes)
+        OrderStatusTransition.objects.bulk_create([
+            OrderStatusTransition(
+                order_id=order_id, kind=kind, from_status=status, to_status=to_status, actor=actor, note=note
+            )
+            for _, order_id, status in moved
+        ])
+    return [(pk, order_id) for pk, order_id, _ in moved]
+
+
+def check_transition(instance, to_status):
+    """Raise InvalidTransition unless `instance` may move to `to_status`."""
+    kind = KINDS[type(instance)]
+    if not can_transition(kind, instance.status, to_status):
+        raise InvalidTransition(f"Cannot change {kind} status from '{instance.status}' to '{to_status}'.")
+
+
+def log_transition(instance, from_status, actor=None, note=''):
+    """Record that `instance` (already saved) moved from `from_status` to its current status."""
+    kind = KINDS[type(instance)]
+    order_id = instance.pk if kind == 'order' else instance.order_id
+    OrderStatusTransition.objects.create(
+        order_id=order_id, kind=kind, from_status=from_status, to_status=instance.status, actor=actor, note=note
+    )
+    _entered(kind, instance.status, [order_id], actor=actor, note=note)
+
+
+def transition(instance, to_status, actor=None, note=''):
+    """
+    Move an Order, Delivery or OrderAssignment to `to_status` and save it,
+    along with any other changes made to it. Returns False if it already had
+    that status; raises InvalidTransition if the move is not allowed.
+    """
+    from_status = instance.status
+    if from_status == to_status:
+        return False
+    check_transition(instance, to_status)
+    with transaction.atomic():
+        instance.status = to_status
+        instance.save()
+        log_transition(instance, from_status, actor=actor, note=note)
+    return True
+
+
+def bulk_transition(orders, to_status, actor=None, note=''):
+    """
+    Move every order in `orders` (a queryset or ids) that is allowed to reach
+    `to_status`. Returns (moved ids, skipped ids).
+    """
+    if to_status not in TRANSITIONS['order']:
+        raise InvalidTransition(f"Unknown order status '{to_status}'.")
+    order_ids = orders.values('pk') if isinstance(orders, QuerySet) else list(orders)
+
+    with transaction.atomic():
+        # Lock in id order, like take_stock, so concurrent bulk moves cannot deadlock
+        current = dict(
+            Order.objects.select_for_update().filter(pk__in=order_ids).order_by('pk').values_list('pk', 'status')
+        )
+        moved = {pk: status for pk, status in current.items() if can_transition('order', status, to_status)}
+        if moved:
+            Order.objects.filter(pk__in=list(moved)).update(status=to_status)
+            OrderStatusTransition.objects.bulk_create([
+                OrderStatusTransition(
+                    order_id=pk, kind='order', from_status=status, to_status=to_status, actor=actor, note=note
+                )
+                for pk, status in moved.items()
+            ])
+            _entered('order', to_status, list(moved), actor=actor, note=note)
+
+    skipped = [pk for pk in current if pk not in moved]
+    if not isinstance(orders, QuerySet):
+        # Ids that matched no order are reported as skipped too
+        skipped += sorted(set(order_ids) - current.keys())
+    return sorted(moved), skipped
+
+
+def expire_assignments(now, note=''):
+    """Move every assigned OrderAssignment whose expires_at has passed to 'expired'. Returns their order ids."""
+    with transaction.atomic():
+        expired = list(
+            OrderAssignment.objects.select_for_update(skip_locked=True)
+            .filter(status__in=[status for status, moves in TRANSITIONS['assignment'].items() if 'expired' in moves])
+            .filter(expires_at__lte=now)
+            .order_by('pk').values_list('pk', 'order_id', 'status')
+        )
+        if expired:
+            OrderAssignment.objects.filter(pk__in=[pk for pk, _, _ in expired]).update(status='expired')
+            OrderStatusTransition.objects.bulk_create([
+                OrderStatusTransition(order_id=order_id, kind='assignment', from_status=status, to_status='expired', note=note)
+                for _, order_id, status in expired
+            ])
+    return [order_id for _, order_id, _ in expired]
+
+
+def offer_assignments(assignments, note=''):
+    """
+    Save `assignments` (unsaved OrderAssignments, status 'assigned') with one
+    upsert: an order's existing assignment is replaced when it may move to
+    'assigned' (it expired or was rejected), and the move is logged. Orders
+    whose assignment may not move are left out. Returns the assignments saved.
+    """
+    with transaction.atomic():
+        current = dict(
+            OrderAssignment.objects.select_for_update()
+            .filter(order_id__in=[assignment.order_id for assignment in assignments])
+            .order_by('pk').values_list('order_id', 'status')
+        )
+        offered = [
+            assignment for assignment in assignments
+            if assignment.order_id not in current or can_transition('assignment', current[assignment.order_id], assignment.status)
+        ]
+        OrderAssignment.objects.bulk_create(
+            offered,
+            update_conflicts=True,
+            unique_fields=['order'],
+            update_fields=[
+                'delivery_person', 'assignment_score', 'distance_km', 'estimated_delivery_time',
+                'assigned_at', 'expires_at', 'status',
+            ],
+        )
+        OrderStatusTransition.objects.bulk_create([
+            OrderStatusTransition(
+                order_id=assignment.order_id, kind='assignment', from_status=current[assignment.order_id],
+                to_status=assignment.status, note=note,
+            )
+            for assignment in offered if assignment.order_id in current
+        ])
+    return offered
@@ -3,18 +3,30 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
-from .models import Cart, CartItem, Order, Coupon
-from .serializers import CartSerializer, OrderSerializer, OrderStatusSerializer, CouponSerializer
+from .models import Order, new_order_reference
+from .serializers import (
+    OrderSerializer, OrderStatusSerializer, OrderBulkStatusSerializer, CouponSerializer, CouponApplySerializer,
+    DeliveryPointSerializer,
+)
 from products.models import Product
+from products.serializers import is_summary_request
 from rest_framework import generics
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
 from django.utils.decorators import method_decorator
 from rest_framework_simplejwt.authentication import JWTAuthentication
-from .permissions import IsOrderOwner
+from .permissions import IsAdmin, IsOrderOwner, IsOrderParticipant
+from .carts import CartError, get_cart_backend
+from .idempotency import IdempotentCreateMixin
+from .coupons import CouponError, validate_coupon
+from .inventory import InsufficientStock, hold_stock, release_holds
+from .pricing import quote_cart, quote_data
+from .transitions import InvalidTransition, bulk_transition, role_can_set, transition
+from campus_delivery.pagination import StandardCursorPagination
+from delivery.fees import DeliveryFeeUnavailable
 import json
 import requests
-import random
 from django.core.mail import send_mail
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
@@ -35,16 +47,20 @@ class CouponCreateView(APIView):
         return Response(serializer.errors, status=400)
 
 class CouponApplyView(APIView):
+    """
+    Check a coupon code (from the cache, see orders/coupons.py) and price the
+    current cart with it. The coupon is only redeemed when an order uses it.
+    """
     permission_classes = [AllowAny]
 
     def post(self, request):
-        code = request.data.get('code')
-        if not code:
-            return Response({'error': 'Coupon code is required'}, status=400)
+        serializer = CouponApplySerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({'error': serializer.errors['code'][0]}, status=400)
         try:
-            coupon = Coupon.objects.get(code=code, active=True)
-        except Coupon.DoesNotExist:
-            return Response({'error': 'Invalid or inactive coupon code'}, status=404)
+            coupon = validate_coupon(serializer.validated_data['code'])
+        except CouponError as e:
+            return Response({'error': str(e)}, status=404)
 
         discount = {}
         if coupon.amount:
@@ -52,83 +68,86 @@ class CouponApplyView(APIView):
         if coupon.discount_percent:
             discount['discount_percent'] = float(coupon.discount_percent)
 
-        return Response({'code': coupon.code, 'discount': discount})
+        response = {'code': coupon.code, 'discount': discount}
+        if request.session.session_key or request.user.is_authenticated:
+            quantities = get_cart_backend().contents(request)
+            if quantities:
+                quote = quote_cart(quantities, coupon)
+                response.update({
+                    'subtotal': str(quote['subtotal']),
+                    'discount_total': str(quote['discount']),
+                    'total': str(quote['total']),
+                })
+        return Response(response)
+
+def ensure_session(request):
+    if not request.session.session_key:
+        request.session.create()
+    request.session.modified = True  # Ensure session is saved
+
+def cart_quantities(request, cart):
+    if all('id' in item['product'] for item in cart['items']):
+        return {item['product']['id']: item['quantity'] for item in cart['items']}
+    # ?fields= left the product ids out
+    return get_cart_backend().contents(request)
 
 class CartView(APIView):
+    """
+    Storage is delegated to the configured cart backend (see orders/carts.py).
+
+    GET also prices the cart on the server (see orders/pricing.py), optionally
+    with ?coupon=CODE and the delivery point ?lat=..&lng=..; checkout with the
+    same coupon and point charges this quote.
+    """
     authentication_classes = [JWTAuthentication, SessionAuthentication]
     permission_classes = [AllowAny]  # Allow any user to access the cart
 
     def get(self, request):
-        session_key = request.session.session_key
-        if not session_key:
-            request.session.create()
-            session_key = request.session.session_key
-        
-        request.session.modified = True  # Ensure session is saved
-
-        session_cart = Cart.objects.filter(session_key=session_key, user=None).first()
-
-        if request.user.is_authenticated:
-            user_cart, created = Cart.objects.get_or_create(user=request.user)
-
-            # Merge anonymous cart into user cart
-            if session_cart and session_cart != user_cart:
-                for item in session_cart.items.all():
-                    user_item, created = CartItem.objects.get_or_create(cart=user_cart, product=item.product)
-                    if created:
-                        user_item.quantity = item.quantity
-                    else:
-                        user_item.quantity += item.quantity
-                    user_item.save()
-                session_cart.delete()
-
-            cart = user_cart
-            if cart.session_key:
-                cart.session_key = None
-                cart.save()
-        else:
-            # Anonymous user — use session-based cart
-            cart, created = Cart.objects.get_or_create(session_key=session_key, user=None)
-
-        serializer = CartSerializer(cart)
-        return Response({'cart': serializer.data})
+        ensure_session(request)
+        cart = get_cart_backend().load(request)
+        response = {'cart': cart}
+
+        coupon = None
+        code = request.query_params.get('coupon', '').strip()
+        if code:
+            try:
+                coupon = validate_coupon(code)
+            except CouponError as e:
+                response['coupon_error'] = str(e)
+
+        destination = None
+        if 'lat' in request.query_params or 'lng' in request.query_params:
+            point = DeliveryPointSerializer(data=request.query_params)
+            if not point.is_valid():
+                return Response(point.errors, status=400)
+            destination = (point.validated_data['lat'], point.validated_data['lng'])
+
+        try:
+            response['quote'] = quote_data(quote_cart(cart_quantities(request, cart), coupon, destination))
+        except DeliveryFeeUnavailable as e:
+            response.update(quote=None, quote_error=str(e))
+        return Response(response)
 
     def post(self, request):
         product_id = request.data.get('product_id')
-        quantity = int(request.data.get('quantity', 1))
+        try:
+            quantity = int(request.data.get('quantity', 1))
+        except (TypeError, ValueError):
+            return Response({'error': 'Quantity must be a whole number of at least 1'}, status=400)
 
         product = get_object_or_404(Product, id=product_id)
+        ensure_session(request)
 
-        session_key = request.session.session_key
-        if not session_key:
-            request.session.create()
-            session_key = request.session.session_key
-        request.session.modified = True  # Ensure session is marked as modified
-
-        # CART CREATION LOGIC
-        if request.user.is_authenticated:
-            cart, created = Cart.objects.get_or_create(user=request.user)
-            if cart.session_key:
-                cart.session_key = None
-                cart.save()
-        else:
-            cart, created = Cart.objects.get_or_create(session_key=session_key, user=None)
-
-        # CART ITEM LOGIC
-        cart_item, item_created = CartItem.objects.get_or_create(cart=cart, product=product)
-        if item_created:
-            cart_item.quantity = quantity
-        else:
-            cart_item.quantity += quantity
-        cart_item.save()
-
-        serializer = CartSerializer(cart)
+        try:
+            cart, total_quantity = get_cart_backend().add(request, product, quantity)
+        except CartError as e:
+            return Response({'error': str(e)}, status=400)
         return Response({
-            'cart': serializer.data,
+            'cart': cart,
             'added_product': {
                 'id': product.id,
                 'name': product.name,
-                'quantity': cart_item.quantity
+                'quantity': total_quantity
             }
         })
 
@@ -138,60 +157,122 @@ class CartView(APIView):
             return Response({'error': 'product_id is required'}, status=400)
 
         product = get_object_or_404(Product, id=product_id)
+        ensure_session(request)
 
-        session_key = request.session.session_key
-        if not session_key:
-            request.session.create()
-            session_key = request.session.session_key
-        request.session.modified = True
-
-        if request.user.is_authenticated:
-            cart = Cart.objects.filter(user=request.user).first()
-        else:
-            cart = Cart.objects.filter(session_key=session_key, user=None).first()
-
-        if not cart:
-            return Response({'error': 'Cart not found'}, status=404)
-
-        cart_item = CartItem.objects.filter(cart=cart, product=product).first()
-        if not cart_item:
-            return Response({'error': 'Cart item not found'}, status=404)
-
-        cart_item.delete()
+        try:
+            cart = get_cart_backend().remove(request, product)
+        except CartError as e:
+            return Response({'error': str(e)}, status=404)
+        return Response({'cart': cart})
+
+class CartReservationView(APIView):
+    """
+    Checkout step: hold the stock of the cart for STOCK_RESERVATION_TTL seconds
+    so it cannot sell out while the customer pays (see orders/inventory.py).
+    """
+    authentication_classes = [JWTAuthentication, SessionAuthentication]
+    permission_classes = [IsAuthenticated]
 
-        serializer = CartSerializer(cart)
-        return Response({'cart': serializer.data})
+    def post(self, request):
+        ensure_session(request)
+        quantities = get_cart_backend().contents(request)
+        if not quantities:
+            return Response({'error': 'Cart is empty'}, status=400)
+        try:
+            reservations = hold_stock(request.user, quantities)
+        except InsufficientStock as e:
+            return Response({
+                'error': 'Insufficient stock',
+                'shortages': [
+                    {'product_id': product_id, 'available': available}
+                    for product_id, available in sorted(e.shortages.items())
+                ],
+            }, status=409)
+        return Response({
+            'reservations': [
+                {'product_id': reservation.product_id, 'quantity': reservation.quantity}
+                for reservation in reservations
+            ],
+            'expires_at': reservations[0].expires_at if reservations else None,
+        }, status=201)
 
-class OrderListCreateView(generics.ListCreateAPIView):
-    queryset = Order.objects.all()
+    def delete(self, request):
+        released = release_holds(request.user)
+        return Response({'released': released})
+
+class OrderListCreateView(IdempotentCreateMixin, generics.ListCreateAPIView):
+    """
+    Send an Idempotency-Key header with POST so that retries return the
+    order created by the first attempt instead of placing it again.
+    """
     serializer_class = OrderSerializer
     authentication_classes = [JWTAuthentication]  # ✅ Use JWT for auth
     permission_classes = [IsAuthenticated]
+    pagination_class = StandardCursorPagination
+
+    def get_queryset(self):
+        return Order.objects.visible_to(self.request.user).with_items(
+            full_products=not is_summary_request(self.request)
+        )
 
     def perform_create(self, serializer):
-        # Generate a unique reference for the order
-        reference = f'ref-{random.randint(100000, 999999999)}'
-        serializer.save(customer=self.request.user, reference=reference, status='order_placed')
+        serializer.save(customer=self.request.user, reference=new_order_reference(), status='order_placed')
+        get_cart_backend().checkout(self.request)
 
 class OrderDetailView(generics.RetrieveAPIView):
-    queryset = Order.objects.all()
     serializer_class = OrderSerializer
     authentication_classes = [JWTAuthentication]
-    permission_classes = [IsOrderOwner]
+    permission_classes = [IsAuthenticated, IsOrderOwner]
+
+    def get_queryset(self):
+        # Other customers' orders are not found rather than forbidden
+        return Order.objects.filter(customer=self.request.user).with_items(
+            full_products=not is_summary_request(self.request)
+        )
 
 class OrderStatusView(generics.UpdateAPIView):
+    """
+    Move one order to another status, following orders.transitions:
+    customers may only cancel, vendors accept and prepare, riders deliver.
+    """
     queryset = Order.objects.all()
     serializer_class = OrderStatusSerializer
     authentication_classes = [JWTAuthentication]
-    permission_classes = [IsOrderOwner]
+    permission_classes = [IsAuthenticated, IsOrderParticipant]
+
+    def perform_update(self, serializer):
+        to_status = serializer.validated_data['status']
+        if not role_can_set(self.request.user, to_status):
+            raise PermissionDenied(f"You cannot set orders to '{to_status}'.")
+        try:
+            transition(serializer.instance, to_status, actor=self.request.user)
+        except InvalidTransition as e:
+            raise ValidationError({'status': [str(e)]})
+
+class OrderBulkStatusView(APIView):
+    """
+    Move many orders at once (admins): one UPDATE for every order that may
+    reach the status; the others are returned as skipped.
+    """
+    authentication_classes = [JWTAuthentication, SessionAuthentication]
+    permission_classes = [IsAdmin]
+
+    def post(self, request):
+        serializer = OrderBulkStatusSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        moved, skipped = bulk_transition(
+            serializer.validated_data['order_ids'],
+            serializer.validated_data['status'],
+            actor=request.user,
+            note=serializer.validated_data['note'],
+        )
+        return Response({'updated': moved, 'skipped': skipped})
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def clear_cart(request):
     try:
-        cart = Cart.objects.filter(user=request.user).first()
-        if cart:
-            CartItem.objects.filter(cart=cart).delete()
+        get_cart_backend().clear(request)
         return Response({"message": "Cart cleared successfully."})
     except Exception as e:
         return Response({"error": str(e)}, status=500)
@@ -0,0 +1,330 @@
+import csv
+import io
+import json
+from decimal import Decimal
+from django.db import transaction
+from django.db.models.functions import Lower
+from rest_framework import serializers
+from .models import Brand, Category, Color, Product, Size, SubCategory
+from .search import update_search_vectors
+
+# Supported file formats and the content type they are exported with
+BULK_FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+# Columns read by ProductImporter and written by export_products, in order.
+# Relations are referenced by name; colors and sizes are comma-separated in CSV
+# (JSONL rows may also use lists).
+PRODUCT_COLUMNS = [
+    'name', 'type', 'price', 'quantity', 'description', 'additional_information',
+    'category', 'subcategory', 'brand', 'model', 'colors', 'sizes', 'tags',
+    'duration_minutes', 'service_location', 'available_days', 'service_radius_km', 'is_active',
+]
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+class NameListField(serializers.Field):
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = data.split(',')
+        if not isinstance(data, list):
+            raise serializers.ValidationError('Expected a list or a comma-separated string of names.')
+        return [str(name).strip() for name in data if str(name).strip()]
+
+
+class ProductImportRowSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=255)
+    type = serializers.ChoiceField(choices=Product.TYPE_CHOICES, default='product')
+    price = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=Decimal('0'))
+    quantity = serializers.IntegerField(min_value=0, required=False)
+    description = serializers.CharField(default='')
+    additional_information = serializers.CharField(default='')
+    category = serializers.CharField(required=False)
+    subcategory = serializers.CharField(required=False)
+    brand = serializers.CharField(required=False)
+    model = serializers.CharField(max_length=100, required=False)
+    colors = NameListField(default=list)
+    sizes = NameListField(default=list)
+    tags = serializers.CharField(max_length=255, default='')
+    duration_minutes = serializers.IntegerField(min_value=0, required=False)
+    service_location = serializers.CharField(max_length=255, required=False)
+    available_days = serializers.CharField(max_length=255, required=False)
+    service_radius_km = serializers.IntegerField(required=False)
+    is_active = serializers.BooleanField(default=True)
+
+    def validate(self, data):
+        # Same rules as ProductSerializer.validate
+        if data['type'] == 'service':
+            if not data.get('duration_minutes'):
+                raise serializers.ValidationError("Duration is required for services.")
+        elif data.get('quantity') is None:
+            raise serializers.ValidationError("Quantity is required for products.")
+        return data
+
+
+# -----------------------------
+# Readers / writers
+# -----------------------------
+def detect_format(filename, requested=None):
+    file_format = (requested or filename.rsplit('.', 1)[-1]).lower()
+    if file_format in ('ndjson', 'json'):
+        file_format = 'jsonl'
+    if file_format not in BULK_FORMATS:
+        raise serializers.ValidationError({'file_format': f"Expected one of: {', '.join(BULK_FORMATS)}."})
+    return file_format
+
+
+class ImportFileError(Exception):
+    """The file as a whole cannot be read (bad encoding, malformed CSV); nothing is imported."""
+
+
+def read_rows(binary_file, file_format):
+    """
+    Lazily yield one dict per record. Lines that cannot be parsed are yielded
+    as ValueError instances so the importer can report them against their row.
+    Raises ImportFileError when the file cannot be read any further.
+    """
+    text = io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
+    try:
+        if file_format == 'csv':
+            reader = csv.DictReader(text)
+            try:
+                yield from reader
+            except csv.Error as e:
+                raise ImportFileError(f'Malformed CSV on line {reader.line_num}: {e}')
+            return
+        for line in text:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                yield ValueError(f'Invalid JSON: {e}')
+    except UnicodeDecodeError:
+        raise ImportFileError('The file is not UTF-8 encoded text.')
+
+
+class Echo:
+    """File-like object whose write() returns the value, for streaming csv.writer output."""
+
+    def write(self, value):
+        return value
+
+
+def export_products(queryset, file_format):
+    """
+    Yield the products in `queryset` as CSV or JSONL lines, using the import
+    columns so an export can be edited and re-imported.
+    """
+    queryset = queryset.select_related('category', 'subcategory', 'brand').prefetch_related('colors', 'sizes')
+    writer = csv.writer(Echo())
+    if file_format == 'csv':
+        yield writer.writerow(PRODUCT_COLUMNS)
+
+    for product in queryset.order_by('id').iterator(chunk_size=DEFAULT_BATCH_SIZE):
+        row = {
+            column: getattr(product, column) for column in PRODUCT_COLUMNS
+            if column not in ('category', 'subcategory', 'brand', 'colors', 'sizes')
+        }
+        row.update({
+            'price': str(product.price),
+            'category': product.category.name if product.category else None,
+            'subcategory': product.subcategory.name if product.subcategory else None,
+            'brand': product.brand.name if product.brand else None,
+            'colors': [color.name for color in product.colors.all()],
+            'sizes': [size.name for size in product.sizes.all()],
+        })
+        if file_format == 'csv':
+            row['colors'] = ','.join(row['colors'])
+            row['sizes'] = ','.join(row['sizes'])
+            yield writer.writerow(['' if row[column] is None else row[column] for column in PRODUCT_COLUMNS])
+        else:
+            yield json.dumps(row) + '\n'
+
+
+# -----------------------------
+# Importer
+# -----------------------------
+class ProductImporter:
+    """
+    Validate and create products for one vendor in batches.
+
+    Each batch costs a fixed number of queries whatever its size: one lookup per
+    relation for names not seen in earlier batches, one bulk insert for the
+    products and one per M2M through table. Invalid rows are skipped and
+    reported with their (1-based, header excluded) row number.
+    """
+
+    def __init__(self, vendor, batch_size=DEFAULT_BATCH_SIZE, dry_run=False):
+        self.vendor = vendor
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.rows = 0
+        self.created = 0
+        self.errors = []
+        self.row_serializer = ProductImportRowSerializer()
+        # Lower-cased name -> instance (None when it does not exist), shared across batches
+        self.categories = {}
+        self.subcategories = {}  # keyed by (category_id, lower-cased name)
+        self.brands = {}
+        self.colors = {}
+        self.sizes = {}
+
+    def run(self, rows):
+        """
+        Import `rows` (see read_rows) and return the report. All or nothing:
+        when reading fails with ImportFileError, batches already inserted are
+        rolled back and the error is raised.
+        """
+        batch = []
+        with transaction.atomic():
+            for number, row in enumerate(rows, start=1):
+                self.rows = number
+                batch.append((number, row))
+                if len(batch) >= self.batch_size:
+                    self.import_batch(batch)
+                    batch = []
+            if batch:
+                self.import_batch(batch)
+        return self.report()
+
+    def report(self):
+        return {'rows': self.rows, 'created': self.created, 'errors': self.errors}
+
+    def import_batch(self, batch):
+        valid = []
+        for number, row in batch:
+            data, errors = self.validate_row(row)
+            if errors:
+                self.errors.append({'row': number, 'errors': errors})
+            else:
+                valid.append((number, data))
+
+        self.resolve_names([data for _, data in valid])
+
+        products, color_ids, size_ids = [], [], []
+        for number, data in valid:
+            product, errors = self.build_product(data)
+            if errors:
+                self.errors.append({'row': number, 'errors': errors})
+                continue
+            products.append(product)
+            color_ids.append({self.colors[name.lower()].pk for name in data['colors']})
+            size_ids.append({self.sizes[name.lower()].pk for name in data['sizes']})
+
+        if self.dry_run:
+            # Nothing is written; `created` counts the rows that would have been
+            self.created += len(products)
+            return
+        if not products:
+            return
+
+        with transaction.atomic():
+            Product.objects.bulk_create(products)
+            Product.colors.through.objects.bulk_create([
+                Product.colors.through(product_id=product.pk, color_id=color_id)
+                for product, ids in zip(products, color_ids) for color_id in ids
+            ])
+            Product.sizes.through.objects.bulk_create([
+                Product.sizes.through(product_id=product.pk, size_id=size_id)
+                for product, ids in zip(products, size_ids) for size_id in ids
+            ])
+        # bulk_create skips post_save, so maintain the search index here
+        update_search_vectors(Product.objects.filter(pk__in=[product.pk for product in products]))
+        self.created += len(products)
+
+    def validate_row(self, row):
+        if isinstance(row, Exception):
+            return None, {'non_field_errors': [str(row)]}
+        if not isinstance(row, dict):
+            return None, {'non_field_errors': ['Expected an object.']}
+
+        # Blank CSV cells mean "not provided"
+        cleaned = {}
+        for column in PRODUCT_COLUMNS:
+            value = row.get(column)
+            if isinstance(value, str):
+                value = value.strip()
+            if value not in (None, '', []):
+                cleaned[column] = value
+        if isinstance(cleaned.get('tags'), list):
+            cleaned['tags'] = ','.join(cleaned['tags'])
+
+        # One serializer is reused for every row: building its fields per row costs more than validating
+        try:
+            return self.row_serializer.run_validation(cleaned), None
+        except serializers.ValidationError as e:
+            return None, serializers.as_serializer_error(e)
+
+    def resolve_names(self, rows):
+        """Fetch every category, subcategory, brand, color and size named in `rows` not already known."""
+        self._lookup(Category, self.categories, {row['category'] for row in rows if 'category' in row})
+        self._lookup(Brand, self.brands, {row['brand'] for row in rows if 'brand' in row})
+        self._lookup(Color, self.colors, {name for row in rows for name in row['colors']})
+        self._lookup(Size, self.sizes, {name for row in rows for name in row['sizes']})
+
+        wanted = set()
+        for row in rows:
+            category = self.categories.get(row.get('category', '').lower())
+            if category and 'subcategory' in row:
+                wanted.add((category.pk, row['subcategory'].lower()))
+        missing = wanted - self.subcategories.keys()
+        if missing:
+            self.subcategories.update(dict.fromkeys(missing))
+            queryset = SubCategory.objects.annotate(lower_name=Lower('name')).filter(
+                category_id__in={category_id for category_id, _ in missing},
+                lower_name__in={name for _, name in missing},
+            ).order_by('-id')
+            for subcategory in queryset:
+                key = (subcategory.category_id, subcategory.lower_name)
+                if key in missing:
+                    self.subcategories[key] = subcategory
+
+    def _lookup(self, model, known, names):
+        missing = {name.lower() for name in names} - known.keys()
+        if not missing:
+            return
+        known.update(dict.fromkeys(missing))
+        # Descending id so the oldest row wins when names are duplicated
+        for instance in model.objects.annotate(lower_name=Lower('name')).filter(lower_name__in=missing).order_by('-id'):
+            known[instance.lower_name] = instance
+
+    def build_product(self, data):
+        errors = {}
+        category = subcategory = brand = None
+
+        if 'category' in data:
+            category = self.categories[data['category'].lower()]
+            if category is None:
+                errors['category'] = [f"Unknown category '{data['category']}'."]
+            elif category.category_type != data['type']:
+                errors['category'] = [
+                    f"Category '{category.name}' is for {category.category_type}s, "
+                    f"but this item is a {data['type']}."
+                ]
+        if 'subcategory' in data:
+            if category is None:
+                errors.setdefault('subcategory', ["You must select a category before selecting a subcategory."])
+            else:
+                subcategory = self.subcategories.get((category.pk, data['subcategory'].lower()))
+                if subcategory is None:
+                    errors['subcategory'] = [
+                        f"Unknown subcategory '{data['subcategory']}' for category '{category.name}'."
+                    ]
+        if 'brand' in data:
+            brand = self.brands[data['brand'].lower()]
+            if brand is None:
+                errors['brand'] = [f"Unknown brand '{data['brand']}'."]
+        for field, known in (('colors', self.colors), ('sizes', self.sizes)):
+            unknown = [name for name in data[field] if known[name.lower()] is None]
+            if unknown:
+                errors[field] = [f"Unknown {field}: {', '.join(unknown)}."]
+
+        if errors:
+            return None, errors
+
+        fields = {key: value for key, value in data.items() if key not in ('category', 'subcategory', 'brand', 'colors', 'sizes')}
+        return Product(vendor=self.vendor, category=category, subcategory=subcategory, brand=brand, **fields), None
@@ -0,0 +1,117 @@
+from decimal import Decimal, InvalidOperation
+from django.db.models import Exists, OuterRef, Q
+from rest_framework.exceptions import ValidationError
+from .models import Product
+
+# Sort options advertised by SortOptionsView, with the ordering each one applies.
+# Every ordering ends in a unique column so cursor pagination stays stable.
+SORT_OPTIONS = [
+    {'id': 1, 'name': 'Price: Low to High', 'value': 'price_asc', 'ordering': ('price', 'id')},
+    {'id': 2, 'name': 'Price: High to Low', 'value': 'price_desc', 'ordering': ('-price', '-id')},
+    {'id': 3, 'name': 'Newest Arrivals', 'value': 'newest', 'ordering': ('-created_at', '-id')},
+    {'id': 4, 'name': 'Best Sellers', 'value': 'best_sellers', 'ordering': ('-sales_count', '-id')},
+    {'id': 5, 'name': 'Top Rated', 'value': 'top_rated', 'ordering': ('-rating_average', '-id')},
+]
+
+DEFAULT_SORT = 'newest'
+
+
+class ProductFilter:
+    """
+    Composable server-side filtering and sorting for product listings.
+
+    Each supported query parameter maps to a method that narrows the queryset,
+    so filters can be combined freely. Empty or unknown parameters are ignored.
+    """
+    filters = {
+        'category': 'filter_category',
+        'subcategory': 'filter_subcategory',
+        'brand': 'filter_brand',
+        'color': 'filter_color',
+        'size': 'filter_size',
+        'min_price': 'filter_min_price',
+        'max_price': 'filter_max_price',
+        'type': 'filter_type',
+        'vendor': 'filter_vendor',
+        'min_rating': 'filter_min_rating',
+        'in_stock': 'filter_in_stock',
+    }
+
+    def __init__(self, params):
+        self.params = params
+
+    def filter_queryset(self, queryset):
+        for param, method in self.filters.items():
+            value = self.params.get(param)
+            if value not in (None, ''):
+                queryset = getattr(self, method)(queryset, value)
+        return queryset.order_by(*self.ordering)
+
+    @property
+    def ordering(self):
+        sort = self.params.get('sort') or DEFAULT_SORT
+        for option in SORT_OPTIONS:
+            if option['value'] == sort:
+                return option['ordering']
+        raise ValidationError({'sort': f"Unknown sort option '{sort}'."})
+
+    # -----------------------------
+    # Value parsing
+    # -----------------------------
+    def _ids(self, param, value):
+        try:
+            return [int(part) for part in value.split(',') if part.strip()]
+        except ValueError:
+            raise ValidationError({param: 'Expected a comma-separated list of ids.'})
+
+    def _decimal(self, param, value):
+        try:
+            return Decimal(value)
+        except InvalidOperation:
+            raise ValidationError({param: 'Expected a number.'})
+
+    # -----------------------------
+    # Filters
+    # -----------------------------
+    def filter_category(self, queryset, value):
+        return queryset.filter(category_id__in=self._ids('category', value))
+
+    def filter_subcategory(self, queryset, value):
+        return queryset.filter(subcategory_id__in=self._ids('subcategory', value))
+
+    def filter_brand(self, queryset, value):
+        return queryset.filter(brand_id__in=self._ids('brand', value))
+
+    def filter_color(self, queryset, value):
+        # EXISTS on the through table avoids the duplicate rows (and DISTINCT) a join would need
+        matches = Product.colors.through.objects.filter(
+            product_id=OuterRef('pk'), color_id__in=self._ids('color', value)
+        )
+        return queryset.filter(Exists(matches))
+
+    def filter_size(self, queryset, value):
+        matches = Product.sizes.through.objects.filter(
+            product_id=OuterRef('pk'), size_id__in=self._ids('size', value)
+        )
+        return queryset.filter(Exists(matches))
+
+    def filter_min_price(self, queryset, value):
+        return queryset.filter(price__gte=self._decimal('min_price', value))
+
+    def filter_max_price(self, queryset, value):
+        return queryset.filter(price__lte=self._decimal('max_price', value))
+
+    def filter_type(self, queryset, value):
+        return queryset.filter(type=value)
+
+    def filter_vendor(self, queryset, value):
+        return queryset.filter(vendor_id__in=self._ids('vendor', value))
+
+    def filter_min_rating(self, queryset, value):
+        return queryset.filter(rating_average__gte=self._decimal('min_rating', value))
+
+    def filter_in_stock(self, queryset, value):
+        if value.lower() not in ('1', 'true', 'yes'):
+            return queryset
+        # Services have no stock; products need a positive quantity
+        return queryset.filter(Q(type='service') | Q(quantity__gt=0))
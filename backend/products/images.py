@@ -0,0 +1,116 @@
+import logging
+import os
+from io import BytesIO
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Responsive variants generated for every product image: (name, max width in px)
+IMAGE_VARIANTS = (
+    ('thumb', 150),
+    ('card', 400),
+    ('full', 1200),
+)
+
+# (key in the variants map, Pillow format, file extension)
+IMAGE_FORMATS = (
+    ('jpeg', 'JPEG', 'jpg'),
+    ('webp', 'WEBP', 'webp'),
+)
+
+IMAGE_QUALITY = 82
+
+
+def variant_name(name, variant, extension):
+    """products/shoe.png -> products/shoe.thumb.webp (stored next to the original)"""
+    root, _ = os.path.splitext(name)
+    return f'{root}.{variant}.{extension}'
+
+
+def _flatten(image):
+    # JPEG has no alpha channel: composite transparent images onto white
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def build_variants(field_file):
+    """
+    Resize `field_file` to every IMAGE_VARIANTS width in every IMAGE_FORMATS
+    format and save the results in the same storage. Returns the variants map
+    stored on the model, e.g.
+    {'source': 'products/a.jpg', 'thumb': {'width': 150, 'height': 100, 'jpeg': ..., 'webp': ...}}
+    """
+    storage = field_file.storage
+    with field_file.open('rb') as source_file:
+        source = Image.open(source_file)
+        source = ImageOps.exif_transpose(source)
+        source.load()
+
+    variants = {'source': field_file.name}
+    for variant, max_width in IMAGE_VARIANTS:
+        image = source
+        if image.width > max_width:
+            height = max(1, round(image.height * max_width / image.width))
+            image = image.resize((max_width, height), Image.LANCZOS)
+
+        entry = {'width': image.width, 'height': image.height}
+        for key, pil_format, extension in IMAGE_FORMATS:
+            output = _flatten(image) if pil_format == 'JPEG' else image.convert('RGBA')
+            buffer = BytesIO()
+            output.save(buffer, pil_format, quality=IMAGE_QUALITY)
+            name = variant_name(field_file.name, variant, extension)
+            if storage.exists(name):
+                storage.delete(name)
+            entry[key] = storage.save(name, ContentFile(buffer.getvalue()))
+        variants[variant] = entry
+    return variants
+
+
+def variant_files(variants):
+    """Names of the files in a variants map."""
+    return {
+        variants[variant][key]
+        for variant, _ in IMAGE_VARIANTS if variant in variants
+        for key, _, _ in IMAGE_FORMATS if variants[variant].get(key)
+    }
+
+
+def delete_variants(storage, variants, keep=()):
+    """Delete the files of a variants map, except those named in `keep`."""
+    for name in variant_files(variants) - set(keep):
+        if storage.exists(name):
+            storage.delete(name)
+
+
+def refresh_image_variants(instance, force=False):
+    """
+    Make sure `instance.image_variants` matches `instance.image`, generating
+    the variants when the image was added or replaced. Cheap no-op otherwise.
+    """
+    field_file = instance.image
+    old_variants = instance.image_variants or {}
+    if not field_file and not old_variants:
+        return False
+    if not field_file:
+        variants = {}
+    elif not force and old_variants.get('source') == field_file.name:
+        return False
+    else:
+        try:
+            variants = build_variants(field_file)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not build image variants for {instance!r}: {e}")
+            return False
+
+    if old_variants and old_variants.get('source') != variants.get('source'):
+        # A new source with the same stem (foo.png -> foo.jpg) reuses the variant names just written
+        delete_variants(field_file.storage, old_variants, keep=variant_files(variants))
+
+    type(instance).objects.filter(pk=instance.pk).update(image_variants=variants)
+    instance.image_variants = variants
+    return True
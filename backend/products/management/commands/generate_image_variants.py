@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from products.images import refresh_image_variants
+from products.models import Product, ProductDetailImage
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnail/card/full and WebP variants for product images that are missing them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate variants even if they are up to date')
+
+    def handle(self, *args, **options):
+        generated = 0
+        for model in (Product, ProductDetailImage):
+            queryset = model.objects.exclude(image='').exclude(image__isnull=True).only('pk', 'image', 'image_variants')
+            for instance in queryset.iterator():
+                if refresh_image_variants(instance, force=options['force']):
+                    generated += 1
+        self.stdout.write(self.style.SUCCESS(f'Generated variants for {generated} images.'))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+from products.bulk import DEFAULT_BATCH_SIZE, ImportFileError, ProductImporter, detect_format, read_rows
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Bulk import products for a vendor from a CSV or JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file to import')
+        parser.add_argument('--vendor', required=True, help='Vendor email or id')
+        parser.add_argument('--format', dest='file_format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Rows validated and inserted per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Validate the file without saving anything')
+
+    def handle(self, *args, **options):
+        vendor_lookup = {'pk': options['vendor']} if options['vendor'].isdigit() else {'email': options['vendor']}
+        try:
+            vendor = User.objects.get(role='vendor', **vendor_lookup)
+        except User.DoesNotExist:
+            raise CommandError(f"Vendor '{options['vendor']}' not found")
+
+        try:
+            file_format = detect_format(options['path'], options['file_format'])
+        except ValidationError as e:
+            raise CommandError(e.detail['file_format'][0])
+
+        importer = ProductImporter(vendor, batch_size=options['batch_size'], dry_run=options['dry_run'])
+        with open(options['path'], 'rb') as f:
+            try:
+                report = importer.run(read_rows(f, file_format))
+            except ImportFileError as e:
+                raise CommandError(f'{e} Nothing was imported.')
+
+        for error in report['errors']:
+            self.stderr.write(f"Row {error['row']}: {error['errors']}")
+        action = 'Validated' if options['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f"{action} {report['created']} of {report['rows']} rows ({len(report['errors'])} errors)."
+        ))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from products.models import Product, Review
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the stored rating_sum/rating_count/rating_average columns on products from their reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--product',
+            type=int,
+            action='append',
+            dest='product_ids',
+            help='Only rebuild the given product id (can be repeated)'
+        )
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        if options['product_ids']:
+            products = products.filter(pk__in=options['product_ids'])
+
+        reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+        rating_sum = reviews.annotate(total=Sum('rating')).values('total')
+        rating_count = reviews.annotate(total=Count('id')).values('total')
+
+        # One UPDATE for the aggregates and one for the averages, whatever the catalog size
+        with transaction.atomic():
+            updated = products.update(
+                rating_sum=Coalesce(Subquery(rating_sum, output_field=IntegerField()), 0),
+                rating_count=Coalesce(Subquery(rating_count, output_field=IntegerField()), 0),
+            )
+            products.refresh_rating_average()
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating aggregates for {updated} products.'))
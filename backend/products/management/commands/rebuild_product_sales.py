@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from django.db.models import IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from orders.models import OrderItem
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Recompute Product.sales_count from order items, ignoring cancelled orders'
+
+    def handle(self, *args, **options):
+        sold = (
+            OrderItem.objects.filter(product=OuterRef('pk'))
+            .exclude(order__status='cancelled')
+            .order_by()
+            .values('product')
+            .annotate(total=Sum('quantity'))
+            .values('total')
+        )
+        updated = Product.objects.update(
+            sales_count=Coalesce(Subquery(sold, output_field=IntegerField()), 0)
+        )
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt sales counters for {updated} products.'))
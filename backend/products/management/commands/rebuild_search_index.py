@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from products.models import Product
+from products.search import update_search_vectors
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search vectors for all products (PostgreSQL only)'
+
+    def handle(self, *args, **options):
+        updated = update_search_vectors(Product.objects.all())
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt search vectors for {updated} products.'))
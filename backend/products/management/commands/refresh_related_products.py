@@ -0,0 +1,145 @@
+import heapq
+from collections import defaultdict
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Q
+from django.utils import timezone
+from orders.models import OrderItem
+from products.models import Product, RelatedProduct
+
+# Score weights for each signal linking two products
+CO_PURCHASE_WEIGHT = 3.0
+SHARED_TAG_WEIGHT = 2.0
+SAME_SUBCATEGORY_WEIGHT = 1.0
+SAME_CATEGORY_WEIGHT = 0.5
+
+
+def parse_tags(tags):
+    return {tag.strip().lower() for tag in (tags or '').split(',') if tag.strip()}
+
+
+class Command(BaseCommand):
+    help = 'Refresh the precomputed related-products table from shared category, tags and co-purchases'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute every product instead of only stale ones')
+        parser.add_argument('--limit', type=int, default=20, help='Related products kept per product')
+        parser.add_argument('--batch-size', type=int, default=500, help='Products refreshed per transaction')
+
+    def handle(self, *args, **options):
+        catalog = {
+            row['id']: row
+            for row in Product.objects.filter(is_active=True).values('id', 'category_id', 'subcategory_id', 'tags')
+        }
+        by_category = defaultdict(list)
+        for row in catalog.values():
+            row['tag_set'] = parse_tags(row['tags'])
+            if row['category_id']:
+                by_category[row['category_id']].append(row['id'])
+
+        started = timezone.now()
+        if options['full']:
+            changed_ids = set()
+            target_ids = sorted(catalog)
+        else:
+            changed_ids = self.get_changed_product_ids()
+            target_ids = self.get_stale_product_ids(changed_ids, catalog, by_category)
+        batch_size = options['batch_size']
+        refreshed = 0
+        for start in range(0, len(target_ids), batch_size):
+            batch = target_ids[start:start + batch_size]
+            rows = self.build_rows(batch, catalog, by_category, options['limit'])
+            with transaction.atomic():
+                RelatedProduct.objects.filter(product_id__in=batch).delete()
+                RelatedProduct.objects.bulk_create(rows)
+                # queryset update() leaves updated_at alone, so this does not mark the batch changed again
+                Product.objects.filter(pk__in=batch).update(related_refreshed_at=started)
+            refreshed += len(batch)
+
+        # Inactive products are never ranked; stamp them so their neighbours are refreshed only once
+        retired_ids = changed_ids - catalog.keys()
+        if retired_ids:
+            Product.objects.filter(pk__in=retired_ids).update(related_refreshed_at=started)
+
+        self.stdout.write(self.style.SUCCESS(f'Refreshed related products for {refreshed} products.'))
+
+    def get_changed_product_ids(self):
+        """
+        Products never ranked, or edited or ordered since they were last ranked.
+        """
+        new_orders = OrderItem.objects.filter(
+            product_id=OuterRef('pk'),
+            order__created_at__gt=OuterRef('related_refreshed_at'),
+        )
+        changed = Product.objects.filter(
+            Q(related_refreshed_at__isnull=True)
+            | Q(updated_at__gt=F('related_refreshed_at'))
+            | Exists(new_orders)
+        )
+        return set(changed.values_list('pk', flat=True))
+
+    def get_stale_product_ids(self, changed_ids, catalog, by_category):
+        """
+        The changed products plus every product whose ranking may include
+        one of them: products already listing it, products bought with it
+        and products in its category.
+        """
+        if not changed_ids:
+            return []
+        stale = set(changed_ids)
+        stale.update(
+            RelatedProduct.objects.filter(related_id__in=changed_ids).values_list('product_id', flat=True)
+        )
+        stale.update(
+            OrderItem.objects.filter(order__items__product_id__in=changed_ids).values_list('product_id', flat=True)
+        )
+        for product_id in changed_ids & catalog.keys():
+            category_id = catalog[product_id]['category_id']
+            if category_id:
+                stale.update(by_category[category_id])
+        return sorted(stale & catalog.keys())
+
+    def build_rows(self, batch, catalog, by_category, limit):
+        # Number of distinct orders containing both products, for every pair touching the batch
+        co_purchases = defaultdict(dict)
+        pairs = (
+            OrderItem.objects.filter(order__items__product_id__in=batch)
+            .exclude(product_id=F('order__items__product_id'))
+            .order_by()
+            .values_list('order__items__product_id', 'product_id')
+            .annotate(orders=Count('order_id', distinct=True))
+        )
+        for product_id, related_id, orders in pairs:
+            co_purchases[product_id][related_id] = orders
+
+        rows = []
+        for product_id in batch:
+            product = catalog[product_id]
+            candidates = set(co_purchases[product_id])
+            if product['category_id']:
+                candidates.update(by_category[product['category_id']])
+            candidates.discard(product_id)
+
+            scored = []
+            for related_id in candidates:
+                related = catalog.get(related_id)
+                if related is None:
+                    continue  # inactive product
+                bought_together = co_purchases[product_id].get(related_id, 0)
+                shared_tags = len(product['tag_set'] & related['tag_set'])
+                score = CO_PURCHASE_WEIGHT * bought_together + SHARED_TAG_WEIGHT * shared_tags
+                if product['category_id'] and related['category_id'] == product['category_id']:
+                    score += SAME_CATEGORY_WEIGHT
+                if product['subcategory_id'] and related['subcategory_id'] == product['subcategory_id']:
+                    score += SAME_SUBCATEGORY_WEIGHT
+                scored.append((score, -related_id, bought_together, shared_tags))
+
+            for score, negative_id, bought_together, shared_tags in heapq.nlargest(limit, scored):
+                rows.append(RelatedProduct(
+                    product_id=product_id,
+                    related_id=-negative_id,
+                    score=score,
+                    co_purchases=bought_together,
+                    shared_tags=shared_tags,
+                ))
+        return rows
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.4 on 2026-10-18 17:44
+
+from django.db import migrations, models
+from django.db.models import Case, Count, DecimalField, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Review = apps.get_model('products', 'Review')
+    reviews = Review.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    Product.objects.update(
+        rating_sum=Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total'), output_field=IntegerField()), 0),
+        rating_count=Coalesce(Subquery(reviews.annotate(total=Count('id')).values('total'), output_field=IntegerField()), 0),
+    )
+    Product.objects.update(
+        rating_average=Case(
+            When(rating_count=0, then=Value(0)),
+            default=Cast('rating_sum', DecimalField(max_digits=12, decimal_places=4)) / F('rating_count'),
+            output_field=DecimalField(max_digits=3, decimal_places=2),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0014_alter_product_subcategory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_average',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 20:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0020_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='related_refreshed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -1,4 +1,8 @@
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models import Case, DecimalField, F, IntegerField, PositiveIntegerField, Value, When
+from django.db.models.functions import Cast, Greatest
 from users.models import User
 
 # -----------------------------
@@ -66,6 +70,60 @@ class Size(models.Model):
 # -----------------------------
 # Main Product/Service Model
 # -----------------------------
+class ProductQuerySet(models.QuerySet):
+    def for_listing(self):
+        """
+        Load everything ProductSerializer needs in a fixed number of queries:
+        one for the products and their foreign keys, one per M2M/reverse relation.
+        """
+        return self.select_related(
+            'category', 'subcategory', 'brand'
+        ).prefetch_related(
+            'colors', 'sizes', 'detail_images'
+        )
+
+    def apply_rating_delta(self, rating_delta, count_delta):
+        """
+        Shift the stored rating aggregates in place, without reading reviews.
+        """
+        self.update(
+            rating_sum=F('rating_sum') + rating_delta,
+            rating_count=F('rating_count') + count_delta,
+        )
+        return self.refresh_rating_average()
+
+    def record_sales(self, quantities):
+        """
+        Add sold quantities ({product_id: quantity}) to sales_count in one UPDATE.
+        Negative quantities take sales back (cancelled orders), never below zero.
+        """
+        if not quantities:
+            return 0
+        with transaction.atomic():
+            # A multi-row UPDATE locks rows in plan order: lock them in id order first,
+            # like orders.inventory.take_stock, so concurrent orders cannot deadlock
+            list(self.select_for_update().filter(pk__in=quantities.keys()).order_by('pk').values_list('pk'))
+            return self.filter(pk__in=quantities.keys()).update(
+                sales_count=Greatest(F('sales_count') + Case(
+                    *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+                    default=Value(0),
+                    output_field=IntegerField(),
+                ), Value(0))
+            )
+
+    def refresh_rating_average(self):
+        """
+        Recompute rating_average from the stored rating_sum/rating_count columns.
+        """
+        return self.update(
+            rating_average=Case(
+                When(rating_count=0, then=Value(0)),
+                default=Cast('rating_sum', DecimalField(max_digits=12, decimal_places=4)) / F('rating_count'),
+                output_field=DecimalField(max_digits=3, decimal_places=2),
+            )
+        )
+
+
 class Product(models.Model):
     TYPE_CHOICES = (
         ('product', 'Product'),
@@ -92,6 +150,8 @@ class Product(models.Model):
     sizes = models.ManyToManyField(Size, blank=True)
 
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    # Resized/WebP derivatives of `image`, maintained by products.images
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     # Service-specific fields
     duration_minutes = models.PositiveIntegerField(blank=True, null=True, help_text="Duration in minutes for services")
@@ -105,6 +165,37 @@ class Product(models.Model):
     is_active = models.BooleanField(default=True)
     tags = models.CharField(max_length=255, blank=True, help_text="Comma-separated keywords")
 
+    # Denormalized review aggregates, maintained by products.signals
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_average = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+
+    # Units sold, maintained by orders.signals; used by the best_sellers sort
+    sales_count = models.PositiveIntegerField(default=0)
+
+    # Full-text search document, maintained by products.signals (see products/search.py)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    # When refresh_related_products last ranked this product, even if it found nothing related
+    related_refreshed_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id']),
+            # Composite indexes backing products.filters.ProductFilter
+            models.Index(fields=['is_active', 'category', 'price']),
+            models.Index(fields=['is_active', 'type', 'price']),
+            models.Index(fields=['is_active', 'price', 'id']),
+            models.Index(fields=['is_active', '-sales_count', '-id']),
+            models.Index(fields=['is_active', '-rating_average', '-id']),
+            models.Index(fields=['vendor', 'is_active']),
+            # Full-text and typo-tolerant search (products/search.py)
+            GinIndex(fields=['search_vector'], name='product_search_vector_gin'),
+            GinIndex(fields=['name'], name='product_name_trgm', opclasses=['gin_trgm_ops']),
+        ]
+
     def clean(self):
         """
         Custom validation to ensure data consistency
@@ -135,13 +226,10 @@ class Product(models.Model):
         super().save(*args, **kwargs)
     
     def average_rating(self):
-        reviews = self.reviews.all()
-        if reviews.exists():
-            return round(sum([review.rating for review in reviews]) / reviews.count(), 1)
-        return 0
+        return round(float(self.rating_average), 1)
 
     def review_count(self):
-        return self.reviews.count()
+        return self.rating_count
 
     def __str__(self):
         return f"{self.name} ({self.type}) by {self.vendor}"
@@ -154,6 +242,7 @@ class Product(models.Model):
 class ProductDetailImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='detail_images')
     image = models.ImageField(upload_to='products/detail_images')
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return f"Detail Image for {self.product.name}"
@@ -173,4 +262,27 @@ class Review(models.Model):
         unique_together = ('product', 'user')  # Prevents duplicate reviews per product per user
 
     def __str__(self):
-        return f"{self.user.username} - {self.rating}⭐ for {self.product.name}"
\ No newline at end of file
+        return f"{self.user.username} - {self.rating}⭐ for {self.product.name}"
+
+
+class RelatedProduct(models.Model):
+    """
+    Precomputed "related items" for a product, refreshed offline by the
+    refresh_related_products management command.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_entries')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_to_entries')
+    score = models.FloatField(default=0.0)
+    co_purchases = models.PositiveIntegerField(default=0)
+    shared_tags = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('product', 'related')
+        indexes = [
+            models.Index(fields=['product', '-score']),
+            models.Index(fields=['updated_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.related.name} related to {self.product.name} ({self.score:.2f})"
@@ -10,4 +10,8 @@ class IsVendorOrReadOnly(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         if request.method in permissions.SAFE_METHODS:
             return True
-        return request.user == obj.vendor
\ No newline at end of file
+        return request.user == obj.vendor
+
+class IsApprovedVendor(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and request.user.role == 'vendor' and request.user.is_approved
@@ -0,0 +1,60 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db import connection
+from django.db.models import F, OuterRef, Q, Subquery
+from .models import Brand, Category
+
+SEARCH_CONFIG = 'english'
+
+
+def product_search_vector():
+    """
+    Weighted tsvector for a product row: name first, then tags, brand and
+    category, then the descriptions. Brand and category names are read with
+    subqueries so the expression works inside a plain UPDATE.
+    """
+    brand_name = Subquery(Brand.objects.filter(pk=OuterRef('brand_id')).values('name')[:1])
+    category_name = Subquery(Category.objects.filter(pk=OuterRef('category_id')).values('name')[:1])
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('tags', weight='B', config=SEARCH_CONFIG)
+        + SearchVector(brand_name, weight='B', config=SEARCH_CONFIG)
+        + SearchVector(category_name, weight='B', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='C', config=SEARCH_CONFIG)
+        + SearchVector('additional_information', weight='D', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(queryset):
+    """
+    Refresh search_vector for the given products with a single UPDATE.
+    Full-text search is PostgreSQL-only; other backends are left untouched.
+    """
+    if connection.vendor != 'postgresql':
+        return 0
+    return queryset.update(search_vector=product_search_vector())
+
+
+def search_products(queryset, term):
+    """
+    Rank products matching `term`.
+
+    On PostgreSQL this uses the GIN-indexed search_vector for full-text
+    matches plus a trigram match on the name for typo tolerance, ordered by
+    text rank then name similarity. Other backends fall back to icontains.
+    """
+    if connection.vendor != 'postgresql':
+        return queryset.filter(
+            Q(name__icontains=term)
+            | Q(description__icontains=term)
+            | Q(tags__icontains=term)
+            | Q(brand__name__icontains=term)
+            | Q(category__name__icontains=term)
+        ).order_by('-id')
+
+    query = SearchQuery(term, config=SEARCH_CONFIG, search_type='websearch')
+    return queryset.annotate(
+        rank=SearchRank(F('search_vector'), query),
+        similarity=TrigramSimilarity('name', term),
+    ).filter(
+        Q(search_vector=query) | Q(name__trigram_similar=term)
+    ).order_by('-rank', '-similarity', '-id')
@@ -1,6 +1,42 @@
 from rest_framework import serializers
 from .models import Product, Category, SubCategory, Brand, Color, Size, ProductDetailImage
 from users.models import User
+from .images import IMAGE_FORMATS, IMAGE_VARIANTS
+
+
+class ImageVariantsMixin:
+    """
+    Exposes the stored image variants as absolute URLs:
+    image_variants: {'thumb': {'width': 150, 'height': 100, 'jpeg': url, 'webp': url}, ...}
+    image_srcset: {'jpeg': 'url 150w, url 400w, url 1200w', 'webp': '...'}
+    Both are empty until the variants have been generated.
+    """
+
+    def _absolute_url(self, storage, name):
+        request = self.context.get('request')
+        url = storage.url(name)
+        return request.build_absolute_uri(url) if request else url
+
+    def get_image_variants(self, obj):
+        variants = obj.image_variants or {}
+        if not obj.image or variants.get('source') != obj.image.name:
+            return {}
+        storage = obj.image.storage
+        result = {}
+        for name, _ in IMAGE_VARIANTS:
+            entry = variants.get(name)
+            if entry:
+                result[name] = {'width': entry['width'], 'height': entry['height']}
+                for key, _, _ in IMAGE_FORMATS:
+                    result[name][key] = self._absolute_url(storage, entry[key])
+        return result
+
+    def get_image_srcset(self, obj):
+        variants = self.get_image_variants(obj)
+        return {
+            key: ', '.join(f"{entry[key]} {entry['width']}w" for entry in variants.values())
+            for key, _, _ in IMAGE_FORMATS
+        } if variants else {}
 
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
@@ -27,12 +63,39 @@ class SizeSerializer(serializers.ModelSerializer):
         model = Size
         fields = ['id', 'name', 'value', 'unit']
 
-class ProductDetailImageSerializer(serializers.ModelSerializer):
+class ProductDetailImageSerializer(ImageVariantsMixin, serializers.ModelSerializer):
+    image_variants = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = ProductDetailImage
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'image_variants', 'image_srcset']
+
+class ProductSummarySerializer(ImageVariantsMixin, serializers.ModelSerializer):
+    """
+    Compact read-only product used by default in lists, carts and orders.
+    """
+    thumbnail = serializers.SerializerMethodField()
+    rating = serializers.ReadOnlyField(source='average_rating')
+    stock = serializers.IntegerField(source='quantity', read_only=True)
+    vendor_id = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'price', 'thumbnail', 'rating', 'stock', 'vendor_id']
+        read_only_fields = fields
+
+    def get_thumbnail(self, obj):
+        if not obj.image:
+            return None
+        variants = obj.image_variants or {}
+        if variants.get('source') == obj.image.name and 'thumb' in variants:
+            return self._absolute_url(obj.image.storage, variants['thumb']['webp'])
+        # Variants not generated yet: fall back to the original
+        return self._absolute_url(obj.image.storage, obj.image.name)
+
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(ImageVariantsMixin, serializers.ModelSerializer):
     vendor = serializers.PrimaryKeyRelatedField(queryset=User.objects.filter(role='vendor', is_approved=True), required=False)
     category = CategorySerializer(read_only=True)
     category_id = serializers.IntegerField(write_only=True, required=False)
@@ -46,16 +109,25 @@ class ProductSerializer(serializers.ModelSerializer):
     size_ids = serializers.ListField(child=serializers.IntegerField(), write_only=True, required=False)
     detail_images = ProductDetailImageSerializer(many=True, read_only=True)
     image_url = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
+    image_srcset = serializers.SerializerMethodField()
     average_rating = serializers.ReadOnlyField()
     review_count = serializers.ReadOnlyField()
 
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Optional subset of fields to render (see get_product_serializer)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
     class Meta:
         model = Product
         fields = [
             'id', 'vendor', 'type', 'name', 'description', 'additional_information', 
             'price', 'quantity', 'category', 'category_id', 'subcategory', 'subcategory_id',
             'brand', 'brand_id', 'model', 'colors', 'color_ids', 'sizes', 'size_ids',
-            'image', 'image_url', 'duration_minutes', 'service_location', 'available_days',
+            'image', 'image_url', 'image_variants', 'image_srcset', 'duration_minutes', 'service_location', 'available_days',
             'service_radius_km', 'tags', 'is_active', 'created_at', 'updated_at',
             'detail_images', 'average_rating', 'review_count'
         ]
@@ -138,3 +210,48 @@ class ProductSerializer(serializers.ModelSerializer):
             instance.sizes.set(size_ids)
         
         return instance
+
+
+# Query parameter selecting the product representation: "summary" (default),
+# "full", or a comma-separated list of ProductSerializer fields
+PRODUCT_FIELDS_PARAM = 'fields'
+
+
+def get_product_serializer(context, *args, **kwargs):
+    """
+    Build the product serializer requested by the `fields` query parameter.
+    """
+    request = context.get('request')
+    selection = request.query_params.get(PRODUCT_FIELDS_PARAM, '') if request else ''
+    selection = selection.strip().lower()
+    if selection in ('', 'summary'):
+        return ProductSummarySerializer(*args, context=context, **kwargs)
+    if selection == 'full':
+        return ProductSerializer(*args, context=context, **kwargs)
+
+    fields = [field.strip() for field in selection.split(',') if field.strip()]
+    unknown = set(fields) - set(ProductSerializer.Meta.fields)
+    if unknown:
+        raise serializers.ValidationError({PRODUCT_FIELDS_PARAM: f"Unknown fields: {', '.join(sorted(unknown))}."})
+    return ProductSerializer(*args, context=context, fields=fields, **kwargs)
+
+
+def is_summary_request(request):
+    return request.query_params.get(PRODUCT_FIELDS_PARAM, '').strip().lower() in ('', 'summary')
+
+
+class ProductRepresentationField(serializers.Field):
+    """
+    Read-only nested product honouring the `fields` query parameter:
+    a summary by default, the full product with ?fields=full.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, product):
+        # Built once per field, so it is shared by every row of a list
+        if not hasattr(self, '_product_serializer'):
+            self._product_serializer = get_product_serializer(self.context)
+        return self._product_serializer.to_representation(product)
@@ -0,0 +1,82 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from campus_delivery.cache import invalidate_tags
+from .images import refresh_image_variants
+from .models import Brand, Category, Color, Product, ProductDetailImage, Review, Size, SubCategory
+from .search import update_search_vectors
+
+
+@receiver(pre_save, sender=Review)
+def remember_previous_rating(sender, instance, **kwargs):
+    # Keep the stored rating so post_save can apply only the difference
+    instance._previous_rating = None
+    if instance.pk:
+        instance._previous_rating = (
+            Review.objects.filter(pk=instance.pk).values_list('rating', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Review)
+def update_rating_on_save(sender, instance, created, **kwargs):
+    previous_rating = getattr(instance, '_previous_rating', None)
+    if created or previous_rating is None:
+        rating_delta, count_delta = instance.rating, 1
+    else:
+        rating_delta, count_delta = instance.rating - previous_rating, 0
+        if rating_delta == 0:
+            return
+
+    with transaction.atomic():
+        Product.objects.filter(pk=instance.product_id).apply_rating_delta(rating_delta, count_delta)
+
+
+@receiver(post_delete, sender=Review)
+def update_rating_on_delete(sender, instance, **kwargs):
+    with transaction.atomic():
+        Product.objects.filter(pk=instance.product_id).apply_rating_delta(-instance.rating, -1)
+
+
+@receiver(post_save, sender=Product)
+def update_product_search_vector(sender, instance, **kwargs):
+    update_search_vectors(Product.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductDetailImage)
+def update_image_variants(sender, instance, **kwargs):
+    # Only does work when the image was added or replaced
+    refresh_image_variants(instance)
+
+
+@receiver(post_save, sender=Brand)
+def update_brand_search_vectors(sender, instance, created, **kwargs):
+    if not created:
+        update_search_vectors(Product.objects.filter(brand=instance))
+
+
+@receiver(post_save, sender=Category)
+def update_category_search_vectors(sender, instance, created, **kwargs):
+    if not created:
+        update_search_vectors(Product.objects.filter(category=instance))
+
+
+# Cache tags served by the reference-data list views (see campus_delivery.cache)
+CATALOG_CACHE_TAGS = {
+    Category: 'categories',
+    SubCategory: 'subcategories',
+    Brand: 'brands',
+    Color: 'colors',
+    Size: 'sizes',
+}
+
+
+def invalidate_catalog_cache(sender, **kwargs):
+    # Bump after commit so a concurrent read cannot re-cache the old rows under the new version
+    tag = CATALOG_CACHE_TAGS[sender]
+    transaction.on_commit(lambda: invalidate_tags(tag))
+
+
+for model in CATALOG_CACHE_TAGS:
+    post_save.connect(invalidate_catalog_cache, sender=model, dispatch_uid=f'catalog_cache_save_{model.__name__}')
+    post_delete.connect(invalidate_catalog_cache, sender=model, dispatch_uid=f'catalog_cache_delete_{model.__name__}')
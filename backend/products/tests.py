@@ -1,7 +1,26 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from PIL import Image
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from unittest import skipUnless
+from unittest.mock import patch
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, override_settings
 from rest_framework.test import APIClient
 from users.models import User
-from .models import Product
+from campus_delivery.pagination import StandardCursorPagination
+from orders.models import Order, OrderItem
+from .models import Product, ProductDetailImage, Category, SubCategory, Brand, Color, Size, Review, RelatedProduct
+from .serializers import ProductSerializer
+from .bulk import ImportFileError, ProductImporter, read_rows
+from .images import refresh_image_variants
 
 class ProductTests(TestCase):
     def setUp(self):
@@ -59,10 +78,677 @@ class ProductTests(TestCase):
         self.client.force_authenticate(user=None)
         response = self.client.get('/api/products/')
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data), 1)
+        self.assertEqual(len(response.data['results']), 1)
 
     def test_filter_products(self):
         Product.objects.create(**self.product_data)
         response = self.client.get('/api/products/filter/?type=tangible&category=vegetable')
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(len(response.data), 1)
\ No newline at end of file
+        self.assertEqual(len(response.data), 1)
+
+class ProductListingQueryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.vendor = User.objects.create_user(
+            email='listing-vendor@example.com',
+            password='testpass123',
+            first_name='Listing',
+            last_name='Vendor',
+            phone='0711000001',
+            role='vendor',
+            is_approved=True
+        )
+        self.reviewer = User.objects.create_user(
+            email='listing-reviewer@example.com',
+            password='testpass123',
+            first_name='Listing',
+            last_name='Reviewer',
+            phone='0711000002',
+            role='customer'
+        )
+        self.category = Category.objects.create(name='Listing Category', category_type='product')
+        self.brand = Brand.objects.create(name='Listing Brand')
+        self.color = Color.objects.create(name='Red', hex_code='#ff0000')
+        self.size = Size.objects.create(name='Large', value='L', unit='unit')
+
+    def create_products(self, count):
+        for i in range(count):
+            product = Product.objects.create(
+                vendor=self.vendor,
+                name=f'Listing Product {i}',
+                price=10 + i,
+                quantity=5,
+                category=self.category,
+                brand=self.brand
+            )
+            product.colors.add(self.color)
+            product.sizes.add(self.size)
+            Review.objects.create(product=product, user=self.reviewer, rating=4)
+
+    def test_list_query_count_is_constant(self):
+        # 1 query for products (with category/subcategory/brand)
+        # + 3 prefetches (colors, sizes, detail_images)
+        self.create_products(1)
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/products/', {'fields': 'full'})
+        self.assertEqual(response.status_code, 200)
+
+        self.create_products(10)
+        with self.assertNumQueries(4):
+            response = self.client.get('/api/products/', {'fields': 'full'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_summary_list_is_a_single_query(self):
+        self.create_products(5)
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/products/')
+        item = response.data['results'][0]
+        self.assertEqual(set(item), {'id', 'name', 'price', 'thumbnail', 'rating', 'stock', 'vendor_id'})
+        self.assertEqual(item['vendor_id'], self.vendor.id)
+        self.assertEqual(item['stock'], 5)
+
+    def test_field_selection(self):
+        self.create_products(1)
+        response = self.client.get('/api/products/', {'fields': 'id,name,category'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'category'})
+        self.assertEqual(response.data['results'][0]['category']['name'], 'Listing Category')
+
+        response = self.client.get('/api/products/', {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_list_uses_stored_ratings(self):
+        self.create_products(2)
+        response = self.client.get('/api/products/', {'fields': 'full'})
+        for item in response.data['results']:
+            self.assertEqual(item['average_rating'], 4.0)
+            self.assertEqual(item['review_count'], 1)
+        summary = self.client.get('/api/products/').data['results']
+        self.assertEqual([item['rating'] for item in summary], [4.0, 4.0])
+
+
+class ProductRatingAggregateTests(TestCase):
+    def setUp(self):
+        self.vendor = User.objects.create_user(
+            email='rating-vendor@example.com',
+            password='testpass123',
+            first_name='Rating',
+            last_name='Vendor',
+            phone='0711000011',
+            role='vendor',
+            is_approved=True
+        )
+        self.reviewers = [
+            User.objects.create_user(
+                email=f'rating-reviewer{i}@example.com',
+                password='testpass123',
+                first_name='Rating',
+                last_name=f'Reviewer {i}',
+                phone=f'07110001{i:02d}',
+                role='customer'
+            )
+            for i in range(3)
+        ]
+        self.product = Product.objects.create(vendor=self.vendor, name='Rated Product', price=10, quantity=1)
+
+    def test_aggregates_follow_review_changes(self):
+        first = Review.objects.create(product=self.product, user=self.reviewers[0], rating=5)
+        Review.objects.create(product=self.product, user=self.reviewers[1], rating=2)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_sum, self.product.rating_count), (7, 2))
+        self.assertEqual(self.product.average_rating(), 3.5)
+
+        first.rating = 3
+        first.save()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_sum, self.product.rating_count), (5, 2))
+        self.assertEqual(self.product.average_rating(), 2.5)
+
+        first.delete()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_sum, self.product.rating_count), (2, 1))
+        self.assertEqual(self.product.review_count(), 1)
+
+    def test_rebuild_command_recomputes_from_reviews(self):
+        for reviewer, rating in zip(self.reviewers, [5, 4, 4]):
+            Review.objects.create(product=self.product, user=reviewer, rating=rating)
+        Product.objects.filter(pk=self.product.pk).update(rating_sum=0, rating_count=0, rating_average=0)
+
+        call_command('rebuild_product_ratings', stdout=StringIO())
+
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_sum, self.product.rating_count), (13, 3))
+        self.assertEqual(self.product.average_rating(), 4.3)
+
+
+class ProductPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.vendor = User.objects.create_user(
+            email='page-vendor@example.com',
+            password='testpass123',
+            first_name='Page',
+            last_name='Vendor',
+            phone='0711000021',
+            role='vendor',
+            is_approved=True
+        )
+        for i in range(25):
+            Product.objects.create(vendor=self.vendor, name=f'Paged Product {i}', price=10, quantity=1)
+
+    def test_cursor_pages_cover_every_product_once(self):
+        seen = []
+        url = '/api/products/?page_size=10'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data['results']), 10)
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+        # Newest first
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_page_size_is_capped(self):
+        with patch.object(StandardCursorPagination, 'max_page_size', 5):
+            response = self.client.get('/api/products/?page_size=1000')
+        self.assertEqual(len(response.data['results']), 5)
+
+
+class ProductFilterTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.vendor = User.objects.create_user(
+            email='filter-vendor@example.com',
+            password='testpass123',
+            first_name='Filter',
+            last_name='Vendor',
+            phone='0711000031',
+            role='vendor',
+            is_approved=True
+        )
+        self.food = Category.objects.create(name='Filter Food', category_type='product')
+        self.tech = Category.objects.create(name='Filter Tech', category_type='product')
+        self.red = Color.objects.create(name='Red')
+        self.blue = Color.objects.create(name='Blue')
+        self.bread = Product.objects.create(vendor=self.vendor, name='Bread', price=50, quantity=10, category=self.food)
+        self.milk = Product.objects.create(vendor=self.vendor, name='Milk', price=80, quantity=0, category=self.food)
+        self.phone = Product.objects.create(vendor=self.vendor, name='Phone', price=9000, quantity=3, category=self.tech)
+        self.bread.colors.add(self.red)
+        self.phone.colors.add(self.red, self.blue)
+        Product.objects.filter(pk=self.milk.pk).update(sales_count=30, rating_average=4.5)
+        Product.objects.filter(pk=self.phone.pk).update(sales_count=10, rating_average=3)
+
+    def get_names(self, query):
+        response = self.client.get(f'/api/products/filter/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.data['results']]
+
+    def test_filters_combine(self):
+        self.assertEqual(self.get_names(f'category={self.food.id}&sort=price_asc'), ['Bread', 'Milk'])
+        self.assertEqual(self.get_names(f'category={self.food.id}&in_stock=true'), ['Bread'])
+        self.assertEqual(self.get_names(f'color={self.red.id},{self.blue.id}&sort=price_asc'), ['Bread', 'Phone'])
+        self.assertEqual(self.get_names('min_price=60&max_price=100'), ['Milk'])
+        self.assertEqual(self.get_names('min_rating=4'), ['Milk'])
+
+    def test_sort_options(self):
+        self.assertEqual(self.get_names('sort=price_desc'), ['Phone', 'Milk', 'Bread'])
+        self.assertEqual(self.get_names('sort=best_sellers'), ['Milk', 'Phone', 'Bread'])
+        self.assertEqual(self.get_names('sort=newest'), ['Phone', 'Milk', 'Bread'])
+
+    def test_invalid_parameters_are_rejected(self):
+        self.assertEqual(self.client.get('/api/products/filter/?min_price=cheap').status_code, 400)
+        self.assertEqual(self.client.get('/api/products/filter/?sort=random').status_code, 400)
+
+    def test_sales_count_follows_order_items(self):
+        customer = User.objects.create_user(
+            email='filter-customer@example.com',
+            password='testpass123',
+            first_name='Filter',
+            last_name='Customer',
+            phone='0711000032',
+            role='customer'
+        )
+        order = Order.objects.create(customer=customer, total_price=100)
+        OrderItem.objects.create(order=order, product=self.bread, quantity=2)
+        self.bread.refresh_from_db()
+        self.assertEqual(self.bread.sales_count, 2)
+
+        Product.objects.update(sales_count=0)
+        call_command('rebuild_product_sales', stdout=StringIO())
+        self.bread.refresh_from_db()
+        self.assertEqual(self.bread.sales_count, 2)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.vendor = User.objects.create_user(
+            email='search-vendor@example.com',
+            password='testpass123',
+            first_name='Search',
+            last_name='Vendor',
+            phone='0711000041',
+            role='vendor',
+            is_approved=True
+        )
+        snacks = Category.objects.create(name='Snacks', category_type='product')
+        self.brand = Brand.objects.create(name='Cadbury')
+        Product.objects.create(
+            vendor=self.vendor, name='Chocolate Bar', price=100, quantity=5,
+            category=snacks, brand=self.brand, tags='sweet,cocoa'
+        )
+        Product.objects.create(
+            vendor=self.vendor, name='Milk Biscuits', price=60, quantity=5,
+            category=snacks, description='Pairs well with hot chocolate'
+        )
+        Product.objects.create(vendor=self.vendor, name='USB Cable', price=300, quantity=5)
+
+    def search(self, term):
+        response = self.client.get('/api/products/search/', {'q': term})
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.data['results']]
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self.search('chocolate'), ['Chocolate Bar', 'Milk Biscuits'])
+
+    def test_matches_tags_brand_and_category(self):
+        self.assertEqual(self.search('cocoa'), ['Chocolate Bar'])
+        self.assertCountEqual(self.search('snacks'), ['Milk Biscuits', 'Chocolate Bar'])
+
+    def test_vector_follows_brand_rename(self):
+        self.brand.name = 'Dairy Milk'
+        self.brand.save()
+        self.assertEqual(self.search('dairy'), ['Chocolate Bar'])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Trigram matching requires PostgreSQL')
+    def test_tolerates_typos_in_name(self):
+        self.assertIn('Chocolate Bar', self.search('choclate'))
+
+    def test_empty_query_returns_nothing(self):
+        self.assertEqual(self.search(''), [])
+
+
+class RelatedProductsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.vendor = User.objects.create_user(
+            email='related-vendor@example.com',
+            password='testpass123',
+            first_name='Related',
+            last_name='Vendor',
+            phone='0711000051',
+            role='vendor',
+            is_approved=True
+        )
+        self.customer = User.objects.create_user(
+            email='related-customer@example.com',
+            password='testpass123',
+            first_name='Related',
+            last_name='Customer',
+            phone='0711000052',
+            role='customer'
+        )
+        food = Category.objects.create(name='Related Food', category_type='product')
+        tech = Category.objects.create(name='Related Tech', category_type='product')
+        self.bread = Product.objects.create(vendor=self.vendor, name='Bread', price=50, quantity=5, category=food, tags='bakery,breakfast')
+        self.cake = Product.objects.create(vendor=self.vendor, name='Cake', price=500, quantity=5, category=food, tags='bakery')
+        self.rice = Product.objects.create(vendor=self.vendor, name='Rice', price=200, quantity=5, category=food)
+        self.kettle = Product.objects.create(vendor=self.vendor, name='Kettle', price=2000, quantity=5, category=tech, tags='breakfast')
+        for _ in range(2):
+            order = Order.objects.create(customer=self.customer, total_price=2050)
+            OrderItem.objects.create(order=order, product=self.bread, quantity=1)
+            OrderItem.objects.create(order=order, product=self.kettle, quantity=1)
+
+    def test_ranked_from_co_purchases_tags_and_category(self):
+        call_command('refresh_related_products', stdout=StringIO())
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/products/related/{self.bread.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['name'] for item in response.data], ['Kettle', 'Cake', 'Rice'])
+
+        entry = RelatedProduct.objects.get(product=self.bread, related=self.kettle)
+        self.assertEqual((entry.co_purchases, entry.shared_tags), (2, 1))
+
+    def test_incremental_refresh_only_touches_stale_products(self):
+        call_command('refresh_related_products', stdout=StringIO())
+        out = StringIO()
+        call_command('refresh_related_products', stdout=out)
+        self.assertIn('for 0 products', out.getvalue())
+
+        # Cake changed; Bread and Rice rank it as a same-category candidate, Kettle does not
+        self.cake.tags = 'bakery,breakfast'
+        self.cake.save()
+        out = StringIO()
+        call_command('refresh_related_products', stdout=out)
+        self.assertIn('for 3 products', out.getvalue())
+        self.assertEqual(RelatedProduct.objects.get(product=self.cake, related=self.bread).shared_tags, 2)
+        self.assertEqual(RelatedProduct.objects.get(product=self.bread, related=self.cake).shared_tags, 2)
+
+    def test_incremental_refresh_reranks_products_listing_a_changed_product(self):
+        call_command('refresh_related_products', stdout=StringIO())
+        self.kettle.tags = 'breakfast,bakery'
+        self.kettle.save()
+
+        call_command('refresh_related_products', stdout=StringIO())
+        # Bread was not edited, but its ranking includes Kettle
+        self.assertEqual(RelatedProduct.objects.get(product=self.bread, related=self.kettle).shared_tags, 2)
+
+    def test_products_without_related_items_are_not_rebuilt_every_run(self):
+        tools = Category.objects.create(name='Related Tools', category_type='product')
+        Product.objects.create(vendor=self.vendor, name='Hammer', price=900, quantity=5, category=tools)
+        call_command('refresh_related_products', stdout=StringIO())
+        self.assertFalse(RelatedProduct.objects.filter(product__name='Hammer').exists())
+
+        out = StringIO()
+        call_command('refresh_related_products', stdout=out)
+        self.assertIn('for 0 products', out.getvalue())
+
+    def test_falls_back_to_category_before_first_refresh(self):
+        response = self.client.get(f'/api/products/related/{self.rice.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['name'] for item in response.data], ['Bread', 'Cake'])
+        self.assertEqual(self.client.get('/api/products/related/999999/').status_code, 404)
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(name='Cached Category', category_type='product')
+        SubCategory.objects.create(category=self.category, name='Cached Subcategory')
+
+    def test_repeat_loads_skip_the_database(self):
+        response = self.client.get('/api/categories/')
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            cached = self.client.get('/api/categories/')
+        self.assertEqual(cached.data, response.data)
+
+    def test_if_none_match_returns_304(self):
+        etag = self.client.get('/api/brands/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/brands/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_changes_invalidate_only_their_resource(self):
+        categories_etag = self.client.get('/api/categories/')['ETag']
+        sizes_etag = self.client.get('/api/sizes/')['ETag']
+
+        self.category.name = 'Renamed Category'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.save()
+
+        response = self.client.get('/api/categories/', HTTP_IF_NONE_MATCH=categories_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['name'], 'Renamed Category')
+        self.assertEqual(self.client.get('/api/sizes/', HTTP_IF_NONE_MATCH=sizes_etag).status_code, 304)
+
+    def test_invalidation_waits_for_commit(self):
+        etag = self.client.get('/api/colors/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Color.objects.create(name='Teal')
+            # Still inside the writer's transaction: the cached list stays valid
+            self.assertEqual(self.client.get('/api/colors/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get('/api/colors/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_query_parameters_are_cached_separately(self):
+        other = Category.objects.create(name='Other Category', category_type='product')
+        SubCategory.objects.create(category=other, name='Other Subcategory')
+        response = self.client.get('/api/subcategories/', {'category_id': other.id})
+        self.assertEqual([item['name'] for item in response.data], ['Other Subcategory'])
+        self.assertEqual(len(self.client.get('/api/subcategories/').data), 2)
+
+
+class ProductImageVariantTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.vendor = User.objects.create_user(
+            email='image-vendor@example.com',
+            password='testpass123',
+            first_name='Image',
+            last_name='Vendor',
+            phone='0711000081',
+            role='vendor',
+            is_approved=True
+        )
+        self.category = Category.objects.create(name='Images', category_type='product')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def upload(self, name='photo.png', size=(2000, 1000), mode='RGBA'):
+        buffer = BytesIO()
+        Image.new(mode, size, (200, 30, 30, 128) if mode == 'RGBA' else (200, 30, 30)).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def create_product(self, **kwargs):
+        return Product.objects.create(
+            vendor=self.vendor, name='Pictured Product', price=10, quantity=1, category=self.category, image=self.upload(), **kwargs
+        )
+
+    def test_variants_generated_on_upload(self):
+        product = self.create_product()
+        product.refresh_from_db()
+        variants = product.image_variants
+        self.assertEqual(variants['source'], product.image.name)
+        self.assertEqual(
+            [(variants[name]['width'], variants[name]['height']) for name in ('thumb', 'card', 'full')],
+            [(150, 75), (400, 200), (1200, 600)],
+        )
+        storage = product.image.storage
+        for name in ('thumb', 'card', 'full'):
+            self.assertTrue(variants[name]['webp'].endswith(f'.{name}.webp'))
+            with storage.open(variants[name]['webp']) as f:
+                self.assertEqual(Image.open(f).format, 'WEBP')
+            with storage.open(variants[name]['jpeg']) as f:
+                self.assertEqual(Image.open(f).size, (variants[name]['width'], variants[name]['height']))
+
+    def test_small_images_are_not_upscaled(self):
+        product = Product.objects.create(
+            vendor=self.vendor, name='Tiny', price=1, quantity=1, category=self.category, image=self.upload(size=(300, 300), mode='RGB')
+        )
+        self.assertEqual(product.image_variants['card']['width'], 300)
+        self.assertEqual(product.image_variants['full']['width'], 300)
+
+    def test_replacing_image_regenerates_and_removes_old_variants(self):
+        product = self.create_product()
+        old_thumb = product.image_variants['thumb']['webp']
+        product.image = self.upload(name='replacement.png', size=(800, 800))
+        product.save()
+        self.assertIn('replacement', product.image_variants['thumb']['webp'])
+        self.assertFalse(product.image.storage.exists(old_thumb))
+
+    def test_reupload_with_the_same_stem_keeps_the_new_variants(self):
+        product = self.create_product()
+        # photo.png -> photo.jpg: the variants of both are named photo.<variant>.<format>
+        product.image = self.upload(name='photo.jpg', size=(800, 800), mode='RGB')
+        product.save()
+        self.assertTrue(product.image.name.endswith('photo.jpg'))
+        storage = product.image.storage
+        for name in ('thumb', 'card', 'full'):
+            for key in ('jpeg', 'webp'):
+                self.assertTrue(storage.exists(product.image_variants[name][key]), (name, key))
+        with storage.open(product.image_variants['full']['jpeg']) as f:
+            self.assertEqual(Image.open(f).size, (800, 800))
+
+    def test_unchanged_image_is_not_reprocessed(self):
+        product = self.create_product()
+        with patch('products.images.build_variants') as build:
+            product.name = 'Renamed'
+            product.save()
+        build.assert_not_called()
+
+    def test_product_without_image_is_not_updated_again(self):
+        product = Product.objects.create(vendor=self.vendor, name='No Picture', price=1, quantity=1, category=self.category)
+        with self.assertNumQueries(0):
+            self.assertFalse(refresh_image_variants(product))
+
+    def test_serializer_exposes_srcset(self):
+        product = self.create_product()
+        ProductDetailImage.objects.create(product=product, image=self.upload(name='detail.png'))
+        data = ProductSerializer(Product.objects.get(pk=product.pk)).data
+        self.assertEqual(set(data['image_variants']), {'thumb', 'card', 'full'})
+        srcset = data['image_srcset']['webp'].split(', ')
+        self.assertEqual([entry.split(' ')[1] for entry in srcset], ['150w', '400w', '1200w'])
+        self.assertTrue(srcset[0].startswith('/media/products/'))
+        self.assertIn('jpeg', data['image_srcset'])
+        self.assertIn('thumb', data['detail_images'][0]['image_variants'])
+
+    def test_backfill_command(self):
+        product = self.create_product()
+        Product.objects.filter(pk=product.pk).update(image_variants={})
+        out = StringIO()
+        call_command('generate_image_variants', stdout=out)
+        self.assertIn('Generated variants for 1 images', out.getvalue())
+        product.refresh_from_db()
+        self.assertIn('full', product.image_variants)
+
+
+class ProductBulkImportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.vendor = User.objects.create_user(
+            email='bulk-vendor@example.com',
+            password='testpass123',
+            first_name='Bulk',
+            last_name='Vendor',
+            phone='0711000091',
+            role='vendor',
+            is_approved=True
+        )
+        self.client.force_authenticate(user=self.vendor)
+        self.snacks = Category.objects.create(name='Snacks', category_type='product')
+        self.chips = SubCategory.objects.create(category=self.snacks, name='Chips')
+        self.tutoring = Category.objects.create(name='Tutoring', category_type='service')
+        self.brand = Brand.objects.create(name='Pringles')
+        self.red = Color.objects.create(name='Red')
+        self.blue = Color.objects.create(name='Blue')
+        self.large = Size.objects.create(name='Large', value='200', unit='g')
+
+    def upload(self, content, name='products.csv', **data):
+        data['file'] = SimpleUploadedFile(name, content.encode())
+        return self.client.post('/api/products/bulk/', data, format='multipart')
+
+    def csv_rows(self, count):
+        lines = ['name,price,quantity,category,subcategory,brand,colors,sizes']
+        lines += [f'Crisps {i},{100 + i},5,snacks,chips,Pringles,"Red, Blue",Large' for i in range(count)]
+        return '\n'.join(lines) + '\n'
+
+    def test_csv_import_creates_products_with_relations(self):
+        response = self.upload(self.csv_rows(2))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {'rows': 2, 'created': 2, 'errors': []})
+
+        product = Product.objects.get(name='Crisps 1')
+        self.assertEqual(product.vendor, self.vendor)
+        self.assertEqual((product.category, product.subcategory, product.brand), (self.snacks, self.chips, self.brand))
+        self.assertCountEqual(product.colors.all(), [self.red, self.blue])
+        self.assertCountEqual(product.sizes.all(), [self.large])
+
+    def test_invalid_rows_are_reported_and_skipped(self):
+        content = '\n'.join([
+            'name,type,price,quantity,duration_minutes,category,colors',
+            'Good Crisps,product,50,3,,Snacks,Red',
+            'No Price,product,,3,,Snacks,',
+            'Mystery,product,10,3,,Unknown,',
+            'Lesson,service,500,,,Tutoring,',
+            'Wrong Type,service,500,,60,Snacks,',
+            'Green Crisps,product,50,3,,Snacks,Green',
+        ]) + '\n'
+        response = self.upload(content)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 1)
+        errors = {error['row']: error['errors'] for error in response.data['errors']}
+        self.assertEqual(sorted(errors), [2, 3, 4, 5, 6])
+        self.assertIn('price', errors[2])
+        self.assertIn('category', errors[3])
+        self.assertIn('non_field_errors', errors[4])
+        self.assertIn('is for products', errors[5]['category'][0])
+        self.assertIn('Green', errors[6]['colors'][0])
+        self.assertEqual(list(Product.objects.values_list('name', flat=True)), ['Good Crisps'])
+
+    def test_jsonl_import_with_bad_line(self):
+        content = '\n'.join([
+            json.dumps({'name': 'Json Crisps', 'price': '80', 'quantity': 2, 'category': 'Snacks', 'colors': ['Blue']}),
+            '{not json',
+        ]) + '\n'
+        response = self.upload(content, name='products.jsonl')
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['errors'][0]['row'], 2)
+        self.assertCountEqual(Product.objects.get(name='Json Crisps').colors.all(), [self.blue])
+
+    def test_unreadable_files_are_rejected_and_nothing_is_imported(self):
+        # Rows after the first batch cannot be read: the first batch is rolled back too
+        content = self.csv_rows(3).encode() + b'Crisps \xff,100,5,snacks\n'
+        with self.assertRaises(ImportFileError):
+            ProductImporter(self.vendor, batch_size=2).run(read_rows(BytesIO(content), 'csv'))
+        self.assertFalse(Product.objects.exists())
+
+        response = self.client.post('/api/products/bulk/', {
+            'file': SimpleUploadedFile('products.csv', self.csv_rows(3).encode() + b'Crisps,1,1,' + b'x' * 200000 + b'\n'),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Malformed CSV', response.data['file'][0])
+
+        latin1 = json.dumps({'name': 'Caf\u00e9 Crisps', 'price': '80', 'quantity': 2}, ensure_ascii=False).encode('latin-1')
+        response = self.client.post('/api/products/bulk/', {
+            'file': SimpleUploadedFile('products.jsonl', latin1),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('UTF-8', response.data['file'][0])
+        self.assertFalse(Product.objects.exists())
+
+    def test_dry_run_saves_nothing(self):
+        response = self.upload(self.csv_rows(3), dry_run='true')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 3)
+        self.assertFalse(Product.objects.exists())
+
+    def test_query_count_does_not_grow_with_rows(self):
+        def count_queries(rows):
+            with CaptureQueriesContext(connection) as queries:
+                ProductImporter(self.vendor).run(read_rows(BytesIO(self.csv_rows(rows).encode()), 'csv'))
+            return len(queries)
+
+        self.assertEqual(count_queries(5), count_queries(200))
+        self.assertEqual(Product.objects.count(), 205)
+
+    def test_export_round_trips_through_import(self):
+        self.upload(self.csv_rows(3))
+        response = self.client.get('/api/products/bulk/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        exported = b''.join(response.streaming_content).decode()
+        rows = list(csv.DictReader(StringIO(exported)))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]['category'], 'Snacks')
+        self.assertEqual(set(rows[0]['colors'].split(',')), {'Red', 'Blue'})
+
+        self.assertEqual(self.upload(exported).data['created'], 3)
+        self.assertEqual(Product.objects.filter(name='Crisps 0').count(), 2)
+
+    def test_requires_approved_vendor(self):
+        customer = User.objects.create_user(
+            email='bulk-customer@example.com',
+            password='testpass123',
+            first_name='Bulk',
+            last_name='Customer',
+            phone='0711000092',
+            role='customer'
+        )
+        self.client.force_authenticate(user=customer)
+        self.assertEqual(self.upload(self.csv_rows(1)).status_code, 403)
+        self.assertEqual(self.client.get('/api/products/bulk/').status_code, 403)
+
+    def test_import_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write(self.csv_rows(4))
+        self.addCleanup(os.remove, f.name)
+        out = StringIO()
+        call_command('import_products', f.name, vendor=self.vendor.email, batch_size=3, stdout=out)
+        self.assertIn('Imported 4 of 4 rows (0 errors)', out.getvalue())
+        self.assertEqual(Product.objects.filter(vendor=self.vendor).count(), 4)
@@ -2,13 +2,16 @@ from django.urls import path
 from .views import (
     ProductListCreateView, ProductDetailView, ProductFilterView, 
     CategoryListView, SubCategoryListView, BrandListView, ColorListView, SizeListView,
-    ProductDetailImageCreateView, ReviewStarsView, SortOptionsView, RelatedProductsView
+    ProductDetailImageCreateView, ReviewStarsView, SortOptionsView, RelatedProductsView,
+    ProductSearchView, ProductBulkView
 )
 
 urlpatterns = [
     path('products/', ProductListCreateView.as_view(), name='product-list-create'),
     path('products/<int:pk>/', ProductDetailView.as_view(), name='product-detail'),
     path('products/filter/', ProductFilterView.as_view(), name='product-filter'),
+    path('products/bulk/', ProductBulkView.as_view(), name='product-bulk'),
+    path('products/search/', ProductSearchView.as_view(), name='product-search'),
     path('products/related/<int:pk>/', RelatedProductsView.as_view(), name='related-products'),
     path('categories/', CategoryListView.as_view(), name='category-list'),
     path('subcategories/', SubCategoryListView.as_view(), name='subcategory-list'),
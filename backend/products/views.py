@@ -1,24 +1,55 @@
-from rest_framework import generics
-from rest_framework.permissions import IsAuthenticated
+from rest_framework import generics, status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
 from .models import Product, Category, SubCategory, Brand, Color, Size, ProductDetailImage
 from .serializers import (
     ProductSerializer, CategorySerializer, SubCategorySerializer, 
-    BrandSerializer, ColorSerializer, SizeSerializer, ProductDetailImageSerializer
+    BrandSerializer, ColorSerializer, SizeSerializer, ProductDetailImageSerializer,
+    get_product_serializer, is_summary_request
 )
-from .permissions import IsVendorOrReadOnly
+from .permissions import IsApprovedVendor, IsVendorOrReadOnly
+from .bulk import BULK_FORMATS, ImportFileError, ProductImporter, detect_format, export_products, read_rows
+from .filters import ProductFilter, SORT_OPTIONS
+from .search import search_products
+from campus_delivery.pagination import StandardCursorPagination, RankedResultsPagination
+from campus_delivery.cache import CachedListMixin
+from django.http import StreamingHttpResponse
 
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-class ProductListCreateView(generics.ListCreateAPIView):
-    queryset = Product.objects.all()
+class ProductRepresentationMixin:
+    """
+    Read requests get the compact ProductSummarySerializer unless the `fields`
+    query parameter asks for the full product (or a subset of its fields).
+    Summary querysets skip the joins, prefetches and large text columns it does not use.
+    """
+    summary_deferred_fields = ('description', 'additional_information', 'search_vector')
+
+    def get_serializer(self, *args, **kwargs):
+        if self.request.method not in SAFE_METHODS:
+            return super().get_serializer(*args, **kwargs)
+        return get_product_serializer(self.get_serializer_context(), *args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method in SAFE_METHODS and is_summary_request(self.request):
+            queryset = queryset.select_related(None).prefetch_related(None).defer(*self.summary_deferred_fields)
+        return queryset
+
+class ProductListCreateView(ProductRepresentationMixin, generics.ListCreateAPIView):
+    queryset = Product.objects.for_listing()
     serializer_class = ProductSerializer
     permission_classes = [IsVendorOrReadOnly]
+    pagination_class = StandardCursorPagination
 
     def list(self, request, *args, **kwargs):
         try:
             return super().list(request, *args, **kwargs)
+        except APIException:
+            # Bad query parameters (fields, cursor...) keep their own status
+            raise
         except Exception as e:
             import logging
             logger = logging.getLogger(__name__)
@@ -38,7 +69,7 @@ class ProductListCreateView(generics.ListCreateAPIView):
         return context
 
 class ProductDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Product.objects.all()
+    queryset = Product.objects.for_listing()
     serializer_class = ProductSerializer
     permission_classes = [IsVendorOrReadOnly]
 
@@ -48,16 +79,73 @@ class ProductDetailView(generics.RetrieveUpdateDestroyAPIView):
         context['request'] = self.request
         return context
 
-class ProductFilterView(generics.ListAPIView):
-    queryset = Product.objects.all()
+class ProductBulkView(APIView):
+    """
+    Bulk import/export of the requesting vendor's products.
+
+    GET streams every product as CSV (default) or JSONL (?file_format=jsonl).
+    POST imports a multipart `file`; the format comes from its extension unless
+    `file_format` is given, and `dry_run=true` validates without saving.
+    The response reports the rows read, products created and per-row errors.
+    """
+    permission_classes = [IsApprovedVendor]
+
+    def get(self, request):
+        file_format = detect_format('', request.query_params.get('file_format') or 'csv')
+        response = StreamingHttpResponse(
+            export_products(Product.objects.filter(vendor=request.user), file_format),
+            content_type=BULK_FORMATS[file_format],
+        )
+        response['Content-Disposition'] = f'attachment; filename="products.{file_format}"'
+        return response
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': ['This field is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        file_format = detect_format(upload.name, request.data.get('file_format'))
+        dry_run = str(request.data.get('dry_run', '')).lower() in ('1', 'true', 'yes')
+
+        try:
+            report = ProductImporter(request.user, dry_run=dry_run).run(read_rows(upload, file_format))
+        except ImportFileError as e:
+            return Response({'file': [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+        created = report['created'] and not dry_run
+        return Response(report, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+class ProductFilterView(ProductRepresentationMixin, generics.ListAPIView):
+    queryset = Product.objects.for_listing().filter(is_active=True)
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = StandardCursorPagination
+
+    @property
+    def cursor_ordering(self):
+        # Paginate on the ordering of the requested sort option
+        return ProductFilter(self.request.query_params).ordering
 
     def get_queryset(self):
-        # Implement filtering logic here if needed
-        return super().get_queryset()
+        return ProductFilter(self.request.query_params).filter_queryset(super().get_queryset())
 
-class CategoryListView(generics.ListAPIView):
+class ProductSearchView(ProductRepresentationMixin, generics.ListAPIView):
+    """
+    Full-text product search over name, description, tags, brand and category,
+    ordered by relevance. Accepts the same filters as ProductFilterView.
+    """
+    queryset = Product.objects.for_listing().filter(is_active=True)
+    serializer_class = ProductSerializer
+    permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = RankedResultsPagination
+
+    def get_queryset(self):
+        term = self.request.query_params.get('q', '').strip()
+        if not term:
+            return Product.objects.none()
+        queryset = ProductFilter(self.request.query_params).filter_queryset(super().get_queryset())
+        return search_products(queryset, term)
+
+class CategoryListView(CachedListMixin, generics.ListAPIView):
+    cache_tag = 'categories'
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
@@ -73,7 +161,8 @@ class CategoryListView(generics.ListAPIView):
             from rest_framework import status
             return Response({'detail': 'Internal Server Error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class SubCategoryListView(generics.ListAPIView):
+class SubCategoryListView(CachedListMixin, generics.ListAPIView):
+    cache_tag = 'subcategories'
     queryset = SubCategory.objects.all()
     serializer_class = SubCategorySerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
@@ -85,17 +174,20 @@ class SubCategoryListView(generics.ListAPIView):
             queryset = queryset.filter(category_id=category_id)
         return queryset
 
-class BrandListView(generics.ListAPIView):
+class BrandListView(CachedListMixin, generics.ListAPIView):
+    cache_tag = 'brands'
     queryset = Brand.objects.all()
     serializer_class = BrandSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
 
-class ColorListView(generics.ListAPIView):
+class ColorListView(CachedListMixin, generics.ListAPIView):
+    cache_tag = 'colors'
     queryset = Color.objects.all()
     serializer_class = ColorSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
 
-class SizeListView(generics.ListAPIView):
+class SizeListView(CachedListMixin, generics.ListAPIView):
+    cache_tag = 'sizes'
     queryset = Size.objects.all()
     serializer_class = SizeSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
@@ -135,12 +227,10 @@ class SortOptionsView(APIView):
     permission_classes = [AllowAny]
 
     def get(self, request):
-        # Sample static data for sort options
+        # Sort options supported by ProductFilterView (?sort=<value>)
         data = [
-            {"id": 1, "name": "Price: Low to High", "value": "price_asc"},
-            {"id": 2, "name": "Price: High to Low", "value": "price_desc"},
-            {"id": 3, "name": "Newest Arrivals", "value": "newest"},
-            {"id": 4, "name": "Best Sellers", "value": "best_sellers"},
+            {"id": option['id'], "name": option['name'], "value": option['value']}
+            for option in SORT_OPTIONS
         ]
         return Response(data)
 
@@ -148,10 +238,23 @@ class RelatedProductsView(APIView):
     permission_classes = [AllowAny]
 
     def get(self, request, pk):
-        try:
-            product = Product.objects.get(pk=pk)
-            related_products = Product.objects.filter(category=product.category).exclude(pk=pk)[:10]
-            serializer = ProductSerializer(related_products, many=True)
-            return Response(serializer.data)
-        except Product.DoesNotExist:
-            return Response({"detail": "Product not found."}, status=404)
+        # Precomputed by the refresh_related_products command, best match first
+        related_products = list(
+            Product.objects.for_listing()
+            .filter(related_to_entries__product_id=pk, is_active=True)
+            .order_by('-related_to_entries__score', 'id')[:10]
+        )
+        if not related_products:
+            # Not refreshed yet (e.g. a new product): fall back to best sellers in the same category
+            try:
+                product = Product.objects.get(pk=pk)
+            except Product.DoesNotExist:
+                return Response({"detail": "Product not found."}, status=404)
+            related_products = (
+                Product.objects.for_listing()
+                .filter(category_id=product.category_id, is_active=True)
+                .exclude(pk=pk)
+                .order_by('-sales_count', '-id')[:10]
+            )
+        serializer = get_product_serializer({'request': request}, related_products, many=True)
+        return Response(serializer.data)
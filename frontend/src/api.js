@@ -111,4 +111,28 @@ export const refreshToken = async () => {
   }
 };
 
+// Cursor-paginated list endpoints return { next, previous, results }; `next` is
+// the full URL of the following page, or null on the last one
+const toPage = (data) =>
+  Array.isArray(data)
+    ? { results: data, next: null }
+    : { results: data.results || [], next: data.next || null };
+
+// One page of a list endpoint: { results, next }
+export const fetchPage = async (url, config) => {
+  const { data } = await instance.get(url, config);
+  return toPage(data);
+};
+
+// Every item of a list endpoint, following `next` until the last page
+export const fetchAllPages = async (url, config) => {
+  let page = await fetchPage(url, config);
+  const results = [...page.results];
+  while (page.next) {
+    page = await fetchPage(page.next);
+    results.push(...page.results);
+  }
+  return results;
+};
+
 export default instance;
@@ -3,7 +3,7 @@ import OrderItem from "./OrderItem";
 
 
 
-const OrdersList = ({ orders }) => {
+const OrdersList = ({ orders, hasMore, onLoadMore }) => {
   if (!orders || orders.length === 0) {
     return <p>No orders were found.</p>;
   }
@@ -11,7 +11,7 @@ const OrdersList = ({ orders }) => {
   return (
     <section className="space-y-8">
       <div className="flex justify-between items-center mb-4">
-        <h2 className="text-xl font-semibold">Orders ({orders.length})</h2>
+        <h2 className="text-xl font-semibold">Orders ({orders.length}{hasMore ? "+" : ""})</h2>
         <select className="border border-gray-300 rounded-md px-3 py-1 text-sm">
           <option>All</option>
           <option>Pending</option>
@@ -22,6 +22,16 @@ const OrdersList = ({ orders }) => {
       {orders.map((order) => (
         <OrderItem key={order.id} order={order} />
       ))}
+      {hasMore && (
+        <div className="flex justify-center">
+          <button
+            onClick={onLoadMore}
+            className="border border-gray-300 rounded-md px-4 py-2 text-sm hover:bg-gray-100"
+          >
+            Load more orders
+          </button>
+        </div>
+      )}
     </section>
   );
 };
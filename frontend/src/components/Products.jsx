@@ -8,9 +8,18 @@ const Products = () => {
   useEffect(() => {
     const fetchProducts = async () => {
       try {
-        const response = await fetch("/api/products/");
+        // Follow the cursor pages to get every product
+        const data = [];
+        let url = "/api/products/?fields=full&page_size=100";
+        let response;
+        while (url) {
+          response = await fetch(url);
+          if (!response.ok) break;
+          const payload = await response.json();
+          data.push(...(Array.isArray(payload) ? payload : payload.results || []));
+          url = Array.isArray(payload) ? null : payload.next;
+        }
         if (response.ok) {
-          const data = await response.json();
           // Group products by category
           const categoriesMap = {};
           data.forEach((product) => {
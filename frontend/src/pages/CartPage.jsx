@@ -50,7 +50,7 @@ useEffect(() => {
             price: !isNaN(product?.price) ? parseFloat(product.price) : 0,
             quantity: quantity ?? 1,
             image:
-              product?.image_url ||
+              product?.thumbnail || product?.image_url ||
               product?.image ||
               `https://via.placeholder.com/60x60?text=${encodeURIComponent(
                 product?.name ?? "Product"
@@ -86,7 +86,7 @@ useEffect(() => {
             category: product.category?.name || "Uncategorized",
             price: parseFloat(product.price),
             quantity,
-            image: product.image_url || product.image || "https://via.placeholder.com/60x60?text=Product",
+            image: product.thumbnail || product.image_url || product.image || "https://via.placeholder.com/60x60?text=Product",
           }))
         : [];
       setCartItems(items);
@@ -118,7 +118,7 @@ useEffect(() => {
             category: product.category?.name || "Uncategorized",
             price: parseFloat(product.price),
             quantity,
-            image: product.image || "https://via.placeholder.com/60x60?text=Product",
+            image: product.thumbnail || product.image || "https://via.placeholder.com/60x60?text=Product",
           }))
         : [];
       setCartItems(items);
@@ -104,7 +104,7 @@ const CheckoutPage = () => {
               price: !isNaN(product?.price) ? parseFloat(product.price) : 0,
               quantity: quantity ?? 1,
               image:
-                product?.image_url ||
+                product?.thumbnail || product?.image_url ||
                 product?.image ||
                 `https://via.placeholder.com/60x60?text=${encodeURIComponent(
                   product?.name ?? "Product"
@@ -309,7 +309,7 @@ const CheckoutPage = () => {
       setTimeout(() => navigate("/login", { replace: true }), 2000);
       return;
     }
-    navigate("/payment-method", { state: { cartItems, scheduleType, scheduledDate, scheduledTime, additionalInfo, deliveryFee } });
+    navigate("/payment-method", { state: { cartItems, scheduleType, scheduledDate, scheduledTime, additionalInfo, deliveryFee, deliveryCoords } });
 
   };
 
@@ -3,7 +3,7 @@ import { FaMoneyBillWave, FaChartLine, FaCalendarAlt, FaDownload, FaFilter, FaCl
 import { Link } from 'react-router-dom';
 import Navbar from '../components/Navbar';
 import CustomFooter from '../components/CustomFooter';
-import api from '../api';
+import api, { fetchAllPages } from '../api';
 
 const DeliveryEarnings = () => {
   const [earnings, setEarnings] = useState({
@@ -40,9 +40,10 @@ const DeliveryEarnings = () => {
         available: parseFloat(earningsData.available)
       });
 
-      // Fetch transactions
-      const transactionsResponse = await api.get('/api/delivery/transactions/');
-      const transactionsData = transactionsResponse.data;
+      // Fetch transactions; every page, since the totals below are computed from them
+      const transactionsData = await fetchAllPages('/api/delivery/transactions/', {
+        params: { page_size: 100 }
+      });
       
       setTransactions(transactionsData.map(transaction => ({
         id: transaction.id,
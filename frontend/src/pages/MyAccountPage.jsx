@@ -7,9 +7,26 @@ import AddressManager from "../components/MyAccountPage/AddressManager";
 import PaymentMethod from "../components/MyAccountPage/PaymentMethod";
 import PasswordManager from "../components/MyAccountPage/PasswordManager";
 import Logout from "../components/MyAccountPage/Logout";
-import api from "../api";
+import api, { fetchPage } from "../api";
 import  AuthContext  from "../contexts/AuthContext";
 
+// Transform items to products for an order
+const toAccountOrder = (order) => {
+  const products = order.items?.map(item => ({
+    productId: item.product?.id || null,
+    imgSrc: item.product?.thumbnail || item.product?.image_url || item.product?.image || "https://via.placeholder.com/60x60?text=Product",
+    alt: item.product?.name || "Product Image",
+    name: item.product?.name || "Unnamed Product",
+    description: item.product?.description || "",
+  })) || [];
+  // Filter out products with null productId to avoid undefined product fetch
+  const filteredProducts = products.filter(p => p.productId !== null);
+  return {
+    ...order,
+    products: filteredProducts,
+  };
+};
+
 const MyAccountPage = () => {
   const { token } = useContext(AuthContext);
   console.log("MyAccountPage token from AuthContext:", token);
@@ -26,6 +43,8 @@ const MyAccountPage = () => {
 
   const [addresses, setAddresses] = useState([]);
   const [orders, setOrders] = useState([]);
+  // URL of the next page of orders, null once they are all loaded
+  const [ordersNext, setOrdersNext] = useState(null);
   const [paymentMethods, setPaymentMethods] = useState([]);
 
   const [newAddress, setNewAddress] = useState({
@@ -68,28 +87,10 @@ const MyAccountPage = () => {
 
     const fetchUserOrders = async () => {
       try {
-        // Fetch user-specific orders from backend
-        const response = await api.get("/api/orders/");
-        console.log("Orders API response data:", response.data);
-        // Adjust for paginated response
-        const ordersData = Array.isArray(response.data) ? response.data : response.data.results || [];
-        // Transform items to products for each order
-        const transformedOrders = ordersData.map(order => {
-          const products = order.items?.map(item => ({
-            productId: item.product?.id || null,
-            imgSrc: item.product?.image_url || item.product?.image || "https://via.placeholder.com/60x60?text=Product",
-            alt: item.product?.name || "Product Image",
-            name: item.product?.name || "Unnamed Product",
-            description: item.product?.description || "",
-          })) || [];
-          // Filter out products with null productId to avoid undefined product fetch
-          const filteredProducts = products.filter(p => p.productId !== null);
-          return {
-            ...order,
-            products: filteredProducts,
-          };
-        });
-        setOrders(transformedOrders);
+        // Fetch the first page of user-specific orders from backend
+        const { results, next } = await fetchPage("/api/orders/");
+        setOrders(results.map(toAccountOrder));
+        setOrdersNext(next);
       } catch (error) {
         console.error("Failed to fetch user orders:", error);
       }
@@ -123,6 +124,16 @@ const MyAccountPage = () => {
     }
   }, [token]);
 
+  const handleLoadMoreOrders = async () => {
+    try {
+      const { results, next } = await fetchPage(ordersNext);
+      setOrders((prev) => [...prev, ...results.map(toAccountOrder)]);
+      setOrdersNext(next);
+    } catch (error) {
+      console.error("Failed to fetch more orders:", error);
+    }
+  };
+
   const handleMenuClick = (menu) => {
     setActiveMenu(menu);
   };
@@ -219,7 +230,13 @@ const MyAccountPage = () => {
             />
           )}
 
-          {activeMenu === "My Orders" && <OrdersList orders={orders} />}
+          {activeMenu === "My Orders" && (
+            <OrdersList
+              orders={orders}
+              hasMore={Boolean(ordersNext)}
+              onLoadMore={handleLoadMoreOrders}
+            />
+          )}
 
           {activeMenu === "Manage Address" && (
             <AddressManager
@@ -14,8 +14,13 @@ const PaymentMethodPage = () => {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
   const [orderId, setOrderId] = useState(null);
+  // Sent with every attempt to place this order, so retries cannot create duplicates
+  const [idempotencyKey] = useState(() => crypto.randomUUID());
 
-  // Validate and calculate order summary
+  // Priced by the server (GET /api/cart/); the order is charged this quote
+  const [quote, setQuote] = useState(null);
+
+  // Estimate shown until the quote arrives
   const orderSummary = {
     items: cartItems.reduce((acc, item) => acc + (Number(item.quantity) || 0), 0),
     subTotal: cartItems.reduce(
@@ -23,13 +28,32 @@ const PaymentMethodPage = () => {
       0
     ),
     shipping: Number(deliveryFee) || 0,
-    couponDiscount: 30,
+    couponDiscount: 0,
   };
 
   orderSummary.total = (
     orderSummary.subTotal + orderSummary.shipping - orderSummary.couponDiscount
   ).toFixed(2); // Ensure 2 decimal places for KES
 
+  if (quote) {
+    orderSummary.subTotal = Number(quote.subtotal);
+    orderSummary.shipping = Number(quote.delivery_fee);
+    orderSummary.couponDiscount = Number(quote.discount);
+    orderSummary.total = quote.total;
+  }
+
+  useEffect(() => {
+    const token = localStorage.getItem("token");
+    if (!token) return;
+    axios
+      .get("http://localhost:8000/api/cart/", {
+        params: deliveryCoords ? { lat: deliveryCoords.lat, lng: deliveryCoords.lng } : {},
+        headers: { Authorization: `Bearer ${token}` },
+      })
+      .then((res) => setQuote(res.data.quote))
+      .catch((err) => console.error("Error pricing cart:", err.response?.data || err.message));
+  }, [deliveryCoords?.lat, deliveryCoords?.lng]);
+
   useEffect(() => {
     const script = document.createElement("script");
     script.src = "https://js.paystack.co/v1/inline.js";
@@ -75,31 +99,29 @@ const PaymentMethodPage = () => {
       const itemsPayload = cartItems.map((item) => ({
         product_id: Number(item.id),
         quantity: Number(item.quantity),
-        price: Number(item.price).toFixed(2), // Ensure price is a decimal
       }));
 
-      // Calculate total in KES for backend (2 decimal places)
-      const totalPrice = Number(orderSummary.total);
-
+      // Prices, discount and delivery fee are computed by the server
       const orderRes = await axios.post(
         "http://localhost:8000/api/orders/",
         {
           items: itemsPayload,
-          total_price: totalPrice,
-          delivery_fee: orderSummary.shipping,
-          delivery_coords: deliveryCoords
-            ? `Lat: ${deliveryCoords.lat.toFixed(6)}, Lng: ${deliveryCoords.lng.toFixed(6)}`
-            : null,
+          ...(deliveryCoords && {
+            delivery_lat: Number(deliveryCoords.lat.toFixed(6)),
+            delivery_lng: Number(deliveryCoords.lng.toFixed(6)),
+          }),
         },
         {
           headers: {
             Authorization: `Bearer ${token}`,
+            "Idempotency-Key": idempotencyKey,
           },
         }
       );
 
       const newOrderId = orderRes.data.id;
       setOrderId(newOrderId);
+      const totalPrice = Number(orderRes.data.total_price);
 
       // Calculate amount in kobo for Paystack - ensure it's a valid integer
       const validatedTotalPrice = parseFloat(totalPrice) || 0;
@@ -184,7 +206,7 @@ const PaymentMethodPage = () => {
       console.error("❌ Order creation or Paystack error:", err.response?.data || err.message);
       setError(
         err.response?.data?.error ||
-        err.response?.data?.total_price?.[0] ||
+        err.response?.data?.delivery_fee?.[0] ||
         "Failed to create order. Please try again."
       );
       setLoading(false);
@@ -1,6 +1,6 @@
 import React, { useEffect, useState, useContext } from "react";
 import AuthContext from "../contexts/AuthContext";
-import axios from "../api";
+import { fetchAllPages } from "../api";
 import { toast } from "react-toastify";
 
 const VendorCustomers = () => {
@@ -12,9 +12,8 @@ const VendorCustomers = () => {
 
     const fetchCustomers = async () => {
       try {
-        // Fetch orders and extract unique customers related to vendor
-        const response = await axios.get("/api/orders/");
-        const orders = response.data;
+        // Fetch orders (every page) and extract unique customers related to vendor
+        const orders = await fetchAllPages("/api/orders/", { params: { page_size: 100 } });
 
         // Filter orders for current vendor's products and extract customers
         // For simplicity, assuming orders API returns customer info and vendor info
@@ -1,7 +1,7 @@
 import React, { useEffect, useState, useContext } from "react";
 import VendorProductCatalog from "../components/VendorDashboard/VendorProductCatalog";
 import AuthContext from "../contexts/AuthContext";
-import axios from "../api";
+import { fetchAllPages } from "../api";
 import { toast } from "react-toastify";
 
 const VendorProducts = () => {
@@ -13,8 +13,8 @@ const VendorProducts = () => {
 
     const fetchProducts = async () => {
       try {
-        const response = await axios.get("/api/products/");
-        const data = response.data;
+        // The whole catalog, every page of it
+        const data = await fetchAllPages("/api/products/", { params: { fields: "full", page_size: 100 } });
 
         // Transform data to match VendorProductCatalog props
         const transformedProducts = data.map((product) => ({
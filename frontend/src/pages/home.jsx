@@ -1,5 +1,5 @@
 import { useState, useEffect, useContext } from "react";
-import axios from "../api";
+import axios, { fetchAllPages } from "../api";
 import FilterSidebar from "../components/FilterSidebar";
 import ProductCard from "../components/ProductCard";
 import SortAndResults from "../components/SortAndResults";
@@ -32,13 +32,14 @@ const Home = () => {
     const fetchData = async () => {
       try {
         setLoading(true);
-        const [productsRes, categoriesRes, reviewStarsRes, sortOptionsRes] = await Promise.all([
-          axios.get("/api/products/"),
+        // Filtering, sorting and paging happen here, so every product is fetched
+        const [products, categoriesRes, reviewStarsRes, sortOptionsRes] = await Promise.all([
+          fetchAllPages("/api/products/", { params: { fields: "full", page_size: 100 } }),
           axios.get("/api/categories/"),
           axios.get("/api/review-stars/"),
           axios.get("/api/sort-options/"),
         ]);
-        setProductsData(productsRes.data);
+        setProductsData(products);
         setCategoriesData(categoriesRes.data);
         setReviewStars(reviewStarsRes.data);
         setSortOptions(sortOptionsRes.data);